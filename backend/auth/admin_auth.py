@@ -0,0 +1,73 @@
+import base64
+import hashlib
+import hmac
+import os
+import time
+
+import response
+
+# Токен администратора без хранения на сервере: base64url("<логин>:<истекает, unix>")
+# и HMAC-SHA256 от этой строки на секрете ADMIN_TOKEN_SECRET через точку. auth выдаёт
+# токены, diagnostics и mechanics проверяют их в памяти — без базы и сети.
+
+# Время жизни токена, секунды
+TOKEN_TTL = int(os.environ.get('ADMIN_TOKEN_TTL', str(12 * 3600)))
+HEADER = 'X-Auth-Token'
+UNAUTHORIZED = response.error(401, 'Требуется вход администратора')
+
+
+def _secret() -> bytes:
+    return os.environ.get('ADMIN_TOKEN_SECRET', '').encode()
+
+
+def _sign(payload: str, secret: bytes) -> str:
+    digest = hmac.new(secret, payload.encode(), hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest).rstrip(b'=').decode()
+
+
+def issue(subject: str) -> tuple:
+    '''Новый токен и время его истечения (unix)'''
+    secret = _secret()
+    if not secret:
+        raise RuntimeError('ADMIN_TOKEN_SECRET не задан')
+    expires_at = int(time.time()) + TOKEN_TTL
+    payload = base64.urlsafe_b64encode(f'{subject}:{expires_at}'.encode()).rstrip(b'=').decode()
+    return f'{payload}.{_sign(payload, secret)}', expires_at
+
+
+def verify(token: str):
+    '''Логин из действующего токена или None; без секрета не принимается ни один токен'''
+    secret = _secret()
+    if not secret or not token or token.count('.') != 1:
+        return None
+    payload, signature = token.split('.')
+    # Подпись сравнивается за постоянное время и до разбора содержимого; байты, а не
+    # str: compare_digest не принимает строки с не-ASCII символами из заголовка
+    try:
+        if not hmac.compare_digest(signature.encode(), _sign(payload, secret).encode()):
+            return None
+        subject, expires_at = base64.urlsafe_b64decode(payload + '=' * (-len(payload) % 4)).decode().rsplit(':', 1)
+        expires_at = int(expires_at)
+    except (ValueError, UnicodeError):
+        return None
+    if expires_at < time.time():
+        return None
+    return subject
+
+
+def request_token(event: dict):
+    '''Токен из X-Auth-Token или Authorization: Bearer, без учёта регистра имени заголовка'''
+    headers = {key.lower(): value for key, value in (event.get('headers') or {}).items()}
+    token = headers.get(HEADER.lower())
+    if not token:
+        authorization = headers.get('authorization') or ''
+        if authorization[:7].lower() == 'bearer ':
+            token = authorization[7:].strip()
+    return token
+
+
+def require(event: dict):
+    '''None, если запрос от администратора, иначе готовый ответ 401'''
+    if verify(request_token(event)):
+        return None
+    return UNAUTHORIZED
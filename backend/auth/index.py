@@ -1,23 +1,23 @@
+import hmac
 import json
 import os
-import secrets
-import hashlib
+import admin_auth
+import logger
+import response
 
+PREFLIGHT = response.preflight('POST, OPTIONS')
+INVALID_CREDENTIALS = response.prebuilt(401, {'success': False, 'message': 'Неверный логин или пароль'})
+NOT_CONFIGURED = response.prebuilt(500, {'success': False, 'message': 'Учётные данные не настроены'})
+
+
+@logger.logged('auth')
 def handler(event: dict, context) -> dict:
     '''Авторизация администратора для доступа к админ-панели'''
     
     method = event.get('httpMethod', 'GET')
     
     if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'POST, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type'
-            },
-            'body': ''
-        }
+        return PREFLIGHT
     
     if method == 'POST':
         try:
@@ -29,66 +29,29 @@ def handler(event: dict, context) -> dict:
             admin_username = os.environ.get('ADMIN_USERNAME')
             admin_password = os.environ.get('ADMIN_PASSWORD')
             
-            if not admin_username or not admin_password:
-                return {
-                    'statusCode': 500,
-                    'headers': {
-                        'Content-Type': 'application/json',
-                        'Access-Control-Allow-Origin': '*'
-                    },
-                    'body': json.dumps({
-                        'success': False,
-                        'message': 'Учётные данные не настроены'
-                    })
-                }
+            if not admin_username or not admin_password or not os.environ.get('ADMIN_TOKEN_SECRET'):
+                return NOT_CONFIGURED
             
-            # Проверка логина и пароля
-            if username == admin_username and password == admin_password:
-                # Генерируем токен
-                token = secrets.token_urlsafe(32)
+            # Проверка логина и пароля за постоянное время
+            username_ok = hmac.compare_digest(username.encode(), admin_username.encode())
+            password_ok = hmac.compare_digest(password.encode(), admin_password.encode())
+            if username_ok and password_ok:
+                # Подписанный токен с истечением; сервер его не хранит
+                token, expires_at = admin_auth.issue(username)
                 
-                return {
-                    'statusCode': 200,
-                    'headers': {
-                        'Content-Type': 'application/json',
-                        'Access-Control-Allow-Origin': '*'
-                    },
-                    'body': json.dumps({
-                        'success': True,
-                        'token': token
-                    })
-                }
+                return response.json_response(200, {
+                    'success': True,
+                    'token': token,
+                    'expiresAt': expires_at
+                })
             else:
-                return {
-                    'statusCode': 401,
-                    'headers': {
-                        'Content-Type': 'application/json',
-                        'Access-Control-Allow-Origin': '*'
-                    },
-                    'body': json.dumps({
-                        'success': False,
-                        'message': 'Неверный логин или пароль'
-                    })
-                }
+                return INVALID_CREDENTIALS
                 
         except Exception as e:
-            return {
-                'statusCode': 400,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({
-                    'success': False,
-                    'message': f'Ошибка: {str(e)}'
-                })
-            }
+            logger.annotate(error=str(e))
+            return response.json_response(400, {
+                'success': False,
+                'message': f'Ошибка: {str(e)}'
+            })
     
-    return {
-        'statusCode': 405,
-        'headers': {
-            'Content-Type': 'application/json',
-            'Access-Control-Allow-Origin': '*'
-        },
-        'body': json.dumps({'error': 'Method not allowed'})
-    }
+    return response.error(405, 'Method not allowed')
@@ -0,0 +1,140 @@
+import csv
+import io
+import json
+import os
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+# Поля записи в формате API; в CSV допускаются и имена колонок таблицы
+FIELD_ALIASES = {
+    'mechanic': 'mechanic',
+    'carNumber': 'carNumber',
+    'car_number': 'carNumber',
+    'mileage': 'mileage',
+    'diagnosticType': 'diagnosticType',
+    'diagnostic_type': 'diagnosticType',
+    'createdAt': 'createdAt',
+    'created_at': 'createdAt'
+}
+# Ограничения длины колонок из V0001
+MAX_LENGTHS = {'mechanic': 100, 'carNumber': 20, 'diagnosticType': 20}
+# Сколько отклонённых строк перечислять в ответе; общее число возвращается всегда
+MAX_REPORTED_REJECTS = int(os.environ.get('IMPORT_MAX_REPORTED_REJECTS', '1000'))
+
+
+def detect_format(body: str) -> str:
+    return 'json' if body.lstrip()[:1] == '[' else 'csv'
+
+
+def iter_records(body: str, fmt: str):
+    '''Пары (номер строки, запись): для JSON — позиция в массиве, для CSV — строка файла'''
+    if fmt == 'json':
+        records = json.loads(body)
+        if not isinstance(records, list):
+            raise ValueError('Ожидается JSON-массив записей')
+        for index, record in enumerate(records, start=1):
+            yield index, record
+    elif fmt == 'csv':
+        reader = csv.DictReader(io.StringIO(body))
+        if not reader.fieldnames or 'mechanic' not in reader.fieldnames:
+            raise ValueError('В CSV нет строки заголовка с колонками mechanic, carNumber, mileage, diagnosticType')
+        for record in reader:
+            yield reader.line_num, record
+    else:
+        raise ValueError(f'Неизвестный формат импорта: {fmt}')
+
+
+def validate(record) -> tuple:
+    '''Проверяет запись и возвращает (mechanic, car_number, mileage, diagnostic_type, created_at)'''
+    if not isinstance(record, dict):
+        raise ValueError('запись должна быть объектом')
+    values = {}
+    for key, value in record.items():
+        field = FIELD_ALIASES.get(key)
+        if field:
+            values[field] = value.strip() if isinstance(value, str) else value
+
+    for field in ('mechanic', 'carNumber', 'mileage', 'diagnosticType'):
+        if values.get(field) in (None, ''):
+            raise ValueError(f'не заполнено поле {field}')
+    for field, max_length in MAX_LENGTHS.items():
+        if not isinstance(values[field], str):
+            raise ValueError(f'поле {field} должно быть строкой')
+        if len(values[field]) > max_length:
+            raise ValueError(f'поле {field} длиннее {max_length} символов')
+
+    mileage = values['mileage']
+    if isinstance(mileage, bool) or not isinstance(mileage, (int, str)):
+        raise ValueError('пробег должен быть целым числом')
+    try:
+        mileage = int(mileage)
+    except ValueError:
+        raise ValueError('пробег должен быть целым числом')
+    if not 0 <= mileage < 2 ** 31:
+        raise ValueError('пробег вне допустимого диапазона')
+
+    created_at = values.get('createdAt') or None
+    if created_at is not None:
+        try:
+            created_at = datetime.fromisoformat(created_at)
+        except (TypeError, ValueError):
+            raise ValueError('дата createdAt должна быть в формате ISO 8601')
+
+    return values['mechanic'], values['carNumber'], mileage, values['diagnosticType'], created_at
+
+
+def session_zone(cur):
+    '''Часовой пояс сессии PostgreSQL — в нём DEFAULT CURRENT_TIMESTAMP пишет created_at;
+    None, если имя пояса не известно zoneinfo'''
+    cur.execute('SHOW TimeZone')
+    try:
+        return ZoneInfo(cur.fetchone()[0])
+    except (KeyError, ValueError):
+        return None
+
+
+def import_records(cur, schema: str, body: str, fmt: str) -> dict:
+    '''Проверяет строки одним проходом и загружает корректные через COPY в текущей транзакции.
+
+    Строки с датой и без неё идут в разные COPY: у вторых created_at берётся
+    из DEFAULT таблицы. Коммит остаётся за вызывающим кодом.
+    '''
+    dated = io.StringIO()
+    undated = io.StringIO()
+    dated_writer = csv.writer(dated)
+    undated_writer = csv.writer(undated)
+    imported = 0
+    rejected = []
+    rejected_count = 0
+    zone = None
+    zone_resolved = False
+
+    for line, record in iter_records(body, fmt):
+        try:
+            mechanic, car_number, mileage, diagnostic_type, created_at = validate(record)
+            # Колонка TIMESTAMP без пояса: PostgreSQL молча отбросил бы смещение,
+            # поэтому дата со смещением переводится в пояс сессии
+            if created_at is not None and created_at.tzinfo is not None:
+                if not zone_resolved:
+                    zone, zone_resolved = session_zone(cur), True
+                if zone is None:
+                    raise ValueError('дата createdAt со смещением не поддерживается, укажите время без пояса')
+                created_at = created_at.astimezone(zone).replace(tzinfo=None)
+        except ValueError as e:
+            rejected_count += 1
+            if len(rejected) < MAX_REPORTED_REJECTS:
+                rejected.append({'line': line, 'error': str(e)})
+            continue
+        if created_at is None:
+            undated_writer.writerow((mechanic, car_number, mileage, diagnostic_type))
+        else:
+            dated_writer.writerow((mechanic, car_number, mileage, diagnostic_type, created_at.isoformat()))
+        imported += 1
+
+    columns = 'mechanic, car_number, mileage, diagnostic_type'
+    for buffer, column_list in ((undated, columns), (dated, f'{columns}, created_at')):
+        if buffer.tell():
+            buffer.seek(0)
+            cur.copy_expert(f"COPY {schema}.diagnostics ({column_list}) FROM STDIN WITH (FORMAT csv)", buffer)
+
+    return {'imported': imported, 'rejectedCount': rejected_count, 'rejected': rejected}
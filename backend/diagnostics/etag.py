@@ -0,0 +1,40 @@
+# Условные GET: ETag строится из счётчика data_versions, который триггеры
+# увеличивают при любом изменении таблицы. Совпавший If-None-Match отвечается 304
+# без чтения строк и сериализации JSON.
+import response
+
+
+def data_version(cur, schema: str, name: str) -> int:
+    cur.execute(f"SELECT version FROM {schema}.data_versions WHERE name = %s", (name,))
+    row = cur.fetchone()
+    return row[0] if row else 0
+
+
+def make_etag(name: str, version: int) -> str:
+    return f'"{name}-v{version}"'
+
+
+def request_header(event: dict, name: str):
+    '''Заголовок запроса без учёта регистра имени'''
+    name = name.lower()
+    for key, value in (event.get('headers') or {}).items():
+        if key.lower() == name:
+            return value
+    return None
+
+
+def is_fresh(event: dict, etag: str) -> bool:
+    '''True, если у клиента уже есть представление с этим ETag'''
+    if_none_match = request_header(event, 'If-None-Match')
+    if not if_none_match:
+        return False
+    candidates = [value.strip() for value in if_none_match.split(',')]
+    return '*' in candidates or etag in candidates or f'W/{etag}' in candidates
+
+
+def not_modified(etag: str) -> dict:
+    return response.empty(304, {
+        'ETag': etag,
+        'Cache-Control': 'no-cache',
+        'Access-Control-Expose-Headers': 'ETag'
+    })
@@ -0,0 +1,101 @@
+import codecs
+import csv
+import io
+import os
+import tempfile
+from datetime import datetime
+
+import storage
+
+# Строк за одно чтение из серверного курсора
+BATCH_SIZE = int(os.environ.get('EXPORT_BATCH_SIZE', '5000'))
+XLSX_MAX_ROWS = 1048576
+HEADER = ('id', 'mechanic', 'carNumber', 'mileage', 'diagnosticType', 'createdAt')
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+}
+
+
+def iter_rows(conn, schema: str, conditions: list, params: list):
+    '''Строки выгрузки из именованного (серверного) курсора пачками по BATCH_SIZE'''
+    where = f"WHERE {' AND '.join(conditions)} " if conditions else ''
+    with conn.cursor(name='diagnostics_export') as cur:
+        cur.itersize = BATCH_SIZE
+        cur.execute(
+            f"SELECT id, mechanic, car_number, mileage, diagnostic_type, created_at "
+            f"FROM {schema}.diagnostics {where}ORDER BY created_at, id",
+            params
+        )
+        while True:
+            rows = cur.fetchmany(BATCH_SIZE)
+            if not rows:
+                break
+            yield from rows
+
+
+def write_csv(rows, writer: storage.MultipartWriter) -> int:
+    # BOM — чтобы Excel открывал кириллицу без выбора кодировки
+    writer.write(codecs.BOM_UTF8)
+    text = io.TextIOWrapper(writer, encoding='utf-8', newline='', write_through=True)
+    csv_writer = csv.writer(text)
+    csv_writer.writerow(HEADER)
+    count = 0
+    for row in rows:
+        csv_writer.writerow((row[0], row[1], row[2], row[3], row[4], row[5].isoformat(sep=' ', timespec='seconds')))
+        count += 1
+    text.detach()
+    return count
+
+
+def write_xlsx(rows, writer: storage.MultipartWriter) -> int:
+    '''xlsxwriter в режиме constant_memory сбрасывает строки листа на диск по мере записи;
+    готовый файл читается в S3 частями'''
+    import xlsxwriter
+
+    with tempfile.NamedTemporaryFile(suffix='.xlsx') as tmp:
+        workbook = xlsxwriter.Workbook(tmp.name, {'constant_memory': True, 'tmpdir': tempfile.gettempdir()})
+        date_format = workbook.add_format({'num_format': 'dd.mm.yyyy hh:mm'})
+        count = 0
+        sheet_row = XLSX_MAX_ROWS
+        for row in rows:
+            # Лист XLSX ограничен 1 048 576 строками — дальше продолжаем на следующем
+            if sheet_row == XLSX_MAX_ROWS:
+                sheet = workbook.add_worksheet(f'Диагностики {len(workbook.worksheets()) + 1}')
+                sheet.write_row(0, 0, HEADER)
+                sheet_row = 1
+            sheet.write_row(sheet_row, 0, row[:5])
+            sheet.write_datetime(sheet_row, 5, row[5], date_format)
+            sheet_row += 1
+            count += 1
+        if sheet_row == XLSX_MAX_ROWS and count == 0:
+            workbook.add_worksheet('Диагностики 1').write_row(0, 0, HEADER)
+        workbook.close()
+
+        with open(tmp.name, 'rb') as f:
+            while True:
+                chunk = f.read(storage.PART_SIZE)
+                if not chunk:
+                    break
+                writer.write(chunk)
+    return count
+
+
+def export(conn, schema: str, conditions: list, params: list, fmt: str) -> dict:
+    '''Выгружает диагностики в CSV или XLSX в S3 и возвращает ссылку и число строк'''
+    if fmt not in CONTENT_TYPES:
+        raise ValueError(f'Неизвестный формат выгрузки: {fmt}')
+    key = f"exports/diagnostics_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{fmt}"
+    writer = storage.MultipartWriter(key, CONTENT_TYPES[fmt])
+    try:
+        rows = iter_rows(conn, schema, conditions, params)
+        count = write_csv(rows, writer) if fmt == 'csv' else write_xlsx(rows, writer)
+        writer.complete()
+    except Exception:
+        writer.abort()
+        raise
+    return {
+        'url': storage.cdn_url(key),
+        'rows': count,
+        'format': fmt
+    }
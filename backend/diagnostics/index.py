@@ -1,33 +1,101 @@
+import base64
 import json
 import os
-import psycopg2
+import admin_auth
+import bulk_import
+import db
+import etag
+import export
+import filters
+import logger
+import response
+import stats
+import storage
 from datetime import datetime
 
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = int(os.environ.get('DIAGNOSTICS_MAX_PAGE_SIZE', '100'))
+
+PREFLIGHT = response.preflight('GET, POST, DELETE, OPTIONS', 'Content-Type, If-None-Match, X-Auth-Token, Authorization')
+
+
+def encode_cursor(created_at: datetime, diagnostic_id: int) -> str:
+    '''Непрозрачный курсор страницы: позиция последней строки в порядке (created_at, id)'''
+    raw = json.dumps([created_at.isoformat(), diagnostic_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str):
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        created_at, diagnostic_id = json.loads(raw)
+        return datetime.fromisoformat(created_at), int(diagnostic_id)
+    except (TypeError, ValueError, UnicodeDecodeError) as e:
+        raise ValueError('invalid cursor') from e
+
+
+def parse_ids(query_params: dict, body: str) -> list:
+    '''Список id для удаления: ?id=, ?ids=1,2,3 или тело {"ids": [...]}'''
+    ids = []
+    for key in ('id', 'ids'):
+        if query_params.get(key):
+            ids += query_params[key].split(',')
+    if body:
+        ids += json.loads(body).get('ids') or []
+    return [int(value) for value in ids]
+
+
+@logger.logged('diagnostics')
 def handler(event: dict, context) -> dict:
     '''API для сохранения и получения диагностик автомобилей'''
     
     method = event.get('httpMethod', 'GET')
     
     if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, POST, DELETE, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type'
-            },
-            'body': '',
-            'isBase64Encoded': False
-        }
+        return PREFLIGHT
     
-    db_url = os.environ.get('DATABASE_URL')
     schema = os.environ.get('MAIN_DB_SCHEMA')
+    query_params = event.get('queryStringParameters', {}) or {}
+    
+    # Импорт, пересчёт статистики и удаление — только для администратора;
+    # создание диагностики остаётся открытым для чата механиков
+    if method == 'DELETE' or (method == 'POST' and query_params.get('action') in ('import', 'rebuild-stats')):
+        denied = admin_auth.require(event)
+        if denied:
+            return denied
     
     try:
-        conn = psycopg2.connect(db_url)
+        conn = db.acquire()
         cur = conn.cursor()
         
-        if method == 'POST':
+        if method == 'POST' and query_params.get('action') == 'import':
+            raw_body = event.get('body') or ''
+            try:
+                if event.get('isBase64Encoded'):
+                    raw_body = base64.b64decode(raw_body).decode('utf-8')
+                # Excel сохраняет CSV с BOM; в текстовом теле он приходит символом U+FEFF
+                if raw_body.startswith('\ufeff'):
+                    raw_body = raw_body[1:]
+                fmt = query_params.get('format') or bulk_import.detect_format(raw_body)
+                result = bulk_import.import_records(cur, schema, raw_body, fmt)
+            except ValueError as e:
+                conn.rollback()
+                return response.json_response(400, {'error': str(e)})
+            conn.commit()
+            logger.annotate(imported=result['imported'], rejected=result['rejectedCount'])
+            
+            return response.json_response(200, result)
+        
+        elif method == 'POST' and query_params.get('action') == 'rebuild-stats':
+            rows = stats.rebuild(cur, schema)
+            conn.commit()
+            logger.annotate(stats_rows=rows)
+            
+            return response.json_response(200, {'message': 'Статистика пересчитана', 'rows': rows})
+        
+        elif method == 'POST':
             body = json.loads(event.get('body', '{}'))
             mechanic = body.get('mechanic')
             car_number = body.get('carNumber')
@@ -35,86 +103,114 @@ def handler(event: dict, context) -> dict:
             diagnostic_type = body.get('diagnosticType')
             
             if not all([mechanic, car_number, mileage, diagnostic_type]):
-                return {
-                    'statusCode': 400,
-                    'headers': {
-                        'Content-Type': 'application/json',
-                        'Access-Control-Allow-Origin': '*'
-                    },
-                    'body': json.dumps({'error': 'Все поля обязательны для заполнения'}),
-                    'isBase64Encoded': False
-                }
+                return response.error(400, 'Все поля обязательны для заполнения')
             
-            cur.execute(
+            try:
+                mileage = int(mileage)
+            except (TypeError, ValueError):
+                return response.error(400, 'Пробег должен быть числом')
+            
+            db.execute_prepared(
+                cur,
                 f"INSERT INTO {schema}.diagnostics (mechanic, car_number, mileage, diagnostic_type) "
-                f"VALUES ('{mechanic}', '{car_number}', {mileage}, '{diagnostic_type}') RETURNING id, created_at"
+                f"VALUES (%s, %s, %s, %s) RETURNING id, created_at",
+                (mechanic, car_number, mileage, diagnostic_type)
             )
             result = cur.fetchone()
             conn.commit()
             
-            return {
-                'statusCode': 201,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({
-                    'id': result[0],
-                    'createdAt': result[1].isoformat(),
-                    'message': 'Диагностика успешно сохранена'
-                }),
-                'isBase64Encoded': False
-            }
+            return response.json_response(201, {
+                'id': result[0],
+                'createdAt': result[1],
+                'message': 'Диагностика успешно сохранена'
+            })
         
         elif method == 'DELETE':
-            query_params = event.get('queryStringParameters', {}) or {}
-            diagnostic_id = query_params.get('id')
+            try:
+                ids = parse_ids(query_params, event.get('body'))
+                conditions, params = filters.build_filters(query_params)
+            except (ValueError, TypeError, AttributeError):
+                conditions = None
             
-            if not diagnostic_id:
-                return {
-                    'statusCode': 400,
-                    'headers': {
-                        'Content-Type': 'application/json',
-                        'Access-Control-Allow-Origin': '*'
-                    },
-                    'body': json.dumps({'error': 'ID диагностики обязателен'}),
-                    'isBase64Encoded': False
-                }
+            if conditions is not None and ids:
+                conditions.append("id = ANY(%s)")
+                params.append(ids)
             
-            cur.execute(f"DELETE FROM {schema}.diagnostics WHERE id = {diagnostic_id}")
+            if not conditions:
+                return response.error(400, 'Укажите id диагностик или фильтр для удаления')
+            
+            # Одним запросом и одной транзакцией, сколько бы строк ни попало под условие;
+            # заодно забираем ключи закэшированных PDF-отчётов удалённых диагностик
+            cur.execute(
+                f"WITH deleted AS ("
+                f"DELETE FROM {schema}.diagnostics WHERE {' AND '.join(conditions)} RETURNING id"
+                f"), reports AS ("
+                f"DELETE FROM {schema}.report_files r USING deleted d WHERE r.diagnostic_id = d.id RETURNING r.s3_key"
+                f") SELECT (SELECT COUNT(*) FROM deleted), ARRAY(SELECT s3_key FROM reports)",
+                params
+            )
+            deleted, report_keys = cur.fetchone()
             conn.commit()
+            logger.annotate(deleted=deleted, reports_deleted=len(report_keys))
+            
+            if report_keys:
+                try:
+                    storage.delete_objects(report_keys)
+                except Exception as e:
+                    logger.warning('report_cleanup_failed', keys=len(report_keys), error=str(e))
+            
+            return response.json_response(200, {'message': 'Диагностика удалена' if deleted == 1 else f'Удалено диагностик: {deleted}', 'deleted': deleted})
+        
+        elif method == 'GET' and query_params.get('action') == 'stats':
+            stats_etag = etag.make_etag('diagnostics-stats', etag.data_version(cur, schema, 'diagnostics'))
+            if etag.is_fresh(event, stats_etag):
+                return etag.not_modified(stats_etag)
+            
+            try:
+                result = stats.query_stats(cur, schema, query_params)
+            except ValueError as e:
+                return response.json_response(400, {'error': str(e)})
             
-            return {
-                'statusCode': 200,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({'message': 'Диагностика удалена'}),
-                'isBase64Encoded': False
-            }
+            return response.json_response(200, result, {
+                'ETag': stats_etag,
+                'Cache-Control': 'no-cache',
+                'Access-Control-Expose-Headers': 'ETag'
+            })
+        
+        elif method == 'GET' and query_params.get('action') == 'export':
+            try:
+                conditions, params = filters.build_filters(query_params)
+                result = export.export(conn, schema, conditions, params, query_params.get('format', 'csv'))
+            except ValueError as e:
+                return response.json_response(400, {'error': str(e)})
+            logger.annotate(exported=result['rows'], format=result['format'])
+            
+            return response.json_response(200, result)
         
         elif method == 'GET':
-            query_params = event.get('queryStringParameters', {}) or {}
+            # Версия читается до строк: при гонке с записью ETag окажется старше данных,
+            # и следующий запрос просто получит их заново
+            list_etag = etag.make_etag('diagnostics', etag.data_version(cur, schema, 'diagnostics'))
+            if etag.is_fresh(event, list_etag):
+                return etag.not_modified(list_etag)
+            
             diagnostic_id = query_params.get('id')
             
             if diagnostic_id:
-                cur.execute(
+                try:
+                    diagnostic_id = int(diagnostic_id)
+                except ValueError:
+                    return response.error(400, 'Некорректный id')
+                db.execute_prepared(
+                    cur,
                     f"SELECT id, mechanic, car_number, mileage, diagnostic_type, created_at "
-                    f"FROM {schema}.diagnostics WHERE id = {diagnostic_id}"
+                    f"FROM {schema}.diagnostics WHERE id = %s",
+                    (diagnostic_id,)
                 )
                 row = cur.fetchone()
                 
                 if not row:
-                    return {
-                        'statusCode': 404,
-                        'headers': {
-                            'Content-Type': 'application/json',
-                            'Access-Control-Allow-Origin': '*'
-                        },
-                        'body': json.dumps({'error': 'Диагностика не найдена'}),
-                        'isBase64Encoded': False
-                    }
+                    return response.error(404, 'Диагностика не найдена')
                 
                 diagnostic = {
                     'id': row[0],
@@ -122,60 +218,78 @@ def handler(event: dict, context) -> dict:
                     'carNumber': row[2],
                     'mileage': row[3],
                     'diagnosticType': row[4],
-                    'createdAt': row[5].isoformat()
+                    'createdAt': row[5]
                 }
             else:
-                limit = query_params.get('limit', '50')
-                cur.execute(
+                try:
+                    limit = min(max(int(query_params.get('limit', DEFAULT_PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+                    cursor = decode_cursor(query_params.get('cursor'))
+                    conditions, params = filters.build_filters(query_params)
+                except ValueError:
+                    return response.error(400, 'Некорректные параметры фильтра, limit или cursor')
+                
+                # Keyset-пагинация по (created_at, id): страница читается из idx_created_at
+                # (или составного индекса фильтра) с позиции курсора, без OFFSET,
+                # поэтому стоит одинаково на любой глубине
+                if cursor:
+                    conditions.append("created_at <= %s AND (created_at < %s OR id < %s)")
+                    params += [cursor[0], cursor[0], cursor[1]]
+                where = f"WHERE {' AND '.join(conditions)} " if conditions else ''
+                # Текст запроса зависит только от набора фильтров, курсора и limit, поэтому
+                # вариантов немного и каждый готовится на соединении один раз. limit уже
+                # проверен и вписан числом: с LIMIT $n PostgreSQL не доверяет общему плану
+                # и планирует каждый EXECUTE заново
+                db.execute_prepared(
+                    cur,
                     f"SELECT id, mechanic, car_number, mileage, diagnostic_type, created_at "
-                    f"FROM {schema}.diagnostics ORDER BY created_at DESC LIMIT {limit}"
+                    f"FROM {schema}.diagnostics {where}"
+                    f"ORDER BY created_at DESC, id DESC LIMIT {limit + 1}",
+                    params
                 )
                 rows = cur.fetchall()
                 
-                diagnostic = [
-                    {
-                        'id': row[0],
-                        'mechanic': row[1],
-                        'carNumber': row[2],
-                        'mileage': row[3],
-                        'diagnosticType': row[4],
-                        'createdAt': row[5].isoformat()
-                    }
-                    for row in rows
-                ]
-            
-            return {
-                'statusCode': 200,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps(diagnostic),
-                'isBase64Encoded': False
-            }
+                # Общее число строк — только для первой страницы и из дневной сводки:
+                # COUNT(*) OVER () дочитал бы до конца все строки под фильтром
+                total = None
+                if not cursor:
+                    total = stats.count_total(cur, schema, query_params)
+                
+                next_cursor = None
+                if len(rows) > limit:
+                    rows = rows[:limit]
+                    next_cursor = encode_cursor(rows[-1][5], rows[-1][0])
+                
+                # Строки уходят в кодировщик как есть: created_at сериализует он сам,
+                # без isoformat() на каждую строку
+                diagnostic = {
+                    'total': total,
+                    'items': [
+                        {
+                            'id': row[0],
+                            'mechanic': row[1],
+                            'carNumber': row[2],
+                            'mileage': row[3],
+                            'diagnosticType': row[4],
+                            'createdAt': row[5]
+                        }
+                        for row in rows
+                    ],
+                    'nextCursor': next_cursor
+                }
+            
+            return response.json_response(200, diagnostic, {
+                'ETag': list_etag,
+                'Cache-Control': 'no-cache',
+                'Access-Control-Expose-Headers': 'ETag'
+            })
         
-        return {
-            'statusCode': 405,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({'error': 'Метод не поддерживается'}),
-            'isBase64Encoded': False
-        }
+        return response.error(405, 'Метод не поддерживается')
         
     except Exception as e:
-        return {
-            'statusCode': 500,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({'error': str(e)}),
-            'isBase64Encoded': False
-        }
+        logger.annotate(error=str(e))
+        return response.json_response(500, {'error': str(e)})
     finally:
         if 'cur' in locals():
             cur.close()
         if 'conn' in locals():
-            conn.close()
\ No newline at end of file
+            db.release(conn)
\ No newline at end of file
@@ -0,0 +1,102 @@
+from datetime import datetime
+
+import filters
+
+# Измерения группировки: параметр groupBy -> (выражение над сводкой, ключ в ответе)
+DIMENSIONS = {
+    'mechanic': ('mechanic', 'mechanic'),
+    'type': ('diagnostic_type', 'diagnosticType'),
+    'day': ('day', 'period'),
+    'week': ("date_trunc('week', day)::date", 'period'),
+    'month': ("date_trunc('month', day)::date", 'period')
+}
+
+
+def parse_group_by(value: str) -> list:
+    group_by = [name.strip() for name in (value or 'day').split(',') if name.strip()]
+    unknown = [name for name in group_by if name not in DIMENSIONS]
+    if unknown:
+        raise ValueError(f'Неизвестная группировка: {", ".join(unknown)}')
+    if len({DIMENSIONS[name][1] for name in group_by}) != len(group_by):
+        raise ValueError('Можно выбрать только один период: day, week или month')
+    return group_by
+
+
+def query_stats(cur, schema: str, query_params: dict) -> dict:
+    '''Агрегаты только из diagnostics_daily_stats: стоимость зависит от числа дней
+    и механиков в периоде, а не от числа диагностик'''
+    group_by = parse_group_by(query_params.get('groupBy'))
+    conditions = []
+    params = []
+    if query_params.get('mechanic'):
+        conditions.append("mechanic = %s")
+        params.append(query_params['mechanic'])
+    if query_params.get('diagnosticType'):
+        conditions.append("diagnostic_type = %s")
+        params.append(query_params['diagnosticType'])
+    if query_params.get('dateFrom'):
+        conditions.append("day >= %s")
+        params.append(datetime.fromisoformat(query_params['dateFrom']).date())
+    if query_params.get('dateTo'):
+        conditions.append("day <= %s")
+        params.append(datetime.fromisoformat(query_params['dateTo']).date())
+
+    expressions = [DIMENSIONS[name][0] for name in group_by]
+    where = f"WHERE {' AND '.join(conditions)} " if conditions else ''
+    cur.execute(
+        f"SELECT {', '.join(expressions + ['SUM(count)'])} "
+        f"FROM {schema}.diagnostics_daily_stats {where}"
+        f"GROUP BY {', '.join(str(i) for i in range(1, len(expressions) + 1))} "
+        f"ORDER BY {', '.join(str(i) for i in range(1, len(expressions) + 1))}",
+        params
+    )
+
+    rows = []
+    total = 0
+    for row in cur.fetchall():
+        item = {}
+        for name, value in zip(group_by, row):
+            item[DIMENSIONS[name][1]] = value.isoformat() if name in ('day', 'week', 'month') else value
+        item['count'] = int(row[-1])
+        total += item['count']
+        rows.append(item)
+    return {'groupBy': group_by, 'rows': rows, 'total': total}
+
+
+def count_total(cur, schema: str, query_params: dict) -> int:
+    '''Число диагностик под фильтром списка из diagnostics_daily_stats, без чтения строк.
+
+    Сводка дневная, поэтому граница периода со временем внутри дня считается
+    точным COUNT по diagnostics — из интерфейса приходят только даты.
+    '''
+    conditions, params = filters.build_filters(query_params)
+    date_from = query_params.get('dateFrom')
+    date_to = query_params.get('dateTo')
+    if (date_from and len(date_from) != 10) or (date_to and len(date_to) != 10):
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        cur.execute(f"SELECT COUNT(*) FROM {schema}.diagnostics {where}", params)
+        return cur.fetchone()[0]
+
+    conditions = []
+    params = []
+    if query_params.get('mechanic'):
+        conditions.append("mechanic = %s")
+        params.append(query_params['mechanic'])
+    if query_params.get('diagnosticType'):
+        conditions.append("diagnostic_type = %s")
+        params.append(query_params['diagnosticType'])
+    if date_from:
+        conditions.append("day >= %s")
+        params.append(datetime.fromisoformat(date_from).date())
+    if date_to:
+        conditions.append("day <= %s")
+        params.append(datetime.fromisoformat(date_to).date())
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    cur.execute(f"SELECT COALESCE(SUM(count), 0) FROM {schema}.diagnostics_daily_stats {where}", params)
+    return int(cur.fetchone()[0])
+
+
+def rebuild(cur, schema: str) -> int:
+    '''Пересчитывает сводку по всей таблице diagnostics; возвращает число строк сводки'''
+    cur.execute(f"SELECT {schema}.rebuild_diagnostics_daily_stats()")
+    return cur.fetchone()[0]
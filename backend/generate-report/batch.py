@@ -0,0 +1,162 @@
+import concurrent.futures
+import json
+import multiprocessing
+import os
+import re
+import sys
+import uuid
+import zipfile
+from datetime import datetime
+
+import db
+import filters
+import logger
+import report_template
+import storage
+
+# Процессов для рендеринга; 1 — рендерить в текущем процессе
+WORKERS = int(os.environ.get('REPORT_BATCH_WORKERS', str(os.cpu_count() or 1)))
+# Верхняя граница отчётов в одном задании, чтобы уложиться во время выполнения функции
+MAX_REPORTS = int(os.environ.get('REPORT_BATCH_MAX_REPORTS', '5000'))
+# Строк на одно чтение из курсора и одну отметку прогресса
+WINDOW = max(WORKERS, 1) * 4
+
+
+class JobExists(Exception):
+    '''Задание с переданным клиентом jobId уже создано; job — его текущий статус'''
+
+    def __init__(self, job: dict):
+        super().__init__(job['jobId'])
+        self.job = job
+
+
+def parse_job_id(value) -> str:
+    '''Клиент может передать свой UUID, чтобы опрашивать статус, не дожидаясь ответа'''
+    if not value:
+        return str(uuid.uuid4())
+    return str(uuid.UUID(str(value)))
+
+
+def selection(body: dict):
+    '''Условия выборки: список ids или фильтры mechanic, diagnosticType, dateFrom, dateTo'''
+    conditions, params = filters.build_filters(body)
+    ids = body.get('ids')
+    if ids:
+        conditions.append("id = ANY(%s)")
+        params.append([int(value) for value in ids])
+    if not conditions:
+        raise ValueError('Укажите ids или фильтр для выборки диагностик')
+    return conditions, params
+
+
+def job_status(cur, schema: str, job_id: str):
+    cur.execute(
+        f"SELECT id, status, total, done, result_key, error, created_at, updated_at "
+        f"FROM {schema}.report_jobs WHERE id = %s",
+        (job_id,)
+    )
+    row = cur.fetchone()
+    if not row:
+        return None
+    return {
+        'jobId': str(row[0]),
+        'status': row[1],
+        'total': row[2],
+        'done': row[3],
+        'url': storage.cdn_url(row[4]) if row[4] and row[1] == 'done' else None,
+        'error': row[5],
+        'createdAt': row[6].isoformat(),
+        'updatedAt': row[7].isoformat()
+    }
+
+
+def update_job(schema: str, job_id: str, **fields):
+    '''Прогресс пишется отдельным соединением, чтобы не закрывать серверный курсор выборки'''
+    assignments = ', '.join(f"{name} = %s" for name in fields)
+    with db.connection() as conn, conn.cursor() as cur:
+        cur.execute(
+            f"UPDATE {schema}.report_jobs SET {assignments}, updated_at = CURRENT_TIMESTAMP WHERE id = %s",
+            list(fields.values()) + [job_id]
+        )
+        conn.commit()
+
+
+def make_executor():
+    '''Пул процессов для рендеринга или None, если среда не даёт их создать'''
+    if WORKERS <= 1:
+        return None
+    # reportlab и шрифты загружаются до fork, чтобы процессы пула получили их готовыми
+    report_template.load()
+    # Задача передаётся в процесс по имени модуля; при изолированной загрузке функции
+    # (tools/functions.py) локальный модуль может отсутствовать в sys.modules
+    sys.modules.setdefault(report_template.__name__, report_template)
+    try:
+        start_methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context('fork' if 'fork' in start_methods else None)
+        return concurrent.futures.ProcessPoolExecutor(max_workers=WORKERS, mp_context=context)
+    except (OSError, NotImplementedError, ImportError) as e:
+        logger.warning('report_pool_unavailable', error=str(e))
+        return None
+
+
+def run(conn, schema: str, job_id: str, body: dict) -> dict:
+    '''Рендерит отчёты выборки и складывает их в ZIP, который по частям уходит в S3'''
+    conditions, params = selection(body)
+    where = ' AND '.join(conditions)
+
+    with conn.cursor() as cur:
+        cur.execute(f"SELECT COUNT(*) FROM {schema}.diagnostics WHERE {where}", params)
+        total = cur.fetchone()[0]
+        if total > MAX_REPORTS:
+            raise ValueError(f'Слишком много отчётов в одном задании: {total}, максимум {MAX_REPORTS}')
+        cur.execute(
+            f"INSERT INTO {schema}.report_jobs (id, total, params) VALUES (%s, %s, %s) "
+            f"ON CONFLICT (id) DO NOTHING",
+            (job_id, total, json.dumps(body, ensure_ascii=False))
+        )
+        # Повтор запроса с тем же jobId не запускает задание второй раз
+        if cur.rowcount == 0:
+            job = job_status(cur, schema, job_id)
+            conn.rollback()
+            raise JobExists(job)
+        conn.commit()
+
+    key = f"reports/batch_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{job_id[:8]}.zip"
+    writer = storage.MultipartWriter(key, 'application/zip')
+    executor = make_executor()
+    done = 0
+    try:
+        # PDF уже сжаты, поэтому архив без повторного сжатия
+        with zipfile.ZipFile(writer, 'w', compression=zipfile.ZIP_STORED) as archive, \
+                conn.cursor(name='report_batch') as cur:
+            cur.execute(
+                f"SELECT id, mechanic, car_number, mileage, diagnostic_type, created_at "
+                f"FROM {schema}.diagnostics WHERE {where} ORDER BY created_at, id",
+                params
+            )
+            while True:
+                rows = cur.fetchmany(WINDOW)
+                if not rows:
+                    break
+                if executor:
+                    pdfs = executor.map(report_template.render_pdf, rows, chunksize=max(len(rows) // WORKERS, 1))
+                else:
+                    pdfs = map(report_template.render_pdf, rows)
+                for row, pdf in zip(rows, pdfs):
+                    car_number = re.sub(r'[^\w-]', '_', row[2])
+                    archive.writestr(f"diagnostic_{row[0]}_{car_number}.pdf", pdf)
+                done += len(rows)
+                update_job(schema, job_id, done=done)
+        writer.complete()
+    except Exception as e:
+        writer.abort()
+        update_job(schema, job_id, status='failed', error=str(e))
+        raise
+    finally:
+        if executor:
+            executor.shutdown()
+
+    update_job(schema, job_id, status='done', done=done, result_key=key)
+    logger.annotate(job_id=job_id, reports=done)
+    with conn.cursor() as cur:
+        return job_status(cur, schema, job_id)
@@ -0,0 +1,29 @@
+from datetime import datetime, timedelta
+
+
+def parse_date_bound(value: str, upper: bool) -> datetime:
+    '''Граница периода: дата без времени в верхней границе включает весь день'''
+    bound = datetime.fromisoformat(value)
+    if upper and len(value) == 10:
+        bound += timedelta(days=1)
+    return bound
+
+
+def build_filters(query_params: dict):
+    '''Условия WHERE и параметры для фильтров mechanic, diagnosticType, dateFrom, dateTo'''
+    conditions = []
+    params = []
+    if query_params.get('mechanic'):
+        conditions.append("mechanic = %s")
+        params.append(query_params['mechanic'])
+    if query_params.get('diagnosticType'):
+        conditions.append("diagnostic_type = %s")
+        params.append(query_params['diagnosticType'])
+    if query_params.get('dateFrom'):
+        conditions.append("created_at >= %s")
+        params.append(parse_date_bound(query_params['dateFrom'], upper=False))
+    if query_params.get('dateTo'):
+        date_to = query_params['dateTo']
+        conditions.append("created_at < %s" if len(date_to) == 10 else "created_at <= %s")
+        params.append(parse_date_bound(date_to, upper=True))
+    return conditions, params
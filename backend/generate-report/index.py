@@ -1,204 +1,196 @@
+import base64
+import hashlib
 import json
 import os
-import psycopg2
-from datetime import datetime
-from reportlab.lib.pagesizes import A4
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import mm
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
-from reportlab.lib import colors
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
-from reportlab.lib.enums import TA_CENTER, TA_LEFT
-import boto3
-from io import BytesIO
+import threading
+from collections import OrderedDict
+import batch
+import db
+import logger
+import report_template
+import response
+import storage
 
+PREFLIGHT = response.preflight('GET, POST, OPTIONS')
+
+# Способы выдачи: url — ссылка на файл в бакете, inline — сам PDF в теле ответа
+DELIVERY_MODES = ('url', 'inline')
+
+# Ключи отчётов, про которые известно, что они уже лежат в бакете
+KNOWN_KEYS_SIZE = int(os.environ.get('REPORT_CACHE_INDEX_SIZE', '1024'))
+
+_known_keys = OrderedDict()
+_known_keys_lock = threading.Lock()
+
+
+def report_key(row) -> str:
+    '''Ключ объекта по содержимому диагностики: тот же отчёт — тот же ключ'''
+    content = json.dumps([report_template.TEMPLATE_VERSION, row[0], row[1], row[2], row[3], row[4], row[5].isoformat()], ensure_ascii=False)
+    return f"reports/diagnostic_{row[0]}_{hashlib.sha256(content.encode()).hexdigest()[:32]}.pdf"
+
+
+def remember_key(key: str):
+    with _known_keys_lock:
+        _known_keys[key] = True
+        _known_keys.move_to_end(key)
+        while len(_known_keys) > KNOWN_KEYS_SIZE:
+            _known_keys.popitem(last=False)
+
+
+def is_stored(key: str) -> bool:
+    '''Сначала индекс в памяти, затем HEAD в бакет'''
+    with _known_keys_lock:
+        if key in _known_keys:
+            _known_keys.move_to_end(key)
+            return True
+    if not storage.exists(key):
+        return False
+    remember_key(key)
+    return True
+
+
+def handle_batch(event: dict, method: str, query_params: dict) -> dict:
+    '''POST ?action=batch — ZIP с отчётами по выборке; GET ?job=<id> — статус задания'''
+    schema = os.environ.get('MAIN_DB_SCHEMA')
+    
+    try:
+        conn = db.acquire()
+        
+        if method == 'GET':
+            try:
+                job_id = batch.parse_job_id(query_params['job'])
+            except ValueError:
+                job_id = None
+            with conn.cursor() as cur:
+                job = batch.job_status(cur, schema, job_id) if job_id else None
+            
+            if not job:
+                return response.error(404, 'Задание не найдено')
+            
+            return response.json_response(200, job)
+        
+        try:
+            body = json.loads(event.get('body') or '{}')
+            job_id = batch.parse_job_id(body.pop('jobId', None))
+            job = batch.run(conn, schema, job_id, body)
+        except batch.JobExists as e:
+            return response.json_response(409, {'error': 'Задание с таким jobId уже существует', 'job': e.job})
+        except (ValueError, TypeError, AttributeError) as e:
+            conn.rollback()
+            return response.json_response(400, {'error': str(e)})
+        
+        return response.json_response(200, job)
+    
+    except Exception as e:
+        logger.annotate(error=str(e))
+        return response.json_response(500, {'error': str(e)})
+    finally:
+        if 'conn' in locals():
+            db.release(conn)
+
+
+@logger.logged('generate-report')
 def handler(event: dict, context) -> dict:
     '''API для генерации PDF отчёта по диагностике автомобиля'''
     
     method = event.get('httpMethod', 'GET')
     
     if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type'
-            },
-            'body': '',
-            'isBase64Encoded': False
-        }
+        return PREFLIGHT
+    
+    query_params = event.get('queryStringParameters', {}) or {}
+    
+    if (method == 'POST' and query_params.get('action') == 'batch') or (method == 'GET' and query_params.get('job')):
+        return handle_batch(event, method, query_params)
     
     if method != 'GET':
-        return {
-            'statusCode': 405,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({'error': 'Метод не поддерживается'}),
-            'isBase64Encoded': False
-        }
+        return response.error(405, 'Метод не поддерживается')
     
-    query_params = event.get('queryStringParameters', {}) or {}
     diagnostic_id = query_params.get('id')
     
-    if not diagnostic_id:
-        return {
-            'statusCode': 400,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({'error': 'ID диагностики обязателен'}),
-            'isBase64Encoded': False
-        }
+    if not diagnostic_id or not diagnostic_id.isdigit():
+        return response.error(400, 'ID диагностики обязателен')
+    
+    delivery = query_params.get('delivery', 'url')
+    if delivery not in DELIVERY_MODES:
+        return response.error(400, f"delivery должен быть одним из: {', '.join(DELIVERY_MODES)}")
+    # inline-отчёт для просмотра в бакет не кладётся, если не попросили сохранить
+    persist = delivery == 'url' or query_params.get('persist') in ('1', 'true')
+    logger.annotate(delivery=delivery, persist=persist)
     
-    db_url = os.environ.get('DATABASE_URL')
     schema = os.environ.get('MAIN_DB_SCHEMA')
     
     try:
-        conn = psycopg2.connect(db_url)
+        conn = db.acquire()
         cur = conn.cursor()
         
-        cur.execute(
+        db.execute_prepared(
+            cur,
             f"SELECT id, mechanic, car_number, mileage, diagnostic_type, created_at "
-            f"FROM {schema}.diagnostics WHERE id = {diagnostic_id}"
+            f"FROM {schema}.diagnostics WHERE id = %s",
+            (int(diagnostic_id),)
         )
         row = cur.fetchone()
         
         if not row:
+            return response.error(404, 'Диагностика не найдена')
+        
+        file_key = report_key(row)
+        stored = persist and is_stored(file_key)
+        if stored and delivery == 'url':
+            logger.annotate(cached=True)
+            return response.json_response(200, {
+                'pdfUrl': storage.cdn_url(file_key),
+                'cached': True,
+                'message': 'PDF отчёт успешно сгенерирован'
+            })
+        
+        pdf_content = report_template.render_pdf(row)
+        
+        if persist and not stored:
+            storage.get_s3().put_object(
+                Bucket=storage.BUCKET,
+                Key=file_key,
+                Body=pdf_content,
+                ContentType='application/pdf'
+            )
+            # Запись нужна diagnostics, чтобы удалить файл вместе с диагностикой
+            cur.execute(
+                f"INSERT INTO {schema}.report_files (s3_key, diagnostic_id) VALUES (%s, %s) ON CONFLICT (s3_key) DO NOTHING",
+                (file_key, row[0])
+            )
+            conn.commit()
+            remember_key(file_key)
+        logger.annotate(cached=stored)
+        
+        if delivery == 'inline':
+            # Отрисовать заново быстрее, чем скачать из бакета, поэтому PDF всегда свежий
+            headers = {
+                'Content-Type': 'application/pdf',
+                'Content-Disposition': f'inline; filename="diagnostic_{row[0]}.pdf"',
+                'Access-Control-Allow-Origin': '*',
+                'Access-Control-Expose-Headers': 'Content-Disposition, X-Report-Url'
+            }
+            if persist:
+                headers['X-Report-Url'] = storage.cdn_url(file_key)
             return {
-                'statusCode': 404,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({'error': 'Диагностика не найдена'}),
-                'isBase64Encoded': False
+                'statusCode': 200,
+                'headers': headers,
+                'body': base64.b64encode(pdf_content).decode('ascii'),
+                'isBase64Encoded': True
             }
         
-        diagnostic_data = {
-            'id': row[0],
-            'mechanic': row[1],
-            'carNumber': row[2],
-            'mileage': row[3],
-            'diagnosticType': row[4],
-            'createdAt': row[5]
-        }
-        
-        pdf_buffer = BytesIO()
-        doc = SimpleDocTemplate(pdf_buffer, pagesize=A4, topMargin=15*mm, bottomMargin=15*mm)
-        
-        story = []
-        styles = getSampleStyleSheet()
-        
-        title_style = ParagraphStyle(
-            'CustomTitle',
-            parent=styles['Heading1'],
-            fontSize=18,
-            alignment=TA_CENTER,
-            spaceAfter=20
-        )
-        
-        story.append(Paragraph('ОТЧЁТ О ДИАГНОСТИКЕ АВТОМОБИЛЯ', title_style))
-        story.append(Spacer(1, 10*mm))
-        
-        diagnostic_types = {
-            '5min': '5-ти минутка',
-            'dhch': 'ДХЧ',
-            'des': 'ДЭС'
-        }
-        
-        data = [
-            ['№ диагностики:', str(diagnostic_data['id'])],
-            ['Дата:', diagnostic_data['createdAt'].strftime('%d.%m.%Y %H:%M')],
-            ['Механик:', diagnostic_data['mechanic']],
-            ['Госномер:', diagnostic_data['carNumber']],
-            ['Пробег:', f"{diagnostic_data['mileage']:,} км".replace(',', ' ')],
-            ['Тип диагностики:', diagnostic_types.get(diagnostic_data['diagnosticType'], diagnostic_data['diagnosticType'])]
-        ]
-        
-        table = Table(data, colWidths=[60*mm, 100*mm])
-        table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (0, -1), colors.lightgrey),
-            ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
-            ('ALIGN', (0, 0), (0, -1), 'LEFT'),
-            ('ALIGN', (1, 0), (1, -1), 'LEFT'),
-            ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
-            ('FONTSIZE', (0, 0), (-1, -1), 11),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
-            ('TOPPADDING', (0, 0), (-1, -1), 8),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black)
-        ]))
-        
-        story.append(table)
-        story.append(Spacer(1, 15*mm))
-        
-        signature_data = [
-            ['Механик:', '_' * 40],
-            ['', '(подпись)']
-        ]
-        
-        sig_table = Table(signature_data, colWidths=[30*mm, 100*mm])
-        sig_table.setStyle(TableStyle([
-            ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
-            ('FONTSIZE', (0, 0), (-1, -1), 10),
-            ('ALIGN', (0, 0), (0, -1), 'LEFT'),
-            ('ALIGN', (1, 0), (1, -1), 'CENTER'),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 5),
-            ('TOPPADDING', (0, 0), (-1, -1), 5)
-        ]))
-        
-        story.append(sig_table)
-        
-        doc.build(story)
-        
-        pdf_content = pdf_buffer.getvalue()
-        pdf_buffer.close()
-        
-        s3 = boto3.client('s3',
-            endpoint_url='https://bucket.poehali.dev',
-            aws_access_key_id=os.environ['AWS_ACCESS_KEY_ID'],
-            aws_secret_access_key=os.environ['AWS_SECRET_ACCESS_KEY']
-        )
-        
-        file_key = f"reports/diagnostic_{diagnostic_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
-        s3.put_object(
-            Bucket='files',
-            Key=file_key,
-            Body=pdf_content,
-            ContentType='application/pdf'
-        )
-        
-        cdn_url = f"https://cdn.poehali.dev/projects/{os.environ['AWS_ACCESS_KEY_ID']}/bucket/{file_key}"
-        
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({
-                'pdfUrl': cdn_url,
-                'message': 'PDF отчёт успешно сгенерирован'
-            }),
-            'isBase64Encoded': False
-        }
+        return response.json_response(200, {
+            'pdfUrl': storage.cdn_url(file_key),
+            'cached': False,
+            'message': 'PDF отчёт успешно сгенерирован'
+        })
         
     except Exception as e:
-        return {
-            'statusCode': 500,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({'error': str(e)}),
-            'isBase64Encoded': False
-        }
+        logger.annotate(error=str(e))
+        return response.json_response(500, {'error': str(e)})
     finally:
         if 'cur' in locals():
             cur.close()
         if 'conn' in locals():
-            conn.close()
+            db.release(conn)
@@ -0,0 +1,125 @@
+'''Шаблон PDF-отчёта о диагностике.
+
+Всё, что не зависит от данных, готовится один раз на процесс функцией load():
+регистрация шрифта с кириллицей, стили абзацев и таблиц, ширины колонок. Сам
+reportlab импортируется там же, при первом отчёте, — preflight, ответы из кэша
+и ошибки валидации его не ждут. На запрос остаётся только подставить значения и
+собрать документ. reportlab встраивает TTF-шрифт подмножеством — в PDF попадают
+только использованные глифы.
+'''
+import os
+import threading
+from io import BytesIO
+
+# Меняется вместе с оформлением отчёта, чтобы старые закэшированные PDF не отдавались
+TEMPLATE_VERSION = '2'
+
+FONTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fonts')
+FONT = 'DejaVuSans'
+FONT_BOLD = 'DejaVuSans-Bold'
+
+DIAGNOSTIC_TYPES = {
+    '5min': '5-ти минутка',
+    'dhch': 'ДХЧ',
+    'des': 'ДЭС'
+}
+
+SIGNATURE_DATA = [
+    ['Механик:', '_' * 40],
+    ['', '(подпись)']
+]
+
+TITLE = 'ОТЧЁТ О ДИАГНОСТИКЕ АВТОМОБИЛЯ'
+
+_assets = None
+_assets_lock = threading.Lock()
+
+
+def load():
+    '''Импортирует reportlab и готовит шрифты и стили; повторные вызовы бесплатны'''
+    global _assets
+    if _assets is not None:
+        return _assets
+    with _assets_lock:
+        if _assets is not None:
+            return _assets
+
+        from reportlab.lib import colors
+        from reportlab.lib.enums import TA_CENTER
+        from reportlab.lib.pagesizes import A4
+        from reportlab.lib.styles import ParagraphStyle
+        from reportlab.lib.units import mm
+        from reportlab.pdfbase import pdfmetrics
+        from reportlab.pdfbase.ttfonts import TTFont
+        from reportlab import platypus
+
+        pdfmetrics.registerFont(TTFont(FONT, os.path.join(FONTS_DIR, 'DejaVuSans.ttf')))
+        pdfmetrics.registerFont(TTFont(FONT_BOLD, os.path.join(FONTS_DIR, 'DejaVuSans-Bold.ttf')))
+
+        _assets = {
+            'platypus': platypus,
+            'page_size': A4,
+            'mm': mm,
+            'title_style': ParagraphStyle(
+                'ReportTitle',
+                fontName=FONT_BOLD,
+                fontSize=18,
+                leading=22,
+                alignment=TA_CENTER,
+                spaceAfter=20
+            ),
+            'data_col_widths': [60*mm, 100*mm],
+            'data_table_style': platypus.TableStyle([
+                ('BACKGROUND', (0, 0), (0, -1), colors.lightgrey),
+                ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
+                ('ALIGN', (0, 0), (0, -1), 'LEFT'),
+                ('ALIGN', (1, 0), (1, -1), 'LEFT'),
+                ('FONTNAME', (0, 0), (-1, -1), FONT),
+                ('FONTSIZE', (0, 0), (-1, -1), 11),
+                ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
+                ('TOPPADDING', (0, 0), (-1, -1), 8),
+                ('GRID', (0, 0), (-1, -1), 1, colors.black)
+            ]),
+            'signature_col_widths': [30*mm, 100*mm],
+            'signature_table_style': platypus.TableStyle([
+                ('FONTNAME', (0, 0), (-1, -1), FONT),
+                ('FONTSIZE', (0, 0), (-1, -1), 10),
+                ('ALIGN', (0, 0), (0, -1), 'LEFT'),
+                ('ALIGN', (1, 0), (1, -1), 'CENTER'),
+                ('BOTTOMPADDING', (0, 0), (-1, -1), 5),
+                ('TOPPADDING', (0, 0), (-1, -1), 5)
+            ])
+        }
+    return _assets
+
+
+def render_pdf(row) -> bytes:
+    '''PDF отчёта по строке (id, mechanic, car_number, mileage, diagnostic_type, created_at)'''
+    diagnostic_id, mechanic, car_number, mileage, diagnostic_type, created_at = row
+    assets = load()
+    platypus = assets['platypus']
+    mm = assets['mm']
+
+    data = [
+        ['№ диагностики:', str(diagnostic_id)],
+        ['Дата:', created_at.strftime('%d.%m.%Y %H:%M')],
+        ['Механик:', mechanic],
+        ['Госномер:', car_number],
+        ['Пробег:', f"{mileage:,} км".replace(',', ' ')],
+        ['Тип диагностики:', DIAGNOSTIC_TYPES.get(diagnostic_type, diagnostic_type)]
+    ]
+
+    # Flowable'ы хранят результат раскладки, поэтому создаются на каждый документ;
+    # стили и данные подписи общие и не изменяются
+    story = [
+        platypus.Paragraph(TITLE, assets['title_style']),
+        platypus.Spacer(1, 10*mm),
+        platypus.Table(data, colWidths=assets['data_col_widths'], style=assets['data_table_style']),
+        platypus.Spacer(1, 15*mm),
+        platypus.Table(SIGNATURE_DATA, colWidths=assets['signature_col_widths'], style=assets['signature_table_style'])
+    ]
+
+    pdf_buffer = BytesIO()
+    doc = platypus.SimpleDocTemplate(pdf_buffer, pagesize=assets['page_size'], topMargin=15*mm, bottomMargin=15*mm)
+    doc.build(story)
+    return pdf_buffer.getvalue()
@@ -0,0 +1,96 @@
+import io
+import os
+import threading
+
+# Бакет проекта и публичный CDN-адрес его объектов
+BUCKET = 'files'
+# Размер части multipart upload; S3 требует не меньше 5 МБ для всех частей, кроме последней
+PART_SIZE = max(int(os.environ.get('S3_PART_SIZE', str(8 * 1024 * 1024))), 5 * 1024 * 1024)
+
+_s3 = None
+_s3_lock = threading.Lock()
+
+
+def get_s3():
+    '''Клиент S3 создаётся один раз на контейнер: boto3.client стоит десятки миллисекунд.
+    boto3 импортируется здесь же, а не при импорте модуля, — запросы без S3 его не ждут'''
+    global _s3
+    if _s3 is None:
+        # Сессия boto3 по умолчанию не потокобезопасна
+        with _s3_lock:
+            if _s3 is None:
+                import boto3
+
+                _s3 = boto3.client('s3',
+                    endpoint_url=os.environ.get('S3_ENDPOINT_URL', 'https://bucket.poehali.dev'),
+                    aws_access_key_id=os.environ['AWS_ACCESS_KEY_ID'],
+                    aws_secret_access_key=os.environ['AWS_SECRET_ACCESS_KEY']
+                )
+    return _s3
+
+
+def cdn_url(key: str) -> str:
+    return f"https://cdn.poehali.dev/projects/{os.environ['AWS_ACCESS_KEY_ID']}/bucket/{key}"
+
+
+def exists(key: str) -> bool:
+    '''HEAD объекта; False только на «не найден», остальные ошибки пробрасываются'''
+    s3 = get_s3()
+    try:
+        s3.head_object(Bucket=BUCKET, Key=key)
+    except s3.exceptions.ClientError as e:
+        if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+            return False
+        raise
+    return True
+
+
+def delete_objects(keys: list):
+    '''Удаляет объекты пачками по 1000 — ограничение DeleteObjects'''
+    s3 = get_s3()
+    for start in range(0, len(keys), 1000):
+        s3.delete_objects(
+            Bucket=BUCKET,
+            Delete={'Objects': [{'Key': key} for key in keys[start:start + 1000]], 'Quiet': True}
+        )
+
+
+class MultipartWriter(io.RawIOBase):
+    '''Бинарный поток, который отправляет в S3 часть за частью по мере накопления PART_SIZE байт'''
+
+    def __init__(self, key: str, content_type: str):
+        super().__init__()
+        self.key = key
+        self.s3 = get_s3()
+        self.upload_id = self.s3.create_multipart_upload(Bucket=BUCKET, Key=key, ContentType=content_type)['UploadId']
+        self.parts = []
+        self.buffer = io.BytesIO()
+
+    def writable(self):
+        return True
+
+    def write(self, data: bytes):
+        self.buffer.write(data)
+        if self.buffer.tell() >= PART_SIZE:
+            self._flush_part()
+        return len(data)
+
+    def _flush_part(self):
+        part_number = len(self.parts) + 1
+        response = self.s3.upload_part(
+            Bucket=BUCKET, Key=self.key, UploadId=self.upload_id,
+            PartNumber=part_number, Body=self.buffer.getvalue()
+        )
+        self.parts.append({'PartNumber': part_number, 'ETag': response['ETag']})
+        self.buffer = io.BytesIO()
+
+    def complete(self):
+        if self.buffer.tell() or not self.parts:
+            self._flush_part()
+        self.s3.complete_multipart_upload(
+            Bucket=BUCKET, Key=self.key, UploadId=self.upload_id,
+            MultipartUpload={'Parts': self.parts}
+        )
+
+    def abort(self):
+        self.s3.abort_multipart_upload(Bucket=BUCKET, Key=self.key, UploadId=self.upload_id)
@@ -0,0 +1,33 @@
+import os
+import logger
+import outbox
+import response
+
+PREFLIGHT = response.preflight('GET, POST, OPTIONS')
+
+# Сколько секунд один вызов слушает очередь. Функция запускается по таймеру
+# с периодом около окна, поэтому ответы уходят сразу после NOTIFY от webhook
+DISPATCH_WINDOW = float(os.environ.get('OUTBOX_DISPATCH_WINDOW', '25'))
+
+
+@logger.logged('max-dispatcher')
+def handler(event: dict, context) -> dict:
+    '''Диспетчер очереди исходящих сообщений MAX бота: отправка пачками с повторами'''
+    
+    method = event.get('httpMethod', 'POST')
+    
+    if method == 'OPTIONS':
+        return PREFLIGHT
+    
+    query_params = event.get('queryStringParameters', {}) or {}
+    
+    try:
+        window = float(query_params.get('window', DISPATCH_WINDOW))
+        stats = outbox.run(window=max(window, 0))
+        logger.annotate(**stats)
+        
+        return response.json_response(200, stats)
+    
+    except Exception as e:
+        logger.annotate(error=str(e))
+        return response.json_response(500, {'error': str(e)})
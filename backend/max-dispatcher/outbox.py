@@ -0,0 +1,177 @@
+import os
+import select
+import time
+
+import requests
+from psycopg2.extras import Json
+
+import db
+import logger
+import max_api
+
+BATCH_SIZE = int(os.environ.get('OUTBOX_BATCH_SIZE', '50'))
+MAX_ATTEMPTS = int(os.environ.get('OUTBOX_MAX_ATTEMPTS', '8'))
+BACKOFF_BASE = float(os.environ.get('OUTBOX_BACKOFF_BASE', '2'))
+BACKOFF_MAX = float(os.environ.get('OUTBOX_BACKOFF_MAX', '300'))
+POLL_INTERVAL = float(os.environ.get('OUTBOX_POLL_INTERVAL', '1'))
+# Аренда взятой пачки, секунды: пока она не истекла, сообщения не выдаются другим
+# диспетчерам. Если вызов оборвался посреди пачки, неотправленное уйдёт после аренды
+LEASE = float(os.environ.get('OUTBOX_LEASE', '300'))
+# Запас до конца аренды, после которого оставшиеся сообщения пачки возвращаются в очередь
+LEASE_MARGIN = 30
+CHANNEL = 'bot_outbox'
+
+# Ответы 4xx (кроме 429) MAX не примет и при повторе — такие сообщения сразу помечаются failed
+RETRYABLE_STATUSES = {408, 425, 429}
+
+
+def _schema() -> str:
+    return os.environ.get('MAIN_DB_SCHEMA')
+
+
+def enqueue(user_id: int, payload: dict, conn=None) -> int:
+    '''Кладёт сообщение в очередь отправки; диспетчер будится через NOTIFY'''
+    if conn is not None:
+        return _insert(conn, user_id, payload)
+    with db.connection() as conn:
+        message_id = _insert(conn, user_id, payload)
+        conn.commit()
+        return message_id
+
+
+def _insert(conn, user_id: int, payload: dict) -> int:
+    with conn.cursor() as cur:
+        cur.execute(
+            f"INSERT INTO {_schema()}.bot_outbox (user_id, payload) VALUES (%s, %s) RETURNING id",
+            (user_id, Json(payload))
+        )
+        message_id = cur.fetchone()[0]
+        cur.execute(f"NOTIFY {CHANNEL}")
+    return message_id
+
+
+def backoff(attempts: int) -> float:
+    return min(BACKOFF_BASE * (2 ** (attempts - 1)), BACKOFF_MAX)
+
+
+def deliver(user_id: int, payload: dict):
+    '''Одна попытка доставки: (успех, можно ли повторить, текст ошибки)'''
+    try:
+        response = max_api.request('POST', '/messages', params={'user_id': user_id}, json=payload)
+    except requests.RequestException as e:
+        return False, True, str(e)
+    if response.status_code < 300:
+        return True, False, None
+    retryable = response.status_code >= 500 or response.status_code in RETRYABLE_STATUSES
+    return False, retryable, f'{response.status_code}: {response.text[:500]}'
+
+
+def drain(batch_size: int = BATCH_SIZE) -> dict:
+    '''Отправляет одну пачку готовых сообщений, сохраняя порядок в пределах пользователя
+
+    Пачка берётся в аренду коротким UPDATE и коммитом, отправка идёт без открытой
+    транзакции и блокировок строк, а результат каждого сообщения коммитится сразу:
+    ошибка или таймаут посреди пачки не откатывает отметки уже доставленных.
+    '''
+    stats = {'claimed': 0, 'sent': 0, 'retried': 0, 'failed': 0}
+    schema = _schema()
+    with db.connection() as conn, conn.cursor() as cur:
+        # Берём только самое раннее ожидающее сообщение каждого пользователя,
+        # чтобы повтор не обогнал следующее сообщение того же диалога. Арендованное
+        # сообщение остаётся pending, поэтому следующие того же пользователя ждут его
+        cur.execute(
+            f"WITH batch AS ("
+            f"SELECT o.id FROM {schema}.bot_outbox o "
+            f"WHERE o.status = 'pending' AND o.next_attempt_at <= CURRENT_TIMESTAMP "
+            f"AND NOT EXISTS (SELECT 1 FROM {schema}.bot_outbox p "
+            f"WHERE p.status = 'pending' AND p.user_id = o.user_id AND p.id < o.id) "
+            f"ORDER BY o.id LIMIT %s FOR UPDATE SKIP LOCKED"
+            f") UPDATE {schema}.bot_outbox o SET attempts = o.attempts + 1, "
+            f"next_attempt_at = CURRENT_TIMESTAMP + %s * INTERVAL '1 second' "
+            f"FROM batch WHERE o.id = batch.id RETURNING o.id, o.user_id, o.payload, o.attempts",
+            (batch_size, LEASE)
+        )
+        rows = sorted(cur.fetchall())
+        conn.commit()
+        leased_until = time.monotonic() + LEASE - LEASE_MARGIN
+        stats['claimed'] = len(rows)
+
+        pending = [row[0] for row in rows]
+        try:
+            for message_id, user_id, payload, attempts in rows:
+                if time.monotonic() >= leased_until:
+                    break
+                ok, retryable, error = deliver(user_id, payload)
+                if ok:
+                    cur.execute(
+                        f"UPDATE {schema}.bot_outbox SET status = 'sent', "
+                        f"sent_at = CURRENT_TIMESTAMP, last_error = NULL WHERE id = %s",
+                        (message_id,)
+                    )
+                    stats['sent'] += 1
+                elif retryable and attempts < MAX_ATTEMPTS:
+                    cur.execute(
+                        f"UPDATE {schema}.bot_outbox SET last_error = %s, "
+                        f"next_attempt_at = CURRENT_TIMESTAMP + %s * INTERVAL '1 second' WHERE id = %s",
+                        (error, backoff(attempts), message_id)
+                    )
+                    stats['retried'] += 1
+                else:
+                    cur.execute(
+                        f"UPDATE {schema}.bot_outbox SET status = 'failed', last_error = %s WHERE id = %s",
+                        (error, message_id)
+                    )
+                    stats['failed'] += 1
+                    logger.warning('outbox_delivery_failed', message_id=message_id, attempts=attempts, error=error)
+                conn.commit()
+                pending.remove(message_id)
+        finally:
+            # Не начатые сообщения возвращаются в очередь сразу, без ожидания аренды
+            # и без учёта попытки
+            if pending and not conn.closed:
+                conn.rollback()
+                cur.execute(
+                    f"UPDATE {schema}.bot_outbox SET attempts = attempts - 1, "
+                    f"next_attempt_at = CURRENT_TIMESTAMP WHERE id = ANY(%s) AND status = 'pending'",
+                    (pending,)
+                )
+                conn.commit()
+    return stats
+
+
+def run(window: float = 0, batch_size: int = BATCH_SIZE) -> dict:
+    '''Разбирает очередь в течение window секунд, просыпаясь по NOTIFY; window=0 — один проход'''
+    totals = {'claimed': 0, 'sent': 0, 'retried': 0, 'failed': 0}
+    deadline = time.monotonic() + window
+    listener = None
+    try:
+        if window > 0:
+            listener = db.acquire()
+            listener.autocommit = True
+            with listener.cursor() as cur:
+                cur.execute(f"LISTEN {CHANNEL}")
+        while True:
+            stats = drain(batch_size)
+            for key, value in stats.items():
+                totals[key] += value
+            remaining = deadline - time.monotonic()
+            # После успешной отправки могли освободиться следующие сообщения тех же пользователей
+            if stats['sent'] or stats['claimed'] >= batch_size:
+                if listener is None or remaining > 0:
+                    continue
+                break
+            if listener is None or remaining <= 0:
+                break
+            # Новые сообщения приходят через NOTIFY, отложенные повторы — по таймеру
+            if select.select([listener], [], [], min(remaining, POLL_INTERVAL))[0]:
+                listener.poll()
+                listener.notifies.clear()
+    finally:
+        if listener is not None:
+            broken = bool(listener.closed)
+            if not broken:
+                with listener.cursor() as cur:
+                    cur.execute(f"UNLISTEN {CHANNEL}")
+                listener.autocommit = False
+            db.release(listener, broken)
+    return totals
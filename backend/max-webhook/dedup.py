@@ -0,0 +1,69 @@
+import os
+import random
+import threading
+from collections import OrderedDict
+
+LRU_SIZE = int(os.environ.get('DEDUP_LRU_SIZE', '4096'))
+RETENTION_HOURS = int(os.environ.get('DEDUP_RETENTION_HOURS', '48'))
+PURGE_PROBABILITY = float(os.environ.get('DEDUP_PURGE_PROBABILITY', '0.01'))
+
+_seen = OrderedDict()
+_lock = threading.Lock()
+
+
+def update_key(update: dict):
+    '''Идентификатор доставки: mid сообщения или callback_id нажатия'''
+    update_type = update.get('update_type')
+    if update_type == 'message_created':
+        mid = (update.get('message') or {}).get('body', {}).get('mid')
+        return f'message:{mid}' if mid else None
+    if update_type == 'message_callback':
+        callback_id = (update.get('callback') or {}).get('callback_id')
+        return f'callback:{callback_id}' if callback_id else None
+    return None
+
+
+def seen(key: str) -> bool:
+    '''True, если инстанс уже обработал это обновление или видел его дубликат'''
+    with _lock:
+        if key in _seen:
+            _seen.move_to_end(key)
+            return True
+    return False
+
+
+def remember(key: str):
+    '''Запоминает обработанное обновление в памяти инстанса'''
+    with _lock:
+        _seen[key] = True
+        _seen.move_to_end(key)
+        while len(_seen) > LRU_SIZE:
+            _seen.popitem(last=False)
+
+
+def claim(conn, key: str) -> bool:
+    '''True, если обновление встречается впервые и этот инстанс его обрабатывает
+
+    Отметка пишется в транзакции conn вместе с последствиями обновления и без коммита:
+    откат снимает её сам, а параллельная доставка того же обновления ждёт на
+    уникальном ключе, пока первая обработка не закоммитится или не откатится.
+    Ключи, уже известные инстансу, вызывающий отсеивает заранее через seen(),
+    а после коммита запоминает обработанный ключ через remember().
+    '''
+    schema = os.environ.get('MAIN_DB_SCHEMA')
+    with conn.cursor() as cur:
+        cur.execute(
+            f"INSERT INTO {schema}.processed_updates (update_key) VALUES (%s) "
+            f"ON CONFLICT (update_key) DO NOTHING",
+            (key,)
+        )
+        claimed = cur.rowcount == 1
+        if claimed and random.random() < PURGE_PROBABILITY:
+            cur.execute(
+                f"DELETE FROM {schema}.processed_updates "
+                f"WHERE created_at < CURRENT_TIMESTAMP - %s * INTERVAL '1 hour'",
+                (RETENTION_HOURS,)
+            )
+    if not claimed:
+        remember(key)
+    return claimed
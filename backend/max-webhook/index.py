@@ -1,97 +1,122 @@
 import json
 import os
-import requests
 import psycopg2
+import db
+import dedup
+import keyboard
+import logger
+import outbox
+import rate_limit
+import response
+import sessions
 
-# Хранилище сессий пользователей (в продакшене использовать Redis)
-user_sessions = {}
+PREFLIGHT = response.preflight('POST, OPTIONS')
+# Тела ответов MAX не читает: важен только статус 200, чтобы он не повторял доставку
+OK = response.prebuilt(200, {'ok': True})
+THROTTLED = response.prebuilt(200, {'ok': True, 'throttled': True})
+DUPLICATE = response.prebuilt(200, {'ok': True, 'duplicate': True})
 
+
+@logger.logged('max-webhook')
 def handler(event: dict, context) -> dict:
     '''Webhook для приёма сообщений от MAX бота и отправки ответов'''
     
     method = event.get('httpMethod', 'POST')
     
     if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'POST, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type'
-            },
-            'body': '',
-            'isBase64Encoded': False
-        }
+        return PREFLIGHT
     
     if method != 'POST':
-        return {
-            'statusCode': 405,
-            'headers': {'Content-Type': 'application/json'},
-            'body': json.dumps({'error': 'Method not allowed'}),
-            'isBase64Encoded': False
-        }
+        return response.error(405, 'Method not allowed')
     
     try:
         update = json.loads(event.get('body', '{}'))
         update_type = update.get('update_type')
         
-        print(f"[DEBUG] Received update_type: {update_type}")
-        print(f"[DEBUG] Full update: {json.dumps(update, ensure_ascii=False)}")
+        logger.annotate(update_type=update_type)
+        logger.payload('update_received', update=update)
         
-        if update_type == 'message_created':
-            print("[DEBUG] Handling message_created")
-            handle_message(update)
-        elif update_type == 'message_callback':
-            print("[DEBUG] Handling message_callback")
-            handle_callback(update)
-        else:
-            print(f"[WARNING] Unknown update_type: {update_type}")
+        user_id = rate_limit.sender_id(update)
+        
+        # MAX повторяет доставку медленных обновлений. Уже обработанные этим инстансом
+        # отбрасываются сразу, без обращения к базе и без списания токена
+        key = dedup.update_key(update)
+        if key and dedup.seen(key):
+            logger.annotate(duplicate=True)
+            return DUPLICATE
+        
+        # Отметка о доставке пишется в одной транзакции со всеми последствиями
+        # обновления — списанием токена, сессией, диагностикой и ответами в outbox — и
+        # коммитится вместе с ними: при ошибке откат снимает и её, и повторная доставка
+        # обработает обновление заново
+        for attempt in range(2):
+            try:
+                with db.connection() as conn:
+                    if key and not dedup.claim(conn, key):
+                        logger.annotate(duplicate=True)
+                        return DUPLICATE
+                    # Поток нажатий от одного пользователя режется до любой записи и отправки
+                    decision = rate_limit.check(user_id, conn) if user_id else rate_limit.ALLOW
+                    if decision == rate_limit.ALLOW:
+                        dispatch_update(update, conn)
+                    elif decision == rate_limit.NOTIFY:
+                        send_message(user_id, '⏳ Слишком много сообщений подряд. Подождите несколько секунд и повторите.', conn=conn)
+                    conn.commit()
+                break
+            except Exception as e:
+                # Копия сессии могла запомнить версию из откаченной транзакции
+                if user_id:
+                    sessions.get_store().invalidate(user_id)
+                if not isinstance(e, sessions.SessionConflict) or attempt:
+                    raise
+                # Сессию параллельно изменил другой инстанс: перечитываем и обрабатываем заново
+                logger.warning('session_conflict', update_type=update_type)
         
-        return {
-            'statusCode': 200,
-            'headers': {'Content-Type': 'application/json'},
-            'body': json.dumps({'ok': True}),
-            'isBase64Encoded': False
-        }
+        if key:
+            dedup.remember(key)
+        if decision != rate_limit.ALLOW:
+            logger.annotate(user_id=user_id, throttled=True)
+            return THROTTLED
+        return OK
     
     except Exception as e:
-        print(f"[ERROR] Exception in handler: {str(e)}")
         import traceback
-        print(f"[ERROR] Traceback: {traceback.format_exc()}")
-        return {
-            'statusCode': 500,
-            'headers': {'Content-Type': 'application/json'},
-            'body': json.dumps({'error': str(e)}),
-            'isBase64Encoded': False
-        }
+        logger.annotate(error=str(e))
+        logger.error('handler_failed', error=str(e), traceback=traceback.format_exc())
+        return response.json_response(500, {'error': str(e)})
+
+
+def dispatch_update(update: dict, conn):
+    '''Маршрутизация обновления по типу; все записи идут в транзакции conn'''
+    update_type = update.get('update_type')
+    
+    if update_type == 'message_created':
+        handle_message(update, conn)
+    elif update_type == 'message_callback':
+        handle_callback(update, conn)
+    else:
+        logger.warning('unknown_update_type', update_type=update_type)
 
 
-def handle_message(update: dict):
+def handle_message(update: dict, conn):
     '''Обработка текстовых сообщений'''
     message = update.get('message', {})
     sender_id = message.get('sender', {}).get('user_id')
     user_text = message.get('body', {}).get('text', '').strip()
     
-    print(f"[DEBUG] Extracted sender_id: {sender_id}, text: {user_text}")
+    logger.annotate(user_id=sender_id)
     
     if not sender_id:
-        print("[WARNING] No sender_id found, skipping message")
+        logger.warning('message_without_sender')
         return
     
-    session = user_sessions.get(sender_id, {'step': 0})
+    store = sessions.get_store()
+    session = store.get(sender_id)
     lower_text = user_text.lower()
     
     # Команды
     if lower_text in ['/start', 'начать', 'старт']:
-        user_sessions[sender_id] = {'step': 1}
-        response_text = '👋 Привет! Я HEVSR Diagnostics bot.\n\nВыберите механика для диагностики:'
-        buttons = [
-            [{'type': 'callback', 'text': 'Подкорытов С.А.', 'payload': 'mechanic:Подкорытов С.А.'}],
-            [{'type': 'callback', 'text': 'Костенко В.Ю.', 'payload': 'mechanic:Костенко В.Ю.'}],
-            [{'type': 'callback', 'text': 'Иванюта Д.И.', 'payload': 'mechanic:Иванюта Д.И.'}],
-            [{'type': 'callback', 'text': 'Загороднюк Н.Д.', 'payload': 'mechanic:Загороднюк Н.Д.'}]
-        ]
-        send_message(sender_id, response_text, buttons)
+        start_diagnostic(sender_id, store, '👋 Привет! Я HEVSR Diagnostics bot.\n\nВыберите механика для диагностики:', conn)
         return
     
     elif lower_text in ['/help', 'помощь']:
@@ -102,14 +127,14 @@ def handle_message(update: dict):
 /help - Показать помощь
 
 Бот проведёт вас через все этапы диагностики!'''
-        send_message(sender_id, response_text)
+        send_message(sender_id, response_text, conn=conn)
         return
     
     elif lower_text in ['/cancel', 'отмена']:
-        user_sessions[sender_id] = {'step': 0}
+        store.save(sender_id, {'step': 0}, conn=conn)
         response_text = '✅ Операция отменена.\n\nВведите /start для новой диагностики.'
         buttons = [[{'type': 'callback', 'text': 'Начать диагностику', 'payload': 'start'}]]
-        send_message(sender_id, response_text, buttons)
+        send_message(sender_id, response_text, buttons, conn=conn)
         return
     
     # Обработка по шагам
@@ -118,7 +143,7 @@ def handle_message(update: dict):
     if step == 0:
         response_text = 'Введите /start для начала диагностики или /help для помощи.'
         buttons = [[{'type': 'callback', 'text': 'Начать диагностику', 'payload': 'start'}]]
-        send_message(sender_id, response_text, buttons)
+        send_message(sender_id, response_text, buttons, conn=conn)
     
     elif step == 2:
         # Ввод госномера
@@ -126,12 +151,12 @@ def handle_message(update: dict):
         if len(clean_number) >= 5:
             session['car_number'] = clean_number
             session['step'] = 3
-            user_sessions[sender_id] = session
+            store.save(sender_id, session, conn=conn)
             response_text = f'✅ Госномер {clean_number} принят!\n\nТеперь введите пробег автомобиля (в км).\n\nНапример: 150000'
-            send_message(sender_id, response_text)
+            send_message(sender_id, response_text, conn=conn)
         else:
             response_text = '⚠️ Госномер слишком короткий.\n\nВведите корректный госномер (минимум 5 символов).\n\nНапример: A159BK124'
-            send_message(sender_id, response_text)
+            send_message(sender_id, response_text, conn=conn)
     
     elif step == 3:
         # Ввод пробега
@@ -139,63 +164,62 @@ def handle_message(update: dict):
         if mileage_str and int(mileage_str) > 0:
             session['mileage'] = int(mileage_str)
             session['step'] = 4
-            user_sessions[sender_id] = session
+            store.save(sender_id, session, conn=conn)
             response_text = f'✅ Пробег {int(mileage_str):,} км принят!\n\nТеперь выберите тип диагностики:'.replace(',', ' ')
             buttons = [
                 [{'type': 'callback', 'text': '5-ти минутка', 'payload': 'type:5min'}],
                 [{'type': 'callback', 'text': 'ДХЧ', 'payload': 'type:dhch'}],
                 [{'type': 'callback', 'text': 'ДЭС', 'payload': 'type:des'}]
             ]
-            send_message(sender_id, response_text, buttons)
+            send_message(sender_id, response_text, buttons, conn=conn)
         else:
             response_text = '⚠️ Пожалуйста, введите пробег цифрами.\n\nНапример: 150000'
-            send_message(sender_id, response_text)
+            send_message(sender_id, response_text, conn=conn)
     
     else:
         response_text = 'Не понял команду. Используйте /help для справки.'
-        send_message(sender_id, response_text)
+        send_message(sender_id, response_text, conn=conn)
 
 
-def handle_callback(update: dict):
+def handle_callback(update: dict, conn):
     '''Обработка нажатий на кнопки'''
     callback = update.get('callback', {})
     sender_id = callback.get('user', {}).get('user_id')
     payload = callback.get('payload', '')
     
-    print(f"[DEBUG] Callback - sender_id: {sender_id}, payload: {payload}")
+    logger.annotate(user_id=sender_id, callback=payload.split(':', 1)[0])
     
     if not sender_id:
-        print("[WARNING] No sender_id found in callback, skipping")
+        logger.warning('callback_without_sender')
         return
     
-    session = user_sessions.get(sender_id, {'step': 0})
+    store = sessions.get_store()
+    session = store.get(sender_id)
     
     if payload == 'start':
-        user_sessions[sender_id] = {'step': 1}
-        response_text = '👋 Отлично! Выберите механика:'
-        buttons = [
-            [{'type': 'callback', 'text': 'Подкорытов С.А.', 'payload': 'mechanic:Подкорытов С.А.'}],
-            [{'type': 'callback', 'text': 'Костенко В.Ю.', 'payload': 'mechanic:Костенко В.Ю.'}],
-            [{'type': 'callback', 'text': 'Иванюта Д.И.', 'payload': 'mechanic:Иванюта Д.И.'}],
-            [{'type': 'callback', 'text': 'Загороднюк Н.Д.', 'payload': 'mechanic:Загороднюк Н.Д.'}]
-        ]
-        send_message(sender_id, response_text, buttons)
+        start_diagnostic(sender_id, store, '👋 Отлично! Выберите механика:', conn)
     
     elif payload.startswith('mechanic:'):
         mechanic = payload.replace('mechanic:', '')
         session['mechanic'] = mechanic
         session['step'] = 2
-        user_sessions[sender_id] = session
+        store.save(sender_id, session, conn=conn)
         response_text = f'✅ Механик {mechanic} выбран!\n\nВведите госномер автомобиля.\n\nНапример: A159BK124'
-        send_message(sender_id, response_text)
+        send_message(sender_id, response_text, conn=conn)
     
     elif payload.startswith('type:'):
+        # Кнопка типа из завершённого или сброшенного диалога: сохранять нечего
+        if session.get('step') != 4 or not all(session.get(field) for field in ('mechanic', 'car_number', 'mileage')):
+            response_text = '⚠️ Эта диагностика уже завершена или не была начата.\n\nНачните заново.'
+            buttons = [[{'type': 'callback', 'text': 'Начать диагностику', 'payload': 'start'}]]
+            send_message(sender_id, response_text, buttons, conn=conn)
+            return
+        
         diagnostic_type = payload.replace('type:', '')
         session['diagnostic_type'] = diagnostic_type
-        user_sessions[sender_id] = session
         
         # Сохраняем в БД
-        diagnostic_id = save_diagnostic(session)
+        diagnostic_id = save_diagnostic(conn, session)
         
         if diagnostic_id:
             type_labels = {'5min': '5-ти минутка', 'dhch': 'ДХЧ', 'des': 'ДЭС'}
@@ -214,52 +238,60 @@ def handle_callback(update: dict):
 Диагностика завершена!'''.replace(',', ' ')
             
             buttons = [[{'type': 'callback', 'text': 'Начать новую диагностику', 'payload': 'start'}]]
-            send_message(sender_id, response_text, buttons)
+            send_message(sender_id, response_text, buttons, conn=conn)
             
             # Очищаем сессию
-            user_sessions[sender_id] = {'step': 0}
+            store.save(sender_id, {'step': 0}, conn=conn)
         else:
             response_text = '❌ Ошибка сохранения в базу данных. Попробуйте ещё раз.'
             buttons = [[{'type': 'callback', 'text': 'Попробовать снова', 'payload': 'start'}]]
-            send_message(sender_id, response_text, buttons)
+            send_message(sender_id, response_text, buttons, conn=conn)
 
 
-def save_diagnostic(session: dict) -> int:
-    '''Сохранение диагностики в PostgreSQL'''
-    try:
-        db_url = os.environ.get('DATABASE_URL')
-        schema = os.environ.get('MAIN_DB_SCHEMA')
-        
-        conn = psycopg2.connect(db_url)
-        cur = conn.cursor()
-        
-        mechanic = session.get('mechanic', '')
-        car_number = session.get('car_number', '')
-        mileage = session.get('mileage', 0)
-        diagnostic_type = session.get('diagnostic_type', '')
-        
-        cur.execute(
-            f"INSERT INTO {schema}.diagnostics (mechanic, car_number, mileage, diagnostic_type) "
-            f"VALUES ('{mechanic}', '{car_number}', {mileage}, '{diagnostic_type}') RETURNING id"
-        )
-        
-        result = cur.fetchone()
-        conn.commit()
-        
-        cur.close()
-        conn.close()
-        
-        return result[0] if result else None
-    
-    except Exception as e:
-        return None
+def start_diagnostic(sender_id: int, store, response_text: str, conn):
+    '''Переход к выбору механика; пока механиков нет, сессия не сдвигается с места'''
+    buttons = keyboard.mechanic_buttons()
+    if not buttons:
+        logger.warning('no_mechanics_configured')
+        response_text = '⚠️ Список механиков пуст.\n\nПопросите администратора добавить механиков и введите /start ещё раз.'
+        send_message(sender_id, response_text, conn=conn)
+        return
+    store.save(sender_id, {'step': 1}, conn=conn)
+    send_message(sender_id, response_text, buttons, conn=conn)
 
 
-def send_message(user_id: int, text: str, buttons: list = None):
-    '''Отправка сообщения через MAX API'''
+def save_diagnostic(conn, session: dict) -> int:
+    '''Сохранение диагностики в PostgreSQL в транзакции conn, без коммита'''
+    schema = os.environ.get('MAIN_DB_SCHEMA')
+    
+    mechanic = session.get('mechanic', '')
+    car_number = session.get('car_number', '')
+    mileage = session.get('mileage', 0)
+    diagnostic_type = session.get('diagnostic_type', '')
     
-    token = os.environ.get('MAX_BOT_TOKEN')
-    url = f'https://platform-api.max.ru/messages?user_id={user_id}'
+    with conn.cursor() as cur:
+        # Точка сохранения: ошибка вставки откатывает только её, а отметка о доставке
+        # и ответ механику об ошибке остаются в транзакции
+        cur.execute('SAVEPOINT save_diagnostic')
+        try:
+            db.execute_prepared(
+                cur,
+                f"INSERT INTO {schema}.diagnostics (mechanic, car_number, mileage, diagnostic_type) "
+                f"VALUES (%s, %s, %s, %s) RETURNING id",
+                (mechanic, car_number, mileage, diagnostic_type)
+            )
+            result = cur.fetchone()
+        except psycopg2.DatabaseError as e:
+            cur.execute('ROLLBACK TO SAVEPOINT save_diagnostic')
+            logger.error('diagnostic_save_failed', error=str(e))
+            return None
+        cur.execute('RELEASE SAVEPOINT save_diagnostic')
+    
+    return result[0] if result else None
+
+
+def send_message(user_id: int, text: str, buttons: list = None, conn=None) -> int:
+    '''Постановка сообщения в очередь отправки через MAX API'''
     
     payload = {
         'text': text
@@ -271,18 +303,8 @@ def send_message(user_id: int, text: str, buttons: list = None):
             'payload': {'buttons': buttons}
         }]
     
-    headers = {
-        'Authorization': token,
-        'Content-Type': 'application/json'
-    }
-    
-    print(f"[DEBUG] Sending message to user_id: {user_id}")
-    print(f"[DEBUG] URL: {url}")
-    print(f"[DEBUG] Payload: {json.dumps(payload, ensure_ascii=False)}")
-    
-    response = requests.post(url, json=payload, headers=headers)
-    
-    print(f"[DEBUG] Response status: {response.status_code}")
-    print(f"[DEBUG] Response body: {response.text}")
+    logger.payload('message_queued', user_id=user_id, payload=payload)
     
-    return response.json()
\ No newline at end of file
+    # Ответ уходит через outbox: webhook не ждёт MAX API, доставку и повторы
+    # выполняет функция max-dispatcher. С conn сообщение попадает в транзакцию вызывающего
+    return outbox.enqueue(user_id, payload, conn=conn)
@@ -0,0 +1,40 @@
+import os
+import threading
+import time
+
+import db
+import logger
+
+# Клавиатура выбора механика строится из таблицы mechanics и кэшируется.
+# По истечении TTL проверяется только счётчик data_versions, список перечитывается
+# лишь когда механиков добавили или удалили в админ-панели.
+CACHE_TTL = float(os.environ.get('MECHANICS_CACHE_TTL', '60'))
+
+_cache = {'buttons': None, 'version': None, 'checked_at': 0.0}
+_lock = threading.Lock()
+
+
+def mechanic_buttons() -> list:
+    '''Кнопки выбора механика для inline-клавиатуры'''
+    with _lock:
+        buttons = _cache['buttons']
+        if buttons is not None and time.monotonic() - _cache['checked_at'] < CACHE_TTL:
+            return buttons
+        cached_version = _cache['version']
+
+    schema = os.environ.get('MAIN_DB_SCHEMA')
+    with db.connection() as conn, conn.cursor() as cur:
+        cur.execute(f"SELECT version FROM {schema}.data_versions WHERE name = 'mechanics'")
+        row = cur.fetchone()
+        version = row[0] if row else 0
+        if buttons is None or version != cached_version:
+            cur.execute(f"SELECT name FROM {schema}.mechanics ORDER BY name")
+            buttons = [
+                [{'type': 'callback', 'text': name, 'payload': f'mechanic:{name}'}]
+                for (name,) in cur.fetchall()
+            ]
+            logger.debug('mechanics_keyboard_reloaded', version=version, count=len(buttons))
+
+    with _lock:
+        _cache.update(buttons=buttons, version=version, checked_at=time.monotonic())
+    return buttons
@@ -0,0 +1,86 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# Ведро токенов на пользователя: BURST обновлений подряд, дальше RATE в секунду
+RATE = float(os.environ.get('RATE_LIMIT_PER_SECOND', '0.5'))
+BURST = float(os.environ.get('RATE_LIMIT_BURST', '10'))
+LRU_SIZE = int(os.environ.get('RATE_LIMIT_LRU_SIZE', '4096'))
+
+ALLOW = 'allow'
+NOTIFY = 'notify'
+DROP = 'drop'
+
+# Последнее известное инстансу состояние ведра: user_id -> [токены, time.monotonic(), предупреждён]
+_buckets = OrderedDict()
+_lock = threading.Lock()
+
+
+def sender_id(update: dict):
+    '''user_id автора сообщения или нажатия'''
+    update_type = update.get('update_type')
+    if update_type == 'message_created':
+        return ((update.get('message') or {}).get('sender') or {}).get('user_id')
+    if update_type == 'message_callback':
+        return ((update.get('callback') or {}).get('user') or {}).get('user_id')
+    return None
+
+
+def _local_tokens(user_id: int, now: float):
+    with _lock:
+        state = _buckets.get(user_id)
+        if state is None:
+            return None
+        _buckets.move_to_end(user_id)
+        return min(BURST, state[0] + (now - state[1]) * RATE)
+
+
+def _remember(user_id: int, tokens: float, now: float, allowed: bool) -> str:
+    '''Сохраняет состояние и решает, предупредить ли пользователя: один раз за серию отказов'''
+    with _lock:
+        state = _buckets.get(user_id)
+        notified = bool(state and state[2])
+        _buckets[user_id] = [tokens, now, notified and not allowed]
+        _buckets.move_to_end(user_id)
+        while len(_buckets) > LRU_SIZE:
+            _buckets.popitem(last=False)
+        if allowed:
+            return ALLOW
+        if notified:
+            return DROP
+        _buckets[user_id][2] = True
+        return NOTIFY
+
+
+def check(user_id: int, conn) -> str:
+    '''ALLOW — обрабатывать; NOTIFY — отказать и попросить подождать; DROP — молча отбросить
+
+    Токен списывается в транзакции conn без коммита: если обработка обновления
+    откатится, откатится и списание.
+    '''
+    now = time.monotonic()
+    # Общий счётчик расходуют все инстансы, поэтому в нём токенов не больше, чем
+    # в локальной копии: пустое локальное ведро отказывает без обращения к базе
+    local = _local_tokens(user_id, now)
+    if local is not None and local < 1:
+        return _remember(user_id, local, now, False)
+
+    schema = os.environ.get('MAIN_DB_SCHEMA')
+    refilled = (
+        f"LEAST(%(burst)s, {schema}.rate_limits.tokens + "
+        f"EXTRACT(EPOCH FROM CURRENT_TIMESTAMP - {schema}.rate_limits.updated_at) * %(rate)s)"
+    )
+    with conn.cursor() as cur:
+        # Пополнение и списание одним upsert под блокировкой строки
+        cur.execute(
+            f"INSERT INTO {schema}.rate_limits (user_id, tokens) VALUES (%(user_id)s, %(burst)s - 1) "
+            f"ON CONFLICT (user_id) DO UPDATE SET "
+            f"tokens = CASE WHEN {refilled} >= 1 THEN {refilled} - 1 ELSE {refilled} END, "
+            f"allowed = {refilled} >= 1, "
+            f"updated_at = CURRENT_TIMESTAMP "
+            f"RETURNING tokens, allowed",
+            {'user_id': user_id, 'burst': BURST, 'rate': RATE}
+        )
+        tokens, allowed = cur.fetchone()
+    return _remember(user_id, tokens, now, allowed)
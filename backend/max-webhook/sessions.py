@@ -0,0 +1,169 @@
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+
+from psycopg2.extras import Json
+
+import db
+
+SESSION_TTL = int(os.environ.get('SESSION_TTL', '86400'))
+SESSION_BACKEND = os.environ.get('SESSION_BACKEND', 'postgres')
+# Сколько живёт локальная копия сессии. Запись всегда идёт в хранилище с проверкой
+# версии, поэтому устаревшая копия обнаруживается при сохранении (SessionConflict);
+# ответы, не меняющие сессию, могут опираться на копию не дольше этого срока.
+CACHE_TTL = float(os.environ.get('SESSION_CACHE_TTL', '30'))
+CACHE_SIZE = int(os.environ.get('SESSION_CACHE_SIZE', '1024'))
+# Доля сохранений, после которых из хранилища вычищаются истёкшие сессии
+PURGE_PROBABILITY = float(os.environ.get('SESSION_PURGE_PROBABILITY', '0.01'))
+
+
+class SessionConflict(Exception):
+    '''Сессию успел изменить другой инстанс — нужно перечитать и повторить'''
+
+
+class MemorySessionBackend:
+    '''Хранилище сессий в памяти процесса (для тестов и локального запуска)
+
+    Транзакций нет: conn в store() не используется, запись видна сразу и не откатывается.
+    '''
+
+    def __init__(self):
+        self._rows = {}
+        self._lock = threading.Lock()
+
+    def load(self, user_id: int):
+        with self._lock:
+            row = self._rows.get(user_id)
+        if row is None:
+            return None, 0
+        data, version, expires_at = row
+        return (dict(data) if expires_at > time.time() else None), version
+
+    def store(self, user_id: int, data: dict, expected_version: int, ttl: int, conn=None) -> int:
+        with self._lock:
+            current = self._rows.get(user_id)
+            current_version = current[1] if current else 0
+            if current is not None and current_version != expected_version:
+                raise SessionConflict(user_id)
+            self._rows[user_id] = (dict(data), current_version + 1, time.time() + ttl)
+            return current_version + 1
+
+    def purge_expired(self) -> int:
+        now = time.time()
+        with self._lock:
+            expired = [user_id for user_id, row in self._rows.items() if row[2] <= now]
+            for user_id in expired:
+                del self._rows[user_id]
+        return len(expired)
+
+
+class PostgresSessionBackend:
+    '''Хранилище сессий в таблице bot_sessions, общее для всех инстансов'''
+
+    def __init__(self, schema: str = None):
+        self.schema = schema or os.environ.get('MAIN_DB_SCHEMA')
+
+    def load(self, user_id: int):
+        with db.connection() as conn, conn.cursor() as cur:
+            cur.execute(
+                f"SELECT data, version, expires_at > CURRENT_TIMESTAMP "
+                f"FROM {self.schema}.bot_sessions WHERE user_id = %s",
+                (user_id,)
+            )
+            row = cur.fetchone()
+        if row is None:
+            return None, 0
+        data, version, alive = row
+        return (data if alive else None), version
+
+    def store(self, user_id: int, data: dict, expected_version: int, ttl: int, conn=None) -> int:
+        '''С conn запись идёт в транзакции вызывающего и коммитится им; строка сессии
+        остаётся заблокированной до коммита, и параллельное сохранение дождётся его'''
+        if conn is None:
+            with db.connection() as conn:
+                version = self.store(user_id, data, expected_version, ttl, conn)
+                conn.commit()
+                return version
+        with conn.cursor() as cur:
+            cur.execute(
+                f"INSERT INTO {self.schema}.bot_sessions AS s (user_id, data, version, expires_at) "
+                f"VALUES (%s, %s, 1, CURRENT_TIMESTAMP + %s * INTERVAL '1 second') "
+                f"ON CONFLICT (user_id) DO UPDATE SET data = EXCLUDED.data, version = s.version + 1, "
+                f"expires_at = EXCLUDED.expires_at, updated_at = CURRENT_TIMESTAMP "
+                f"WHERE s.version = %s RETURNING version",
+                (user_id, Json(data), ttl, expected_version)
+            )
+            row = cur.fetchone()
+        if row is None:
+            raise SessionConflict(user_id)
+        return row[0]
+
+    def purge_expired(self) -> int:
+        with db.connection() as conn, conn.cursor() as cur:
+            cur.execute(
+                f"DELETE FROM {self.schema}.bot_sessions WHERE expires_at <= CURRENT_TIMESTAMP"
+            )
+            conn.commit()
+            return cur.rowcount
+
+
+class SessionStore:
+    '''Сессии диалога с кэшем в памяти: чтение из кэша, запись сквозная с проверкой версии'''
+
+    def __init__(self, backend, ttl: int = SESSION_TTL,
+                 cache_ttl: float = CACHE_TTL, cache_size: int = CACHE_SIZE):
+        self.backend = backend
+        self.ttl = ttl
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _remember(self, user_id: int, data: dict, version: int):
+        with self._lock:
+            self._cache[user_id] = (data, version, time.monotonic() + self.cache_ttl)
+            self._cache.move_to_end(user_id)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def get(self, user_id: int) -> dict:
+        with self._lock:
+            cached = self._cache.get(user_id)
+        if cached is not None and cached[2] > time.monotonic():
+            return dict(cached[0])
+        data, version = self.backend.load(user_id)
+        data = data or {'step': 0}
+        self._remember(user_id, data, version)
+        return dict(data)
+
+    def save(self, user_id: int, data: dict, conn=None):
+        '''Сохраняет сессию; с conn — в транзакции вызывающего. Если она откатится,
+        вызывающий сбрасывает копию через invalidate(): в кэше осталась несостоявшаяся версия'''
+        with self._lock:
+            cached = self._cache.get(user_id)
+        expected_version = cached[1] if cached is not None else self.backend.load(user_id)[1]
+        try:
+            version = self.backend.store(user_id, data, expected_version, self.ttl, conn)
+        except SessionConflict:
+            self.invalidate(user_id)
+            raise
+        self._remember(user_id, dict(data), version)
+        if random.random() < PURGE_PROBABILITY:
+            self.backend.purge_expired()
+
+    def invalidate(self, user_id: int):
+        with self._lock:
+            self._cache.pop(user_id, None)
+
+
+_store = None
+
+
+def get_store() -> SessionStore:
+    global _store
+    if _store is None:
+        backend = MemorySessionBackend() if SESSION_BACKEND == 'memory' else PostgresSessionBackend()
+        _store = SessionStore(backend)
+    return _store
@@ -0,0 +1,200 @@
+import os
+import re
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+
+import psycopg2
+import psycopg2.errors
+import psycopg2.extensions
+from psycopg2.pool import PoolError
+
+# Пул живёт на уровне модуля и переживает тёплые вызовы функции:
+# TCP+TLS+auth рукопожатие с PostgreSQL платится один раз на инстанс.
+POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', '4'))
+POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', '10'))
+CONNECT_TIMEOUT = int(os.environ.get('DB_CONNECT_TIMEOUT', '5'))
+# Соединение, простоявшее дольше этого интервала, проверяется SELECT 1 перед выдачей
+HEALTHCHECK_INTERVAL = float(os.environ.get('DB_HEALTHCHECK_INTERVAL', '30'))
+# Серверные PREPARE для горячих запросов. За пулером в режиме transaction (pgbouncer)
+# серверное соединение меняется между транзакциями — там нужно DB_PREPARED_STATEMENTS=0
+PREPARED_STATEMENTS = os.environ.get('DB_PREPARED_STATEMENTS', '1') not in ('0', 'false')
+# Предел PREPARE на одно соединение: сверх него запросы выполняются обычным execute
+MAX_PREPARED = int(os.environ.get('DB_MAX_PREPARED', '64'))
+
+
+class ConnectionPool:
+    '''Ограниченный пул соединений с проверкой живости и переподключением'''
+
+    def __init__(self, dsn: str, max_size: int = POOL_MAX_SIZE,
+                 timeout: float = POOL_TIMEOUT,
+                 healthcheck_interval: float = HEALTHCHECK_INTERVAL):
+        self.dsn = dsn
+        self.max_size = max_size
+        self.timeout = timeout
+        self.healthcheck_interval = healthcheck_interval
+        self._idle = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_size)
+
+    def _connect(self):
+        return psycopg2.connect(
+            self.dsn,
+            connect_timeout=CONNECT_TIMEOUT,
+            keepalives=1,
+            keepalives_idle=30,
+            keepalives_interval=10,
+            keepalives_count=3
+        )
+
+    def _is_alive(self, conn) -> bool:
+        if conn.closed:
+            return False
+        try:
+            with conn.cursor() as cur:
+                cur.execute('SELECT 1')
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def acquire(self):
+        '''Выдаёт живое соединение, при необходимости переподключаясь'''
+        if not self._slots.acquire(timeout=self.timeout):
+            raise PoolError(f'Нет свободных соединений в пуле (максимум {self.max_size})')
+        try:
+            while True:
+                with self._lock:
+                    if not self._idle:
+                        break
+                    conn, last_used = self._idle.pop()
+                if conn.closed:
+                    continue
+                if time.monotonic() - last_used < self.healthcheck_interval or self._is_alive(conn):
+                    return conn
+                self._discard(conn)
+            return self._connect()
+        except Exception:
+            self._slots.release()
+            raise
+
+    def release(self, conn, broken: bool = False):
+        '''Возвращает соединение в пул; сломанные соединения закрываются'''
+        try:
+            if not broken and not conn.closed:
+                status = conn.get_transaction_status()
+                if status == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN:
+                    broken = True
+                elif status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    try:
+                        conn.rollback()
+                    except psycopg2.Error:
+                        broken = True
+            if broken or conn.closed:
+                self._discard(conn)
+            else:
+                with self._lock:
+                    self._idle.append((conn, time.monotonic()))
+        finally:
+            self._slots.release()
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    def close_all(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            self._discard(conn)
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+# Пулы, унаследованные от родителя при fork: их сокеты принадлежат родителю,
+# поэтому соединения нельзя ни использовать, ни закрывать (закрытие отправит
+# серверу Terminate по общему сокету) — ссылки держатся до выхода процесса
+_inherited_pools = []
+
+
+def get_pool() -> ConnectionPool:
+    '''Пул для DATABASE_URL, создаётся при первом обращении и заново в дочернем процессе'''
+    global _pool, _pool_pid
+    if _pool is None or _pool_pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool_pid != os.getpid():
+                if _pool is not None:
+                    _inherited_pools.append(_pool)
+                _pool = ConnectionPool(os.environ.get('DATABASE_URL'))
+                _pool_pid = os.getpid()
+    return _pool
+
+
+def acquire():
+    return get_pool().acquire()
+
+
+def release(conn, broken: bool = False):
+    get_pool().release(conn, broken)
+
+
+# Подготовленные на соединении запросы: {соединение: {sql: имя PREPARE}}. Слабые ссылки:
+# закрытое и выброшенное пулом соединение уносит с собой и свои записи, а новое
+# после переподключения начинает с пустого набора, как и его серверная сессия
+_prepared = weakref.WeakKeyDictionary()
+_prepared_lock = threading.Lock()
+_PLACEHOLDER = re.compile(r'%(%|s)')
+
+
+def _positional(sql: str) -> str:
+    '''%s → $1, $2, ... для PREPARE; %% → %'''
+    counter = iter(range(1, sql.count('%s') + 1))
+    return _PLACEHOLDER.sub(lambda m: '%' if m.group(1) == '%' else f'${next(counter)}', sql)
+
+
+def execute_prepared(cur, sql: str, params=()):
+    '''cur.execute(sql, params) через PREPARE, сделанный один раз на соединение пула.
+
+    sql — с позиционными %s; план разбирается и кэшируется сервером при первом вызове
+    на соединении, дальше уходит короткий EXECUTE с теми же параметрами.
+    '''
+    if not PREPARED_STATEMENTS:
+        return cur.execute(sql, params)
+    conn = cur.connection
+    with _prepared_lock:
+        statements = _prepared.setdefault(conn, {})
+    name = statements.get(sql)
+    if name is None:
+        if len(statements) >= MAX_PREPARED:
+            return cur.execute(sql, params)
+        name = f'stmt_{len(statements) + 1}'
+        # PREPARE не откатывается вместе с транзакцией, поэтому запоминается сразу
+        cur.execute(f'PREPARE {name} AS {_positional(sql)}')
+        statements[sql] = name
+    try:
+        if params:
+            cur.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(params))})", params)
+        else:
+            cur.execute(f'EXECUTE {name}')
+    except psycopg2.errors.InvalidSqlStatementName:
+        # Сессия потеряла PREPARE (DISCARD ALL у пулера): следующий вызов подготовит заново
+        statements.clear()
+        raise
+
+
+@contextmanager
+def connection():
+    '''Соединение из пула на время блока; при сетевой ошибке оно не возвращается в пул'''
+    conn = acquire()
+    broken = False
+    try:
+        yield conn
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        broken = True
+        raise
+    finally:
+        release(conn, broken)
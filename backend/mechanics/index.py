@@ -1,32 +1,51 @@
 import json
 import os
-import psycopg2
+import admin_auth
+import db
+import etag
+import logger
+import response
 
+PREFLIGHT = response.preflight('GET, POST, DELETE, OPTIONS', 'Content-Type, If-None-Match, X-Auth-Token, Authorization')
+
+
+def parse_ids(query_params: dict, body: str) -> list:
+    '''Список id для удаления: ?id=, ?ids=1,2,3 или тело {"ids": [...]}'''
+    ids = []
+    for key in ('id', 'ids'):
+        if query_params.get(key):
+            ids += query_params[key].split(',')
+    if body:
+        ids += json.loads(body).get('ids') or []
+    return [int(value) for value in ids]
+
+
+@logger.logged('mechanics')
 def handler(event: dict, context) -> dict:
     '''API для управления списком механиков'''
     
     method = event.get('httpMethod', 'GET')
     
     if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, POST, DELETE, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type'
-            },
-            'body': '',
-            'isBase64Encoded': False
-        }
+        return PREFLIGHT
+    
+    # Список механиков открыт, изменения — только для администратора
+    if method in ('POST', 'DELETE'):
+        denied = admin_auth.require(event)
+        if denied:
+            return denied
     
-    db_url = os.environ.get('DATABASE_URL')
     schema = os.environ.get('MAIN_DB_SCHEMA')
     
     try:
-        conn = psycopg2.connect(db_url)
+        conn = db.acquire()
         cur = conn.cursor()
         
         if method == 'GET':
+            list_etag = etag.make_etag('mechanics', etag.data_version(cur, schema, 'mechanics'))
+            if etag.is_fresh(event, list_etag):
+                return etag.not_modified(list_etag)
+            
             cur.execute(f"SELECT id, name, created_at FROM {schema}.mechanics ORDER BY name")
             rows = cur.fetchall()
             
@@ -34,106 +53,61 @@ def handler(event: dict, context) -> dict:
                 {
                     'id': row[0],
                     'name': row[1],
-                    'createdAt': row[2].isoformat()
+                    'createdAt': row[2]
                 }
                 for row in rows
             ]
             
-            return {
-                'statusCode': 200,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps(mechanics),
-                'isBase64Encoded': False
-            }
+            return response.json_response(200, mechanics, {
+                'ETag': list_etag,
+                'Cache-Control': 'no-cache',
+                'Access-Control-Expose-Headers': 'ETag'
+            })
         
         elif method == 'POST':
             body = json.loads(event.get('body', '{}'))
             name = body.get('name', '').strip()
             
             if not name:
-                return {
-                    'statusCode': 400,
-                    'headers': {
-                        'Content-Type': 'application/json',
-                        'Access-Control-Allow-Origin': '*'
-                    },
-                    'body': json.dumps({'error': 'Имя механика обязательно'}),
-                    'isBase64Encoded': False
-                }
+                return response.error(400, 'Имя механика обязательно')
             
             cur.execute(
-                f"INSERT INTO {schema}.mechanics (name) VALUES ('{name}') RETURNING id, created_at"
+                f"INSERT INTO {schema}.mechanics (name) VALUES (%s) RETURNING id, created_at",
+                (name,)
             )
             result = cur.fetchone()
             conn.commit()
             
-            return {
-                'statusCode': 201,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({
-                    'id': result[0],
-                    'name': name,
-                    'createdAt': result[1].isoformat()
-                }),
-                'isBase64Encoded': False
-            }
+            return response.json_response(201, {
+                'id': result[0],
+                'name': name,
+                'createdAt': result[1]
+            })
         
         elif method == 'DELETE':
             query_params = event.get('queryStringParameters', {}) or {}
-            mechanic_id = query_params.get('id')
+            try:
+                mechanic_ids = parse_ids(query_params, event.get('body'))
+            except (ValueError, TypeError, AttributeError):
+                mechanic_ids = []
             
-            if not mechanic_id:
-                return {
-                    'statusCode': 400,
-                    'headers': {
-                        'Content-Type': 'application/json',
-                        'Access-Control-Allow-Origin': '*'
-                    },
-                    'body': json.dumps({'error': 'ID механика обязателен'}),
-                    'isBase64Encoded': False
-                }
+            if not mechanic_ids:
+                return response.error(400, 'ID механика обязателен')
             
-            cur.execute(f"DELETE FROM {schema}.mechanics WHERE id = {mechanic_id}")
+            cur.execute(f"DELETE FROM {schema}.mechanics WHERE id = ANY(%s)", (mechanic_ids,))
+            deleted = cur.rowcount
             conn.commit()
+            logger.annotate(deleted=deleted)
             
-            return {
-                'statusCode': 200,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({'message': 'Механик удалён'}),
-                'isBase64Encoded': False
-            }
+            return response.json_response(200, {'message': 'Механик удалён' if deleted == 1 else f'Удалено механиков: {deleted}', 'deleted': deleted})
         
-        return {
-            'statusCode': 405,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({'error': 'Метод не поддерживается'}),
-            'isBase64Encoded': False
-        }
+        return response.error(405, 'Метод не поддерживается')
         
     except Exception as e:
-        return {
-            'statusCode': 500,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({'error': str(e)}),
-            'isBase64Encoded': False
-        }
+        logger.annotate(error=str(e))
+        return response.json_response(500, {'error': str(e)})
     finally:
         if 'cur' in locals():
             cur.close()
         if 'conn' in locals():
-            conn.close()
+            db.release(conn)
@@ -0,0 +1,86 @@
+import datetime
+import functools
+import json
+
+try:
+    import orjson
+except ImportError:
+    # orjson необязателен: без него тела кодирует json из стандартной библиотеки
+    orjson = None
+
+# Ответы handler'ов. Постоянные (preflight, типовые ошибки) собираются один раз
+# при импорте и отдаются всем запросам как есть, поэтому доступны только для
+# чтения. JSON кодируется orjson, если он установлен; datetime сериализуется
+# самим кодировщиком в ISO 8601, без isoformat() по строкам.
+
+
+class Frozen(dict):
+    '''dict только для чтения: общий для всех запросов готовый ответ'''
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError('Готовый ответ нельзя изменять')
+
+    __setitem__ = __delitem__ = __ior__ = clear = pop = popitem = setdefault = update = _readonly
+
+
+CORS_HEADERS = Frozen({'Access-Control-Allow-Origin': '*'})
+JSON_HEADERS = Frozen({'Content-Type': 'application/json', **CORS_HEADERS})
+
+
+def _default(value):
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    raise TypeError(f'{type(value).__name__} не сериализуется в JSON')
+
+
+if orjson is not None:
+    def dumps(value) -> str:
+        return orjson.dumps(value).decode()
+else:
+    def dumps(value) -> str:
+        return json.dumps(value, ensure_ascii=False, default=_default)
+
+
+def json_response(status: int, body, headers: dict = None) -> dict:
+    '''Ответ с JSON-телом; headers дополняют Content-Type и CORS'''
+    return {
+        'statusCode': status,
+        'headers': {**JSON_HEADERS, **headers} if headers else JSON_HEADERS,
+        'body': dumps(body),
+        'isBase64Encoded': False
+    }
+
+
+def prebuilt(status: int, body) -> Frozen:
+    '''Готовый ответ с неизменным телом: кодируется один раз'''
+    return Frozen(statusCode=status, headers=JSON_HEADERS, body=dumps(body), isBase64Encoded=False)
+
+
+@functools.lru_cache(maxsize=256)
+def error(status: int, message: str) -> Frozen:
+    '''{"error": message} для постоянных сообщений; текст исключений — через json_response'''
+    return prebuilt(status, {'error': message})
+
+
+def empty(status: int, headers: dict = None) -> dict:
+    '''Ответ без тела (например, 304); headers дополняют CORS'''
+    return {
+        'statusCode': status,
+        'headers': {**CORS_HEADERS, **headers} if headers else CORS_HEADERS,
+        'body': '',
+        'isBase64Encoded': False
+    }
+
+
+def preflight(methods: str, allow_headers: str = 'Content-Type') -> Frozen:
+    '''Ответ на OPTIONS; собирается при импорте handler'''
+    return Frozen(
+        statusCode=200,
+        headers=Frozen({
+            **CORS_HEADERS,
+            'Access-Control-Allow-Methods': methods,
+            'Access-Control-Allow-Headers': allow_headers
+        }),
+        body='',
+        isBase64Encoded=False
+    )
@@ -1,49 +1,28 @@
-import json
-import os
-import requests
+import logger
+import max_api
+import response
 
+PREFLIGHT = response.preflight('GET, POST, DELETE, OPTIONS')
+
+
+@logger.logged('setup-max-webhook')
 def handler(event: dict, context) -> dict:
     '''API для настройки webhook подписки в MAX боте'''
     
     method = event.get('httpMethod', 'GET')
     
     if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, POST, DELETE, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type'
-            },
-            'body': '',
-            'isBase64Encoded': False
-        }
-    
-    token = os.environ.get('MAX_BOT_TOKEN')
-    base_url = 'https://platform-api.max.ru'
-    
-    headers = {
-        'Authorization': token,
-        'Content-Type': 'application/json'
-    }
+        return PREFLIGHT
     
     try:
         if method == 'GET':
             # Получаем текущие подписки
-            response = requests.get(f'{base_url}/subscriptions', headers=headers)
+            subscriptions_response = max_api.request('GET', '/subscriptions')
             
-            return {
-                'statusCode': 200,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({
-                    'subscriptions': response.json(),
-                    'message': 'Текущие подписки получены'
-                }),
-                'isBase64Encoded': False
-            }
+            return response.json_response(200, {
+                'subscriptions': subscriptions_response.json(),
+                'message': 'Текущие подписки получены'
+            })
         
         elif method == 'POST':
             # Создаём новую подписку
@@ -54,79 +33,43 @@ def handler(event: dict, context) -> dict:
                 'update_types': ['message_created', 'message_callback']
             }
             
-            response = requests.post(f'{base_url}/subscriptions', json=payload, headers=headers)
+            create_response = max_api.request('POST', '/subscriptions', json=payload)
             
-            if response.status_code in [200, 201]:
-                return {
-                    'statusCode': 200,
-                    'headers': {
-                        'Content-Type': 'application/json',
-                        'Access-Control-Allow-Origin': '*'
-                    },
-                    'body': json.dumps({
-                        'subscription': response.json(),
-                        'message': 'Webhook успешно настроен!',
-                        'webhook_url': webhook_url
-                    }),
-                    'isBase64Encoded': False
-                }
+            if create_response.status_code in [200, 201]:
+                return response.json_response(200, {
+                    'subscription': create_response.json(),
+                    'message': 'Webhook успешно настроен!',
+                    'webhook_url': webhook_url
+                })
             else:
-                return {
-                    'statusCode': response.status_code,
-                    'headers': {
-                        'Content-Type': 'application/json',
-                        'Access-Control-Allow-Origin': '*'
-                    },
-                    'body': json.dumps({
-                        'error': response.text,
-                        'message': 'Ошибка при создании подписки'
-                    }),
-                    'isBase64Encoded': False
-                }
+                return response.json_response(create_response.status_code, {
+                    'error': create_response.text,
+                    'message': 'Ошибка при создании подписки'
+                })
         
         elif method == 'DELETE':
             # Удаляем все подписки
-            subscriptions_response = requests.get(f'{base_url}/subscriptions', headers=headers)
+            subscriptions_response = max_api.request('GET', '/subscriptions')
             subscriptions = subscriptions_response.json()
             
             deleted = []
             for sub in subscriptions.get('subscriptions', []):
                 sub_url = sub.get('url')
-                delete_response = requests.delete(
-                    f'{base_url}/subscriptions',
-                    params={'url': sub_url},
-                    headers=headers
+                delete_response = max_api.request(
+                    'DELETE',
+                    '/subscriptions',
+                    params={'url': sub_url}
                 )
                 if delete_response.status_code == 200:
                     deleted.append(sub_url)
             
-            return {
-                'statusCode': 200,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({
-                    'deleted': deleted,
-                    'message': f'Удалено подписок: {len(deleted)}'
-                }),
-                'isBase64Encoded': False
-            }
+            return response.json_response(200, {
+                'deleted': deleted,
+                'message': f'Удалено подписок: {len(deleted)}'
+            })
         
-        return {
-            'statusCode': 405,
-            'headers': {'Content-Type': 'application/json'},
-            'body': json.dumps({'error': 'Method not allowed'}),
-            'isBase64Encoded': False
-        }
+        return response.error(405, 'Method not allowed')
     
     except Exception as e:
-        return {
-            'statusCode': 500,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({'error': str(e)}),
-            'isBase64Encoded': False
-        }
+        logger.annotate(error=str(e))
+        return response.json_response(500, {'error': str(e)})
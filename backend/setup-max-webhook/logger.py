@@ -0,0 +1,91 @@
+import functools
+import json
+import os
+import random
+import sys
+import threading
+import time
+
+LEVELS = {'DEBUG': 10, 'INFO': 20, 'WARNING': 30, 'ERROR': 40}
+LOG_LEVEL = LEVELS.get(os.environ.get('LOG_LEVEL', 'INFO').upper(), LEVELS['INFO'])
+# Доля запросов, для которых на уровне DEBUG пишутся полные дампы полезной нагрузки
+PAYLOAD_SAMPLE_RATE = float(os.environ.get('LOG_PAYLOAD_SAMPLE_RATE', '0.01'))
+
+_context = threading.local()
+
+
+def is_enabled(level: str) -> bool:
+    return LEVELS[level] >= LOG_LEVEL
+
+
+def _emit(record: dict):
+    sys.stdout.write(json.dumps(record, ensure_ascii=False, default=str) + '\n')
+
+
+def log(level: str, event: str, **fields):
+    '''Одна JSON-строка; поля сериализуются, только если уровень включён'''
+    if LEVELS[level] < LOG_LEVEL:
+        return
+    _emit({'level': level, 'event': event, **getattr(_context, 'base', {}), **fields})
+
+
+def debug(event: str, **fields):
+    log('DEBUG', event, **fields)
+
+
+def info(event: str, **fields):
+    log('INFO', event, **fields)
+
+
+def warning(event: str, **fields):
+    log('WARNING', event, **fields)
+
+
+def error(event: str, **fields):
+    log('ERROR', event, **fields)
+
+
+def payload(event: str, **fields):
+    '''Дамп полезной нагрузки (персональные данные): только DEBUG и только в выбранных запросах'''
+    if LEVELS['DEBUG'] < LOG_LEVEL or not getattr(_context, 'sampled', False):
+        return
+    _emit({'level': 'DEBUG', 'event': event, **getattr(_context, 'base', {}), **fields})
+
+
+def annotate(**fields):
+    '''Добавляет поля в итоговую строку текущего запроса'''
+    fields_ = getattr(_context, 'fields', None)
+    if fields_ is not None:
+        fields_.update(fields)
+
+
+def logged(function_name: str):
+    '''Декоратор handler: одна структурированная строка на запрос со статусом и длительностью'''
+    def decorator(handler):
+        @functools.wraps(handler)
+        def wrapper(event: dict, context) -> dict:
+            _context.base = {'function': function_name}
+            _context.fields = {}
+            _context.sampled = LEVELS['DEBUG'] >= LOG_LEVEL and random.random() < PAYLOAD_SAMPLE_RATE
+            started = time.perf_counter()
+            status = 500
+            try:
+                response = handler(event, context)
+                status = response.get('statusCode', 200) if isinstance(response, dict) else 200
+                return response
+            finally:
+                level = 'ERROR' if status >= 500 else 'INFO'
+                if LEVELS[level] >= LOG_LEVEL:
+                    _emit({
+                        'level': level,
+                        'event': 'request',
+                        'function': function_name,
+                        'method': event.get('httpMethod'),
+                        'status': status,
+                        'duration_ms': round((time.perf_counter() - started) * 1000, 2),
+                        **_context.fields
+                    })
+                _context.fields = None
+                _context.sampled = False
+        return wrapper
+    return decorator
@@ -0,0 +1,68 @@
+import os
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+BASE_URL = os.environ.get('MAX_API_URL', 'https://platform-api.max.ru').rstrip('/')
+CONNECT_TIMEOUT = float(os.environ.get('MAX_API_CONNECT_TIMEOUT', '3'))
+READ_TIMEOUT = float(os.environ.get('MAX_API_READ_TIMEOUT', '10'))
+RETRIES = int(os.environ.get('MAX_API_RETRIES', '2'))
+POOL_SIZE = int(os.environ.get('MAX_API_POOL_SIZE', '4'))
+# Ответы, на которые MAX отказывает до выполнения запроса: лимит частоты и перегрузка
+POST_RETRY_STATUSES = {429, 503}
+
+# Сессия живёт на уровне модуля: keep-alive соединение с MAX API
+# переиспользуется между тёплыми вызовами, TLS рукопожатие платится один раз
+_session = None
+_session_lock = threading.Lock()
+
+
+class _Retry(Retry):
+    '''POST повторяется только по ответам, с которыми MAX запрос точно не выполнил'''
+
+    def is_retry(self, method, status_code, has_retry_after=False):
+        if method == 'POST' and status_code not in POST_RETRY_STATUSES:
+            return False
+        return super().is_retry(method, status_code, has_retry_after)
+
+
+def _build_session() -> requests.Session:
+    # Повторяем ошибки соединения и ответы 429/5xx шлюза. Таймаут чтения не повторяем,
+    # чтобы не задвоить сообщение. 502/504 не гарантируют, что MAX не обработал
+    # запрос, поэтому POST по ним не повторяется: доставку сообщений повторяет
+    # очередь bot_outbox, второй слой повторов здесь только плодил бы дубликаты
+    retry = _Retry(
+        total=RETRIES,
+        connect=RETRIES,
+        read=0,
+        status=RETRIES,
+        backoff_factor=0.3,
+        status_forcelist=(429, 502, 503, 504),
+        allowed_methods=frozenset({'GET', 'POST', 'DELETE'}),
+        respect_retry_after_header=False,
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(max_retries=retry, pool_connections=1, pool_maxsize=POOL_SIZE)
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def get_session() -> requests.Session:
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = _build_session()
+    return _session
+
+
+def request(method: str, path: str, **kwargs) -> requests.Response:
+    '''Запрос к MAX API через общую сессию с токеном бота и таймаутами'''
+    headers = kwargs.pop('headers', None) or {}
+    headers.setdefault('Authorization', os.environ.get('MAX_BOT_TOKEN'))
+    kwargs.setdefault('timeout', (CONNECT_TIMEOUT, READ_TIMEOUT))
+    return get_session().request(method, f'{BASE_URL}{path}', headers=headers, **kwargs)
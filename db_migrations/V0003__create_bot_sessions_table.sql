@@ -0,0 +1,15 @@
+-- Сессии диалога MAX бота, общие для всех инстансов webhook
+CREATE TABLE IF NOT EXISTS t_p70271656_max_bot_diagnosis.bot_sessions (
+    user_id BIGINT PRIMARY KEY,
+    data JSONB NOT NULL DEFAULT '{}',
+    version INTEGER NOT NULL DEFAULT 1,
+    expires_at TIMESTAMP NOT NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Индекс для очистки истёкших сессий
+CREATE INDEX idx_bot_sessions_expires_at ON t_p70271656_max_bot_diagnosis.bot_sessions(expires_at);
+
+COMMENT ON TABLE t_p70271656_max_bot_diagnosis.bot_sessions IS 'Состояние диалога пользователя с ботом (шаг, механик, госномер, пробег)';
+COMMENT ON COLUMN t_p70271656_max_bot_diagnosis.bot_sessions.version IS 'Версия для оптимистичной блокировки при записи из разных инстансов';
+COMMENT ON COLUMN t_p70271656_max_bot_diagnosis.bot_sessions.expires_at IS 'Момент истечения сессии';
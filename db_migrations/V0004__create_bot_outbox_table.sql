@@ -0,0 +1,20 @@
+-- Очередь исходящих сообщений MAX бота (outbox)
+CREATE TABLE IF NOT EXISTS t_p70271656_max_bot_diagnosis.bot_outbox (
+    id BIGSERIAL PRIMARY KEY,
+    user_id BIGINT NOT NULL,
+    payload JSONB NOT NULL,
+    status VARCHAR(10) NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    last_error TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    sent_at TIMESTAMP
+);
+
+-- Индексы по ожидающим отправки сообщениям: выборка пачки и порядок внутри диалога
+CREATE INDEX idx_bot_outbox_pending ON t_p70271656_max_bot_diagnosis.bot_outbox(next_attempt_at, id) WHERE status = 'pending';
+CREATE INDEX idx_bot_outbox_pending_user ON t_p70271656_max_bot_diagnosis.bot_outbox(user_id, id) WHERE status = 'pending';
+
+COMMENT ON TABLE t_p70271656_max_bot_diagnosis.bot_outbox IS 'Ответы бота, ожидающие отправки через MAX API';
+COMMENT ON COLUMN t_p70271656_max_bot_diagnosis.bot_outbox.status IS 'Статус: pending, sent, failed';
+COMMENT ON COLUMN t_p70271656_max_bot_diagnosis.bot_outbox.next_attempt_at IS 'Время следующей попытки с учётом экспоненциальной задержки';
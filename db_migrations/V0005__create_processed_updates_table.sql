@@ -0,0 +1,10 @@
+-- Обработанные обновления MAX для отсева повторных доставок
+CREATE TABLE IF NOT EXISTS t_p70271656_max_bot_diagnosis.processed_updates (
+    update_key VARCHAR(128) PRIMARY KEY,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Индекс для очистки старых ключей
+CREATE INDEX idx_processed_updates_created_at ON t_p70271656_max_bot_diagnosis.processed_updates(created_at);
+
+COMMENT ON TABLE t_p70271656_max_bot_diagnosis.processed_updates IS 'Ключи уже обработанных обновлений MAX (message:<mid>, callback:<callback_id>)';
@@ -0,0 +1,37 @@
+-- Счётчики версий данных: дешёвая проверка актуальности кэшей без чтения самих таблиц
+CREATE TABLE IF NOT EXISTS t_p70271656_max_bot_diagnosis.data_versions (
+    name VARCHAR(50) PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+COMMENT ON TABLE t_p70271656_max_bot_diagnosis.data_versions IS 'Версия каждой таблицы, увеличивается триггером при любом изменении';
+
+CREATE OR REPLACE FUNCTION t_p70271656_max_bot_diagnosis.bump_data_version() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO t_p70271656_max_bot_diagnosis.data_versions (name, version, updated_at)
+    VALUES (TG_ARGV[0], 1, CURRENT_TIMESTAMP)
+    ON CONFLICT (name) DO UPDATE
+    SET version = t_p70271656_max_bot_diagnosis.data_versions.version + 1,
+        updated_at = CURRENT_TIMESTAMP;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Список механиков читается ботом для клавиатуры выбора
+CREATE TRIGGER trg_mechanics_version
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON t_p70271656_max_bot_diagnosis.mechanics
+FOR EACH STATEMENT EXECUTE FUNCTION t_p70271656_max_bot_diagnosis.bump_data_version('mechanics');
+
+INSERT INTO t_p70271656_max_bot_diagnosis.data_versions (name, version)
+VALUES ('mechanics', 1)
+ON CONFLICT (name) DO NOTHING;
+
+-- Механики, которые раньше были зашиты в клавиатуру бота
+INSERT INTO t_p70271656_max_bot_diagnosis.mechanics (name)
+VALUES
+  ('Подкорытов С.А.'),
+  ('Костенко В.Ю.'),
+  ('Иванюта Д.И.'),
+  ('Загороднюк Н.Д.')
+ON CONFLICT (name) DO NOTHING;
@@ -0,0 +1,4 @@
+-- Составные индексы для фильтров списка диагностик: равенство по механику или типу
+-- и keyset-пагинация по (created_at, id) читаются одним диапазоном индекса
+CREATE INDEX idx_mechanic_created_at ON t_p70271656_max_bot_diagnosis.diagnostics(mechanic, created_at, id);
+CREATE INDEX idx_type_created_at ON t_p70271656_max_bot_diagnosis.diagnostics(diagnostic_type, created_at, id);
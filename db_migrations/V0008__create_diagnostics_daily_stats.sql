@@ -0,0 +1,92 @@
+-- Сводная статистика диагностик по дням, механикам и типам для дашбордов:
+-- поддерживается триггерами, поэтому учитывает любые записи — REST, бота, импорт и пакетное удаление
+CREATE TABLE IF NOT EXISTS t_p70271656_max_bot_diagnosis.diagnostics_daily_stats (
+    day DATE NOT NULL,
+    mechanic VARCHAR(100) NOT NULL,
+    diagnostic_type VARCHAR(20) NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (day, mechanic, diagnostic_type)
+);
+
+COMMENT ON TABLE t_p70271656_max_bot_diagnosis.diagnostics_daily_stats IS 'Число диагностик за день по механику и типу, обновляется триггерами на diagnostics';
+
+-- Триггеры уровня оператора с transition-таблицами: COPY на 100 тысяч строк
+-- даёт один сгруппированный upsert, а не 100 тысяч построчных
+CREATE OR REPLACE FUNCTION t_p70271656_max_bot_diagnosis.update_diagnostics_daily_stats() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('DELETE', 'UPDATE') THEN
+        UPDATE t_p70271656_max_bot_diagnosis.diagnostics_daily_stats s
+        SET count = s.count - d.count
+        FROM (
+            SELECT created_at::date AS day, mechanic, diagnostic_type, COUNT(*) AS count
+            FROM old_rows
+            WHERE created_at IS NOT NULL
+            GROUP BY 1, 2, 3
+        ) d
+        WHERE s.day = d.day AND s.mechanic = d.mechanic AND s.diagnostic_type = d.diagnostic_type;
+
+        DELETE FROM t_p70271656_max_bot_diagnosis.diagnostics_daily_stats s
+        USING (SELECT DISTINCT created_at::date AS day, mechanic, diagnostic_type FROM old_rows) d
+        WHERE s.day = d.day AND s.mechanic = d.mechanic AND s.diagnostic_type = d.diagnostic_type
+          AND s.count <= 0;
+    END IF;
+
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO t_p70271656_max_bot_diagnosis.diagnostics_daily_stats (day, mechanic, diagnostic_type, count)
+        SELECT created_at::date, mechanic, diagnostic_type, COUNT(*)
+        FROM new_rows
+        WHERE created_at IS NOT NULL
+        GROUP BY 1, 2, 3
+        ON CONFLICT (day, mechanic, diagnostic_type) DO UPDATE
+        SET count = t_p70271656_max_bot_diagnosis.diagnostics_daily_stats.count + EXCLUDED.count;
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Transition-таблицы допускаются только у триггеров на одно событие
+CREATE TRIGGER trg_diagnostics_stats_insert
+AFTER INSERT ON t_p70271656_max_bot_diagnosis.diagnostics
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION t_p70271656_max_bot_diagnosis.update_diagnostics_daily_stats();
+
+CREATE TRIGGER trg_diagnostics_stats_update
+AFTER UPDATE ON t_p70271656_max_bot_diagnosis.diagnostics
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION t_p70271656_max_bot_diagnosis.update_diagnostics_daily_stats();
+
+CREATE TRIGGER trg_diagnostics_stats_delete
+AFTER DELETE ON t_p70271656_max_bot_diagnosis.diagnostics
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION t_p70271656_max_bot_diagnosis.update_diagnostics_daily_stats();
+
+CREATE OR REPLACE FUNCTION t_p70271656_max_bot_diagnosis.clear_diagnostics_daily_stats() RETURNS trigger AS $$
+BEGIN
+    DELETE FROM t_p70271656_max_bot_diagnosis.diagnostics_daily_stats;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_diagnostics_stats_truncate
+AFTER TRUNCATE ON t_p70271656_max_bot_diagnosis.diagnostics
+FOR EACH STATEMENT EXECUTE FUNCTION t_p70271656_max_bot_diagnosis.clear_diagnostics_daily_stats();
+
+-- Полный пересчёт сводки (после ручных правок или сбоя); запись в diagnostics на время блокируется
+CREATE OR REPLACE FUNCTION t_p70271656_max_bot_diagnosis.rebuild_diagnostics_daily_stats() RETURNS integer AS $$
+DECLARE
+    rows_count integer;
+BEGIN
+    LOCK TABLE t_p70271656_max_bot_diagnosis.diagnostics IN SHARE MODE;
+    DELETE FROM t_p70271656_max_bot_diagnosis.diagnostics_daily_stats;
+    INSERT INTO t_p70271656_max_bot_diagnosis.diagnostics_daily_stats (day, mechanic, diagnostic_type, count)
+    SELECT created_at::date, mechanic, diagnostic_type, COUNT(*)
+    FROM t_p70271656_max_bot_diagnosis.diagnostics
+    WHERE created_at IS NOT NULL
+    GROUP BY 1, 2, 3;
+    GET DIAGNOSTICS rows_count = ROW_COUNT;
+    RETURN rows_count;
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT t_p70271656_max_bot_diagnosis.rebuild_diagnostics_daily_stats();
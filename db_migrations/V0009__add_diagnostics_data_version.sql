@@ -0,0 +1,8 @@
+-- Версия списка диагностик для ETag в diagnostics: увеличивается при любом изменении таблицы
+CREATE TRIGGER trg_diagnostics_version
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON t_p70271656_max_bot_diagnosis.diagnostics
+FOR EACH STATEMENT EXECUTE FUNCTION t_p70271656_max_bot_diagnosis.bump_data_version('diagnostics');
+
+INSERT INTO t_p70271656_max_bot_diagnosis.data_versions (name, version)
+VALUES ('diagnostics', 1)
+ON CONFLICT (name) DO NOTHING;
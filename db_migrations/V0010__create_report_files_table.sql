@@ -0,0 +1,12 @@
+-- PDF-отчёты в бакете: ключ объекта содержит хэш содержимого диагностики,
+-- таблица нужна, чтобы удалить файлы вместе с диагностикой
+CREATE TABLE IF NOT EXISTS t_p70271656_max_bot_diagnosis.report_files (
+    s3_key VARCHAR(255) PRIMARY KEY,
+    diagnostic_id INTEGER NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX idx_report_files_diagnostic_id ON t_p70271656_max_bot_diagnosis.report_files(diagnostic_id);
+
+COMMENT ON TABLE t_p70271656_max_bot_diagnosis.report_files IS 'Загруженные в S3 PDF-отчёты по диагностикам';
+COMMENT ON COLUMN t_p70271656_max_bot_diagnosis.report_files.s3_key IS 'Ключ объекта: reports/diagnostic_<id>_<sha256 содержимого>.pdf';
@@ -0,0 +1,16 @@
+-- Пакетная генерация PDF-отчётов: прогресс и ссылка на архив для опроса статуса
+CREATE TABLE IF NOT EXISTS t_p70271656_max_bot_diagnosis.report_jobs (
+    id UUID PRIMARY KEY,
+    status VARCHAR(20) NOT NULL DEFAULT 'running' CHECK (status IN ('running', 'done', 'failed')),
+    total INTEGER NOT NULL,
+    done INTEGER NOT NULL DEFAULT 0,
+    params JSONB NOT NULL,
+    result_key VARCHAR(255),
+    error TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+COMMENT ON TABLE t_p70271656_max_bot_diagnosis.report_jobs IS 'Задания пакетной генерации отчётов: running -> done | failed';
+COMMENT ON COLUMN t_p70271656_max_bot_diagnosis.report_jobs.params IS 'Выборка диагностик: список id или фильтры mechanic, diagnosticType, dateFrom, dateTo';
+COMMENT ON COLUMN t_p70271656_max_bot_diagnosis.report_jobs.result_key IS 'Ключ ZIP-архива с отчётами в бакете';
@@ -0,0 +1,12 @@
+-- Ведро токенов на пользователя MAX: общий для всех инстансов max-webhook счётчик,
+-- обновляется одним upsert на обновление. Строк столько, сколько пользователей бота
+CREATE TABLE IF NOT EXISTS t_p70271656_max_bot_diagnosis.rate_limits (
+    user_id BIGINT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    allowed BOOLEAN NOT NULL DEFAULT TRUE,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+COMMENT ON TABLE t_p70271656_max_bot_diagnosis.rate_limits IS 'Ограничение частоты обновлений от пользователя MAX (token bucket)';
+COMMENT ON COLUMN t_p70271656_max_bot_diagnosis.rate_limits.tokens IS 'Остаток токенов на момент updated_at';
+COMMENT ON COLUMN t_p70271656_max_bot_diagnosis.rate_limits.allowed IS 'Решение по последнему обновлению';
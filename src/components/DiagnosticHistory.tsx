@@ -21,28 +21,104 @@ const diagnosticTypeLabels: Record<string, string> = {
   'des': 'ДЭС'
 };
 
+const DIAGNOSTICS_URL = 'https://functions.poehali.dev/e76024e1-4735-4e57-bf5f-060276b574c8';
+const MECHANICS_URL = 'https://functions.poehali.dev/47f92079-1392-4766-911a-8aa94a4d8db9';
+const REPORTS_URL = 'https://functions.poehali.dev/65879cb6-37f7-4a96-9bdc-04cfe5915ba6';
+
 const DiagnosticHistory = () => {
   const { toast } = useToast();
   const [diagnostics, setDiagnostics] = useState<Diagnostic[]>([]);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
   const [loading, setLoading] = useState(true);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [searchQuery, setSearchQuery] = useState('');
   const [selectedMechanic, setSelectedMechanic] = useState<string>('');
+  const [selectedType, setSelectedType] = useState<string>('');
+  const [dateFrom, setDateFrom] = useState('');
+  const [dateTo, setDateTo] = useState('');
+  const [total, setTotal] = useState(0);
+  const [mechanics, setMechanics] = useState<string[]>([]);
+  const [exporting, setExporting] = useState(false);
+  const [batchProgress, setBatchProgress] = useState<string | null>(null);
 
   useEffect(() => {
-    loadDiagnostics();
+    loadMechanics();
   }, []);
 
+  useEffect(() => {
+    loadDiagnostics();
+  }, [selectedMechanic, selectedType, dateFrom, dateTo]);
+
+  const buildFilterParams = () => {
+    const params = new URLSearchParams();
+    if (selectedMechanic) params.set('mechanic', selectedMechanic);
+    if (selectedType) params.set('diagnosticType', selectedType);
+    if (dateFrom) params.set('dateFrom', dateFrom);
+    if (dateTo) params.set('dateTo', dateTo);
+    return params;
+  };
+
+  const buildQuery = (cursor?: string) => {
+    const params = buildFilterParams();
+    params.set('limit', '100');
+    if (cursor) params.set('cursor', cursor);
+    return `${DIAGNOSTICS_URL}?${params.toString()}`;
+  };
+
+  const handleExport = async (format: 'csv' | 'xlsx') => {
+    setExporting(true);
+    try {
+      const params = buildFilterParams();
+      params.set('action', 'export');
+      params.set('format', format);
+      const response = await fetch(`${DIAGNOSTICS_URL}?${params.toString()}`);
+      
+      if (!response.ok) {
+        throw new Error('Ошибка выгрузки');
+      }
+      
+      const data = await response.json();
+      window.open(data.url, '_blank');
+      
+      toast({
+        title: 'Готово!',
+        description: `Выгружено диагностик: ${data.rows}`
+      });
+    } catch (error) {
+      toast({
+        title: 'Ошибка',
+        description: 'Не удалось выгрузить диагностики',
+        variant: 'destructive'
+      });
+    } finally {
+      setExporting(false);
+    }
+  };
+
+  const loadMechanics = async () => {
+    try {
+      const response = await fetch(MECHANICS_URL);
+      if (!response.ok) throw new Error('Ошибка загрузки');
+      const data = await response.json();
+      setMechanics(data.map((m: { name: string }) => m.name));
+    } catch (error) {
+      setMechanics([]);
+    }
+  };
+
   const loadDiagnostics = async () => {
     setLoading(true);
     try {
-      const response = await fetch('https://functions.poehali.dev/e76024e1-4735-4e57-bf5f-060276b574c8?limit=100');
+      const response = await fetch(buildQuery());
       
       if (!response.ok) {
         throw new Error('Ошибка загрузки');
       }
       
       const data = await response.json();
-      setDiagnostics(data);
+      setDiagnostics(data.items);
+      setNextCursor(data.nextCursor);
+      setTotal(data.total);
     } catch (error) {
       toast({
         title: 'Ошибка',
@@ -54,16 +130,86 @@ const DiagnosticHistory = () => {
     }
   };
 
+  const loadMoreDiagnostics = async () => {
+    if (!nextCursor) return;
+    setLoadingMore(true);
+    try {
+      const response = await fetch(buildQuery(nextCursor));
+      
+      if (!response.ok) {
+        throw new Error('Ошибка загрузки');
+      }
+      
+      const data = await response.json();
+      setDiagnostics(prev => [...prev, ...data.items]);
+      setNextCursor(data.nextCursor);
+    } catch (error) {
+      toast({
+        title: 'Ошибка',
+        description: 'Не удалось загрузить историю диагностик',
+        variant: 'destructive'
+      });
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
+  const handleBatchReports = async () => {
+    const jobId = crypto.randomUUID();
+    const filters = Object.fromEntries(buildFilterParams().entries());
+    setBatchProgress('0%');
+    // Пока задание выполняется, прогресс читается из статуса задания
+    const timer = setInterval(async () => {
+      try {
+        const response = await fetch(`${REPORTS_URL}?job=${jobId}`);
+        if (!response.ok) return;
+        const job = await response.json();
+        if (job.total) setBatchProgress(`${Math.round(job.done * 100 / job.total)}%`);
+      } catch (error) {
+        // статус недоступен — ждём ответа основного запроса
+      }
+    }, 1000);
+    try {
+      const response = await fetch(`${REPORTS_URL}?action=batch`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ jobId, ...filters })
+      });
+      
+      const data = await response.json();
+      if (!response.ok) {
+        throw new Error(data.error || 'Ошибка генерации');
+      }
+      
+      window.open(data.url, '_blank');
+      toast({
+        title: 'Готово!',
+        description: `Архив с отчётами: ${data.done}`
+      });
+    } catch (error) {
+      toast({
+        title: 'Ошибка',
+        description: error instanceof Error ? error.message : 'Не удалось создать архив отчётов',
+        variant: 'destructive'
+      });
+    } finally {
+      clearInterval(timer);
+      setBatchProgress(null);
+    }
+  };
+
   const handleGenerateReport = async (id: number) => {
     try {
-      const response = await fetch(`https://functions.poehali.dev/65879cb6-37f7-4a96-9bdc-04cfe5915ba6?id=${id}`);
+      // PDF приходит в теле ответа — без загрузки в бакет и повторного скачивания
+      const response = await fetch(`https://functions.poehali.dev/65879cb6-37f7-4a96-9bdc-04cfe5915ba6?id=${id}&delivery=inline`);
       
       if (!response.ok) {
         throw new Error('Ошибка генерации');
       }
       
-      const data = await response.json();
-      window.open(data.pdfUrl, '_blank');
+      const pdfUrl = URL.createObjectURL(await response.blob());
+      window.open(pdfUrl, '_blank');
+      setTimeout(() => URL.revokeObjectURL(pdfUrl), 60000);
       
       toast({
         title: 'Готово!',
@@ -78,17 +224,11 @@ const DiagnosticHistory = () => {
     }
   };
 
-  const filteredDiagnostics = diagnostics.filter(d => {
-    const matchesSearch = 
-      d.carNumber.toLowerCase().includes(searchQuery.toLowerCase()) ||
-      d.mechanic.toLowerCase().includes(searchQuery.toLowerCase());
-    
-    const matchesMechanic = !selectedMechanic || d.mechanic === selectedMechanic;
-    
-    return matchesSearch && matchesMechanic;
-  });
-
-  const uniqueMechanics = Array.from(new Set(diagnostics.map(d => d.mechanic)));
+  // Механик, тип и период фильтруются на сервере; поиск — по уже загруженным строкам
+  const filteredDiagnostics = diagnostics.filter(d =>
+    d.carNumber.toLowerCase().includes(searchQuery.toLowerCase()) ||
+    d.mechanic.toLowerCase().includes(searchQuery.toLowerCase())
+  );
 
   const formatDate = (dateString: string) => {
     const date = new Date(dateString);
@@ -101,7 +241,7 @@ const DiagnosticHistory = () => {
     });
   };
 
-  if (loading) {
+  if (loading && diagnostics.length === 0) {
     return (
       <div className="flex items-center justify-center min-h-[400px]">
         <div className="text-center space-y-3">
@@ -140,7 +280,7 @@ const DiagnosticHistory = () => {
               >
                 Все
               </Button>
-              {uniqueMechanics.map(mechanic => (
+              {mechanics.map(mechanic => (
                 <Button
                   key={mechanic}
                   variant={selectedMechanic === mechanic ? 'default' : 'outline'}
@@ -154,8 +294,80 @@ const DiagnosticHistory = () => {
             </div>
           </div>
 
+          <div className="flex flex-col sm:flex-row gap-3">
+            <div className="flex gap-2 flex-wrap">
+              <Button
+                variant={selectedType === '' ? 'default' : 'outline'}
+                onClick={() => setSelectedType('')}
+                size="sm"
+                className={selectedType === '' ? '' : 'bg-slate-800 border-slate-700 text-white hover:bg-slate-700'}
+              >
+                Все типы
+              </Button>
+              {Object.entries(diagnosticTypeLabels).map(([type, label]) => (
+                <Button
+                  key={type}
+                  variant={selectedType === type ? 'default' : 'outline'}
+                  onClick={() => setSelectedType(type)}
+                  size="sm"
+                  className={selectedType === type ? '' : 'bg-slate-800 border-slate-700 text-white hover:bg-slate-700'}
+                >
+                  {label}
+                </Button>
+              ))}
+            </div>
+            <div className="flex gap-2 items-center">
+              <Input
+                type="date"
+                value={dateFrom}
+                onChange={(e) => setDateFrom(e.target.value)}
+                className="bg-slate-800 border-slate-700 text-white"
+              />
+              <span className="text-slate-500">—</span>
+              <Input
+                type="date"
+                value={dateTo}
+                onChange={(e) => setDateTo(e.target.value)}
+                className="bg-slate-800 border-slate-700 text-white"
+              />
+            </div>
+          </div>
+
+          <div className="flex gap-2">
+            <Button
+              onClick={() => handleExport('csv')}
+              disabled={exporting}
+              variant="outline"
+              size="sm"
+              className="bg-slate-800 border-slate-700 text-white hover:bg-slate-700"
+            >
+              <Icon name="Download" size={16} className="mr-2" />
+              CSV
+            </Button>
+            <Button
+              onClick={() => handleExport('xlsx')}
+              disabled={exporting}
+              variant="outline"
+              size="sm"
+              className="bg-slate-800 border-slate-700 text-white hover:bg-slate-700"
+            >
+              <Icon name="FileSpreadsheet" size={16} className="mr-2" />
+              XLSX
+            </Button>
+            <Button
+              onClick={handleBatchReports}
+              disabled={batchProgress !== null || (!selectedMechanic && !selectedType && !dateFrom && !dateTo)}
+              variant="outline"
+              size="sm"
+              className="bg-slate-800 border-slate-700 text-white hover:bg-slate-700"
+            >
+              <Icon name="FileArchive" size={16} className="mr-2" />
+              {batchProgress !== null ? `PDF в ZIP: ${batchProgress}` : 'PDF в ZIP'}
+            </Button>
+          </div>
+
           <div className="text-sm text-slate-400">
-            Найдено: {filteredDiagnostics.length} из {diagnostics.length}
+            Найдено: {total}{searchQuery && `, по запросу: ${filteredDiagnostics.length} из ${diagnostics.length} загруженных`}
           </div>
         </CardContent>
       </Card>
@@ -217,6 +429,20 @@ const DiagnosticHistory = () => {
           ))
         )}
       </div>
+
+      {nextCursor && (
+        <div className="flex justify-center">
+          <Button
+            onClick={loadMoreDiagnostics}
+            disabled={loadingMore}
+            variant="outline"
+            className="bg-slate-800 border-slate-700 text-white hover:bg-slate-700"
+          >
+            <Icon name="ChevronDown" size={16} className="mr-2" />
+            {loadingMore ? 'Загрузка...' : 'Показать ещё'}
+          </Button>
+        </div>
+      )}
     </div>
   );
 };
@@ -6,6 +6,7 @@ import { Card, CardContent, CardHeader, CardTitle, CardDescription } from '@/com
 import { useToast } from '@/hooks/use-toast';
 import Icon from '@/components/ui/icon';
 import { Badge } from '@/components/ui/badge';
+import { Checkbox } from '@/components/ui/checkbox';
 
 const Admin = () => {
   const navigate = useNavigate();
@@ -14,21 +15,39 @@ const Admin = () => {
   const [subscriptions, setSubscriptions] = useState<any[]>([]);
   const [mechanics, setMechanics] = useState<any[]>([]);
   const [diagnostics, setDiagnostics] = useState<any[]>([]);
+  const [selectedDiagnostics, setSelectedDiagnostics] = useState<number[]>([]);
   const [newMechanicName, setNewMechanicName] = useState('');
 
   useEffect(() => {
     const token = localStorage.getItem('admin_token');
-    if (!token) {
+    const expiresAt = Number(localStorage.getItem('admin_token_expires') || 0);
+    if (!token || expiresAt * 1000 < Date.now()) {
       navigate('/login');
     }
   }, [navigate]);
 
   const handleLogout = () => {
     localStorage.removeItem('admin_token');
+    localStorage.removeItem('admin_token_expires');
     toast({ title: 'Выход выполнен' });
     navigate('/login');
   };
 
+  // Изменения механиков и диагностик сервер принимает только с токеном из auth
+  const authHeaders = (): Record<string, string> => ({
+    'X-Auth-Token': localStorage.getItem('admin_token') || ''
+  });
+
+  const checkAuth = (response: Response) => {
+    if (response.status === 401) {
+      localStorage.removeItem('admin_token');
+      localStorage.removeItem('admin_token_expires');
+      toast({ title: 'Сессия истекла', description: 'Войдите снова', variant: 'destructive' });
+      navigate('/login');
+      throw new Error('Требуется вход');
+    }
+  };
+
   const webhookUrl = 'https://functions.poehali.dev/f48b0eea-37b1-4cf5-a470-aa20ae0fd775';
   const setupUrl = 'https://functions.poehali.dev/8e7d060d-23fb-4628-88e9-e251279d6a28';
 
@@ -122,7 +141,8 @@ const Admin = () => {
       const response = await fetch('https://functions.poehali.dev/e76024e1-4735-4e57-bf5f-060276b574c8');
       if (!response.ok) throw new Error('Ошибка загрузки');
       const data = await response.json();
-      setDiagnostics(data);
+      setDiagnostics(data.items);
+      setSelectedDiagnostics([]);
     } catch (error) {
       toast({ title: 'Ошибка', description: 'Не удалось загрузить диагностики', variant: 'destructive' });
     }
@@ -137,10 +157,11 @@ const Admin = () => {
     try {
       const response = await fetch('https://functions.poehali.dev/47f92079-1392-4766-911a-8aa94a4d8db9', {
         method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
+        headers: { 'Content-Type': 'application/json', ...authHeaders() },
         body: JSON.stringify({ name: newMechanicName })
       });
       
+      checkAuth(response);
       if (!response.ok) throw new Error('Ошибка добавления');
       
       toast({ title: 'Готово', description: 'Механик добавлен' });
@@ -154,9 +175,11 @@ const Admin = () => {
   const deleteMechanic = async (id: number) => {
     try {
       const response = await fetch(`https://functions.poehali.dev/47f92079-1392-4766-911a-8aa94a4d8db9?id=${id}`, {
-        method: 'DELETE'
+        method: 'DELETE',
+        headers: authHeaders()
       });
       
+      checkAuth(response);
       if (!response.ok) throw new Error('Ошибка удаления');
       
       toast({ title: 'Готово', description: 'Механик удалён' });
@@ -169,9 +192,11 @@ const Admin = () => {
   const deleteDiagnostic = async (id: number) => {
     try {
       const response = await fetch(`https://functions.poehali.dev/e76024e1-4735-4e57-bf5f-060276b574c8?id=${id}`, {
-        method: 'DELETE'
+        method: 'DELETE',
+        headers: authHeaders()
       });
       
+      checkAuth(response);
       if (!response.ok) throw new Error('Ошибка удаления');
       
       toast({ title: 'Готово', description: 'Диагностика удалена' });
@@ -181,6 +206,30 @@ const Admin = () => {
     }
   };
 
+  const toggleDiagnostic = (id: number, checked: boolean) => {
+    setSelectedDiagnostics(prev => checked ? [...prev, id] : prev.filter(selectedId => selectedId !== id));
+  };
+
+  const deleteSelectedDiagnostics = async () => {
+    if (selectedDiagnostics.length === 0) return;
+    try {
+      const response = await fetch('https://functions.poehali.dev/e76024e1-4735-4e57-bf5f-060276b574c8', {
+        method: 'DELETE',
+        headers: { 'Content-Type': 'application/json', ...authHeaders() },
+        body: JSON.stringify({ ids: selectedDiagnostics })
+      });
+      
+      checkAuth(response);
+      if (!response.ok) throw new Error('Ошибка удаления');
+      
+      const data = await response.json();
+      toast({ title: 'Готово', description: `Удалено диагностик: ${data.deleted}` });
+      await loadDiagnostics();
+    } catch (error) {
+      toast({ title: 'Ошибка', description: 'Не удалось удалить диагностики', variant: 'destructive' });
+    }
+  };
+
   useEffect(() => {
     loadMechanics();
     loadDiagnostics();
@@ -372,6 +421,14 @@ const Admin = () => {
               Диагностики
             </CardTitle>
             <CardDescription>История сохранённых диагностик</CardDescription>
+            {selectedDiagnostics.length > 0 && (
+              <div className="pt-2">
+                <Button size="sm" variant="destructive" onClick={deleteSelectedDiagnostics}>
+                  <Icon name="Trash2" size={16} className="mr-2" />
+                  Удалить выбранные ({selectedDiagnostics.length})
+                </Button>
+              </div>
+            )}
           </CardHeader>
           <CardContent>
             <div className="space-y-3">
@@ -384,6 +441,11 @@ const Admin = () => {
                 diagnostics.map((diagnostic) => (
                   <div key={diagnostic.id} className="bg-slate-900/50 rounded-lg p-4 border border-slate-700">
                     <div className="flex items-start justify-between gap-3">
+                      <Checkbox
+                        checked={selectedDiagnostics.includes(diagnostic.id)}
+                        onCheckedChange={(checked) => toggleDiagnostic(diagnostic.id, checked === true)}
+                        className="mt-1 border-slate-600"
+                      />
                       <div className="flex-1 space-y-2">
                         <div className="flex items-center gap-2">
                           <Badge variant="outline" className="bg-primary/10 text-primary border-primary/30">
@@ -28,6 +28,7 @@ const Login = () => {
 
       if (response.ok && data.success) {
         localStorage.setItem('admin_token', data.token);
+        localStorage.setItem('admin_token_expires', String(data.expiresAt));
         toast({ title: 'Успешно!', description: 'Добро пожаловать' });
         navigate('/admin');
       } else {
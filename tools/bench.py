@@ -0,0 +1,364 @@
+'''Нагрузочный прогон handler'ов из backend/ на локальном PostgreSQL и заглушках MAX/S3.
+
+    python tools/bench.py --database-url postgresql://postgres@localhost/bench \\
+        --users 50 --concurrency 4 --json bench.json
+
+Сценарии:
+  webhook      — воспроизведение записанных диалогов (tools/bench_data/max_webhook_flow.json)
+                 через max-webhook, каждый виртуальный пользователь проходит диалог целиком
+  dispatcher   — разбор накопленной очереди ответов функцией max-dispatcher
+  diagnostics  — создание, выборка списка и по id, удаление
+  mechanics    — список, добавление, удаление
+  report       — генерация PDF отчётов по созданным диагностикам
+
+Для каждой операции печатаются p50/p95/p99, пропускная способность и среднее время
+по стадиям: db (запросы и коммиты PostgreSQL), http (MAX API и S3), pdf (сборка reportlab).
+Схема из db_migrations/ применяется автоматически, если её ещё нет (--reset-schema пересоздаёт).
+'''
+import argparse
+import copy
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import functions  # noqa: E402
+import stub_servers  # noqa: E402
+
+STAGES = ('db', 'http', 'pdf')
+SCENARIOS = ('webhook', 'dispatcher', 'diagnostics', 'mechanics', 'report')
+FLOW_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_data', 'max_webhook_flow.json')
+
+# Администратор для изменяющих запросов; токен выдаёт auth в начале прогона
+ADMIN_USERNAME = 'bench-admin'
+ADMIN_PASSWORD = 'bench-password'
+_admin_headers = {}
+
+_stages = threading.local()
+
+
+def _stage_add(stage: str, seconds: float):
+    totals = getattr(_stages, 'totals', None)
+    if totals is not None:
+        totals[stage] += seconds
+
+
+def _timed(stage: str, func):
+    '''Оборачивает функцию замером стадии; вложенные вызовы той же стадии не считаются дважды'''
+    def wrapper(*args, **kwargs):
+        depth = getattr(_stages, stage, 0)
+        setattr(_stages, stage, depth + 1)
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            setattr(_stages, stage, depth)
+            if depth == 0:
+                _stage_add(stage, time.perf_counter() - started)
+    return wrapper
+
+
+def instrument():
+    '''Подключает замер стадий к psycopg2, urllib3 (requests и boto3) и reportlab'''
+    import psycopg2
+    import psycopg2.extensions
+    import urllib3.connectionpool
+
+    class TimingCursor(psycopg2.extensions.cursor):
+        execute = _timed('db', psycopg2.extensions.cursor.execute)
+        executemany = _timed('db', psycopg2.extensions.cursor.executemany)
+        copy_expert = _timed('db', psycopg2.extensions.cursor.copy_expert)
+        fetchmany = _timed('db', psycopg2.extensions.cursor.fetchmany)
+
+    class TimingConnection(psycopg2.extensions.connection):
+        commit = _timed('db', psycopg2.extensions.connection.commit)
+        rollback = _timed('db', psycopg2.extensions.connection.rollback)
+
+        def cursor(self, *args, **kwargs):
+            kwargs.setdefault('cursor_factory', TimingCursor)
+            return super().cursor(*args, **kwargs)
+
+    connect = psycopg2.connect
+
+    def timing_connect(*args, **kwargs):
+        kwargs.setdefault('connection_factory', TimingConnection)
+        return connect(*args, **kwargs)
+
+    psycopg2.connect = _timed('db', timing_connect)
+    pool_class = urllib3.connectionpool.HTTPConnectionPool
+    pool_class.urlopen = _timed('http', pool_class.urlopen)
+
+    try:
+        from reportlab.platypus import doctemplate
+    except ImportError:
+        return
+    doctemplate.BaseDocTemplate.build = _timed('pdf', doctemplate.BaseDocTemplate.build)
+
+
+class Recorder:
+    def __init__(self):
+        self.samples = []
+        self.lock = threading.Lock()
+        self.walls = {}
+
+    def call(self, scenario: str, label: str, handler, event: dict) -> dict:
+        _stages.totals = dict.fromkeys(STAGES, 0.0)
+        started = time.perf_counter()
+        try:
+            response = handler(event, None)
+            status = response.get('statusCode', 200)
+        except Exception as e:
+            response, status = {'error': str(e)}, 599
+        elapsed = time.perf_counter() - started
+        stages, _stages.totals = _stages.totals, None
+        with self.lock:
+            self.samples.append((scenario, label, elapsed, status, stages))
+        return response
+
+    def phase(self, scenario: str):
+        recorder = self
+
+        class Phase:
+            def __enter__(self):
+                self.started = time.perf_counter()
+
+            def __exit__(self, *exc):
+                recorder.walls[scenario] = recorder.walls.get(scenario, 0) + time.perf_counter() - self.started
+
+        return Phase()
+
+
+def percentile(sorted_values: list, q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(q * (len(sorted_values) - 1)))))
+    return sorted_values[index]
+
+
+def summarize(recorder: Recorder) -> list:
+    groups = {}
+    for scenario, label, elapsed, status, stages in recorder.samples:
+        groups.setdefault((scenario, label), []).append((elapsed, status, stages))
+    rows = []
+    for (scenario, label), samples in groups.items():
+        latencies = sorted(s[0] for s in samples)
+        wall = recorder.walls.get(scenario) or sum(latencies)
+        rows.append({
+            'scenario': scenario,
+            'operation': label,
+            'count': len(samples),
+            'errors': sum(1 for s in samples if s[1] >= 500),
+            'throughput_rps': round(len(samples) / wall, 1) if wall else 0.0,
+            'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+            'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+            'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+            **{
+                f'{stage}_ms': round(sum(s[2][stage] for s in samples) / len(samples) * 1000, 2)
+                for stage in STAGES
+            }
+        })
+    order = {name: i for i, name in enumerate(SCENARIOS)}
+    rows.sort(key=lambda r: (order.get(r['scenario'], len(order)), r['operation']))
+    return rows
+
+
+def print_table(rows: list):
+    columns = ['scenario', 'operation', 'count', 'errors', 'throughput_rps',
+               'p50_ms', 'p95_ms', 'p99_ms', 'db_ms', 'http_ms', 'pdf_ms']
+    widths = {c: max(len(c), *(len(str(r[c])) for r in rows)) for c in columns} if rows else {}
+    print('  '.join(c.ljust(widths[c]) for c in columns))
+    for row in rows:
+        print('  '.join(str(row[c]).ljust(widths[c]) for c in columns))
+
+
+def event(method: str, body=None, query: dict = None, admin: bool = False) -> dict:
+    headers = {'Content-Type': 'application/json'}
+    if admin:
+        headers.update(_admin_headers)
+    return {
+        'httpMethod': method,
+        'headers': headers,
+        'queryStringParameters': query or {},
+        'body': json.dumps(body, ensure_ascii=False) if body is not None else '',
+        'isBase64Encoded': False
+    }
+
+
+def _substitute(value, user_id: int, update_ids):
+    if isinstance(value, dict):
+        return {k: _substitute(v, user_id, update_ids) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_substitute(v, user_id, update_ids) for v in value]
+    if value == '{user_id}':
+        return user_id
+    if value == '{update_id}':
+        return f'bench.{next(update_ids)}'
+    return value
+
+
+def run_webhook(recorder: Recorder, args, run_id: int):
+    webhook = functions.load_function('max-webhook').handler
+    with open(FLOW_PATH, encoding='utf-8') as f:
+        flow = json.load(f)['updates']
+    # next() у itertools.count атомарен под GIL, счётчик общий для всех потоков
+    update_ids = itertools.count(run_id * 10 ** 7)
+
+    def replay(user_index: int):
+        user_id = run_id * 10 ** 5 + user_index
+        for item in flow:
+            update = _substitute(copy.deepcopy(item['update']), user_id, update_ids)
+            label = f"{update['update_type']}:{item['step']}"
+            recorder.call('webhook', label, webhook, event('POST', update))
+
+    with recorder.phase('webhook'), ThreadPoolExecutor(args.concurrency) as pool:
+        list(pool.map(replay, range(args.users)))
+
+
+def run_dispatcher(recorder: Recorder, args):
+    dispatcher = functions.load_function('max-dispatcher').handler
+    with recorder.phase('dispatcher'):
+        while True:
+            response = recorder.call('dispatcher', 'drain', dispatcher, event('POST', query={'window': '0'}))
+            if response.get('statusCode') != 200 or not json.loads(response['body']).get('claimed'):
+                break
+
+
+def run_diagnostics(recorder: Recorder, args) -> list:
+    diagnostics = functions.load_function('diagnostics').handler
+    created = []
+    lock = threading.Lock()
+
+    def cycle(i: int):
+        response = recorder.call('diagnostics', 'POST create', diagnostics, event('POST', {
+            'mechanic': 'Bench Mechanic',
+            'carNumber': f'B{i:05d}NC',
+            'mileage': 1000 + i,
+            'diagnosticType': ('5min', 'dhch', 'des')[i % 3]
+        }))
+        if response.get('statusCode') == 201:
+            diagnostic_id = json.loads(response['body'])['id']
+            with lock:
+                created.append(diagnostic_id)
+            recorder.call('diagnostics', 'GET by id', diagnostics, event('GET', query={'id': str(diagnostic_id)}))
+        recorder.call('diagnostics', 'GET list', diagnostics, event('GET', query={'limit': '50'}))
+
+    with recorder.phase('diagnostics'), ThreadPoolExecutor(args.concurrency) as pool:
+        list(pool.map(cycle, range(args.requests)))
+    return created
+
+
+def run_mechanics(recorder: Recorder, args, run_id: int):
+    mechanics = functions.load_function('mechanics').handler
+
+    def cycle(i: int):
+        recorder.call('mechanics', 'GET list', mechanics, event('GET'))
+        response = recorder.call('mechanics', 'POST create', mechanics, event('POST', {'name': f'Bench {run_id}-{i}'}, admin=True))
+        if response.get('statusCode') == 201:
+            mechanic_id = json.loads(response['body'])['id']
+            recorder.call('mechanics', 'DELETE', mechanics, event('DELETE', query={'id': str(mechanic_id)}, admin=True))
+
+    with recorder.phase('mechanics'), ThreadPoolExecutor(args.concurrency) as pool:
+        list(pool.map(cycle, range(args.requests)))
+
+
+def run_report(recorder: Recorder, args, diagnostic_ids: list):
+    report = functions.load_function('generate-report').handler
+    ids = diagnostic_ids[:args.reports] or [1]
+
+    def generate(diagnostic_id: int):
+        recorder.call('report', 'GET pdf', report, event('GET', query={'id': str(diagnostic_id)}))
+        # Повторный запрос того же отчёта отдаётся из кэша без сборки PDF
+        recorder.call('report', 'GET pdf cached', report, event('GET', query={'id': str(diagnostic_id)}))
+        # PDF в теле ответа, без бакета
+        recorder.call('report', 'GET pdf inline', report, event('GET', query={'id': str(diagnostic_id), 'delivery': 'inline'}))
+
+    with recorder.phase('report'), ThreadPoolExecutor(args.concurrency) as pool:
+        list(pool.map(generate, ids))
+
+
+def login(recorder: Recorder):
+    auth = functions.load_function('auth').handler
+    response = recorder.call('auth', 'POST login', auth, event('POST', {'username': ADMIN_USERNAME, 'password': ADMIN_PASSWORD}))
+    _admin_headers['X-Auth-Token'] = json.loads(response['body'])['token']
+
+
+def cleanup_diagnostics(args, diagnostic_ids: list):
+    diagnostics = functions.load_function('diagnostics').handler
+    for diagnostic_id in diagnostic_ids:
+        diagnostics(event('DELETE', query={'id': str(diagnostic_id)}, admin=True), None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', default=os.environ.get('DATABASE_URL'),
+                        help='локальный PostgreSQL (по умолчанию DATABASE_URL)')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS),
+                        help=f'через запятую из: {", ".join(SCENARIOS)}')
+    parser.add_argument('--users', type=int, default=20, help='виртуальных пользователей бота')
+    parser.add_argument('--requests', type=int, default=50, help='циклов на REST-сценарий')
+    parser.add_argument('--reports', type=int, default=20, help='сколько PDF сгенерировать')
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--max-latency', type=float, default=0, help='задержка заглушки MAX API, секунды')
+    parser.add_argument('--s3-latency', type=float, default=0, help='задержка заглушки S3, секунды')
+    parser.add_argument('--reset-schema', action='store_true', help='пересоздать схему перед прогоном')
+    parser.add_argument('--log-level', default='WARNING', help='LOG_LEVEL для функций')
+    parser.add_argument('--json', help='сохранить сводку в файл')
+    args = parser.parse_args()
+
+    if not args.database_url:
+        parser.error('нужен --database-url или DATABASE_URL')
+    scenarios = [s.strip() for s in args.scenarios.split(',') if s.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f'неизвестные сценарии: {", ".join(sorted(unknown))}')
+
+    functions.apply_migrations(args.database_url, reset=args.reset_schema)
+    max_stub = stub_servers.start_max_stub(latency=args.max_latency)
+    s3_stub = stub_servers.start_s3_stub(latency=args.s3_latency)
+    os.environ.update({
+        'DATABASE_URL': args.database_url,
+        'MAIN_DB_SCHEMA': functions.MIGRATIONS_SCHEMA,
+        'MAX_API_URL': max_stub.url,
+        'MAX_BOT_TOKEN': 'bench-token',
+        'S3_ENDPOINT_URL': s3_stub.url,
+        'AWS_ACCESS_KEY_ID': 'bench',
+        'AWS_SECRET_ACCESS_KEY': 'bench',
+        'LOG_LEVEL': args.log_level,
+        'DB_POOL_MAX_SIZE': str(args.concurrency + 1),
+        'ADMIN_USERNAME': ADMIN_USERNAME,
+        'ADMIN_PASSWORD': ADMIN_PASSWORD,
+        'ADMIN_TOKEN_SECRET': os.environ.get('ADMIN_TOKEN_SECRET') or 'bench-secret'
+    })
+    instrument()
+
+    recorder = Recorder()
+    login(recorder)
+    run_id = int(time.time()) % 10 ** 4
+    diagnostic_ids = []
+    if 'webhook' in scenarios:
+        run_webhook(recorder, args, run_id)
+    if 'dispatcher' in scenarios:
+        run_dispatcher(recorder, args)
+    if 'diagnostics' in scenarios or 'report' in scenarios:
+        diagnostic_ids = run_diagnostics(recorder, args)
+    if 'mechanics' in scenarios:
+        run_mechanics(recorder, args, run_id)
+    if 'report' in scenarios:
+        run_report(recorder, args, diagnostic_ids)
+    cleanup_diagnostics(args, diagnostic_ids)
+
+    rows = summarize(recorder)
+    print_table(rows)
+    print(f'\nMAX stub: {max_stub.requests_total} requests, S3 stub: {s3_stub.requests_total} requests')
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'args': vars(args), 'results': rows}, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+'''Замер времени планирования горячих запросов: обычный execute против PREPARE из db.py.
+
+    python tools/bench_prepared.py --database-url postgresql://postgres@localhost/bench \\
+        --rows 20000 --repeat 500 --json prepared.json
+
+Запросы — те же тексты, что выполняют diagnostics, generate-report и max-webhook:
+  insert       — сохранение диагностики (в транзакции, которая откатывается);
+  get_by_id    — диагностика по id;
+  list_first   — первая страница списка;
+  list_filter  — страница по типу диагностики с курсора.
+Для каждого печатается среднее время вызова с клиента (plain_ms / prepared_ms) и
+Planning Time из EXPLAIN (ANALYZE, SUMMARY) для обычного запроса и для EXECUTE
+подготовленного — разница и есть работа планировщика, которую PREPARE снимает
+с каждого вызова. Если в таблице меньше --rows строк, недостающие добавляются.
+'''
+import argparse
+import json
+import os
+import re
+import statistics
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import functions  # noqa: E402
+
+SCHEMA = functions.MIGRATIONS_SCHEMA
+COLUMNS = 'id, mechanic, car_number, mileage, diagnostic_type, created_at'
+PAGE_SIZE = 50
+
+
+def queries(cursor_at: datetime, cursor_id: int, diagnostic_id: int) -> dict:
+    '''{имя: (sql, params)} в том виде, в каком их строят handler'ы'''
+    return {
+        'insert': (
+            f"INSERT INTO {SCHEMA}.diagnostics (mechanic, car_number, mileage, diagnostic_type) "
+            f"VALUES (%s, %s, %s, %s) RETURNING id, created_at",
+            ('Подкорытов С.А.', 'A159BK124', 150000, '5min')
+        ),
+        'get_by_id': (
+            f"SELECT {COLUMNS} FROM {SCHEMA}.diagnostics WHERE id = %s",
+            (diagnostic_id,)
+        ),
+        'list_first': (
+            f"SELECT {COLUMNS} FROM {SCHEMA}.diagnostics "
+            f"ORDER BY created_at DESC, id DESC LIMIT {PAGE_SIZE + 1}",
+            ()
+        ),
+        'list_filter': (
+            f"SELECT {COLUMNS} FROM {SCHEMA}.diagnostics "
+            f"WHERE diagnostic_type = %s AND created_at <= %s AND (created_at < %s OR id < %s) "
+            f"ORDER BY created_at DESC, id DESC LIMIT {PAGE_SIZE + 1}",
+            ('5min', cursor_at, cursor_at, cursor_id)
+        )
+    }
+
+
+def seed(conn, rows: int):
+    with conn.cursor() as cur:
+        cur.execute(f'SELECT COUNT(*) FROM {SCHEMA}.diagnostics')
+        missing = rows - cur.fetchone()[0]
+        if missing > 0:
+            cur.execute(
+                f"INSERT INTO {SCHEMA}.diagnostics (mechanic, car_number, mileage, diagnostic_type, created_at) "
+                f"SELECT 'Механик ' || (n %% 7), 'A' || n || 'BK124', n * 10, "
+                f"(ARRAY['5min', 'dkd'])[n %% 2 + 1], now() - n * interval '1 minute' "
+                f"FROM generate_series(1, %s) AS n",
+                (missing,)
+            )
+        cur.execute(f'ANALYZE {SCHEMA}.diagnostics')
+    conn.commit()
+
+
+def planning_ms(cur, sql: str, params) -> float:
+    cur.execute(f'EXPLAIN (ANALYZE, SUMMARY) {sql}', params or None)
+    for (line,) in cur.fetchall():
+        match = re.match(r'\s*Planning Time: ([\d.]+) ms', line)
+        if match:
+            return float(match.group(1))
+    return 0.0
+
+
+def measure(conn, run, repeat: int) -> float:
+    '''Среднее время вызова, мс; каждый вызов в своей откатываемой транзакции'''
+    timings = []
+    with conn.cursor() as cur:
+        for _ in range(repeat):
+            started = time.perf_counter()
+            run(cur)
+            cur.fetchall()
+            timings.append(time.perf_counter() - started)
+            conn.rollback()
+    return statistics.mean(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', default=os.environ.get('DATABASE_URL'),
+                        help='PostgreSQL для замера (по умолчанию DATABASE_URL)')
+    parser.add_argument('--rows', type=int, default=20000, help='сколько диагностик должно быть в таблице')
+    parser.add_argument('--repeat', type=int, default=500, help='вызовов на запрос и режим')
+    parser.add_argument('--json', help='сохранить сводку в файл')
+    args = parser.parse_args()
+    if not args.database_url:
+        parser.error('нужен --database-url или DATABASE_URL')
+
+    os.environ['DATABASE_URL'] = args.database_url
+    os.environ['MAIN_DB_SCHEMA'] = SCHEMA
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    functions.apply_migrations(args.database_url)
+    db = functions.load_function('diagnostics').db
+
+    conn = db.acquire()
+    try:
+        seed(conn, args.rows)
+        with conn.cursor() as cur:
+            cur.execute(
+                f"SELECT id, created_at FROM {SCHEMA}.diagnostics ORDER BY created_at DESC, id DESC "
+                f"OFFSET %s LIMIT 1",
+                (args.rows // 2,)
+            )
+            cursor_id, cursor_at = cur.fetchone()
+        conn.rollback()
+
+        summary = {}
+        print(f"{'query':12} {'plain_ms':>9} {'prepared_ms':>12} {'plan_plain_ms':>14} {'plan_prepared_ms':>17}")
+        for name, (sql, params) in queries(cursor_at, cursor_id, cursor_id).items():
+            plain = measure(conn, lambda cur: cur.execute(sql, params), args.repeat)
+            # Первые пять выполнений PostgreSQL планирует заново (custom plan), поэтому
+            # прогрев до замера: дальше используется закэшированный generic plan
+            measure(conn, lambda cur: db.execute_prepared(cur, sql, params), 10)
+            prepared = measure(conn, lambda cur: db.execute_prepared(cur, sql, params), args.repeat)
+            with conn.cursor() as cur:
+                plan_plain = planning_ms(cur, sql, params)
+                statement = db._prepared[conn][sql]
+                arguments = f" ({', '.join(['%s'] * len(params))})" if params else ''
+                plan_prepared = planning_ms(cur, f'EXECUTE {statement}{arguments}', params)
+            conn.rollback()
+            summary[name] = {
+                'plain_ms': round(plain, 3),
+                'prepared_ms': round(prepared, 3),
+                'plan_plain_ms': plan_plain,
+                'plan_prepared_ms': plan_prepared
+            }
+            print(f"{name:12} {plain:>9.3f} {prepared:>12.3f} {plan_plain:>14.3f} {plan_prepared:>17.3f}")
+    finally:
+        db.release(conn)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(summary, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+'''Замер рендеринга PDF-отчёта generate-report без базы и S3.
+
+    python tools/bench_report.py --reports 200 --json report_bench.json
+
+Печатает время импорта функции, время первого отчёта (холодный старт шаблона:
+загрузка reportlab, шрифтов и стилей) и p50/p95/среднее для тёплых отчётов — ту часть
+запроса, которую платит каждый вызов. Каждый отчёт собирается из своей строки,
+чтобы кэши по содержимому не искажали результат.
+'''
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import functions  # noqa: E402
+from bench import percentile  # noqa: E402
+
+MECHANICS = ('Подкорытов С.А.', 'Костенко В.Ю.', 'Иванюта Д.И.', 'Загороднюк Н.Д.')
+TYPES = ('5min', 'dhch', 'des')
+
+
+def sample_row(index: int) -> tuple:
+    return (
+        index + 1,
+        MECHANICS[index % len(MECHANICS)],
+        f'А{index % 1000:03d}ВС124',
+        50000 + index * 137,
+        TYPES[index % len(TYPES)],
+        datetime(2026, 1, 1) + timedelta(minutes=index)
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--reports', type=int, default=200, help='сколько тёплых отчётов собрать')
+    parser.add_argument('--json', help='сохранить сводку в файл')
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    module = functions.load_function('generate-report')
+    import_ms = (time.perf_counter() - started) * 1000
+    render_pdf = module.report_template.render_pdf
+
+    started = time.perf_counter()
+    first_size = len(render_pdf(sample_row(0)))
+    first_ms = (time.perf_counter() - started) * 1000
+
+    timings = []
+    sizes = []
+    for index in range(1, args.reports + 1):
+        started = time.perf_counter()
+        sizes.append(len(render_pdf(sample_row(index))))
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+
+    summary = {
+        'import_ms': round(import_ms, 1),
+        'first_report_ms': round(first_ms, 2),
+        'first_report_bytes': first_size,
+        'reports': args.reports,
+        'p50_ms': round(percentile(timings, 0.5), 2),
+        'p95_ms': round(percentile(timings, 0.95), 2),
+        'mean_ms': round(statistics.mean(timings), 2),
+        'reports_per_second': round(1000 / statistics.mean(timings), 1),
+        'mean_bytes': round(statistics.mean(sizes))
+    }
+    for key, value in summary.items():
+        print(f'{key:20} {value}')
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
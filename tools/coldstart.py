@@ -0,0 +1,111 @@
+'''Замер холодного старта облачных функций из backend/.
+
+    python tools/coldstart.py --repeat 5 --json coldstart.json
+    python tools/coldstart.py generate-report --top 15
+
+Каждая функция импортируется в отдельном свежем процессе интерпретатора
+(`python -X importtime`), как на холодном старте контейнера. Печатаются медианы:
+  import_ms   — импорт index.py со всеми локальными модулями и зависимостями;
+  options_ms  — первый вызов handler с OPTIONS (preflight приходит первым);
+  total_ms    — их сумма, то есть сколько ждёт первый запрос после старта;
+а с --top — пакеты, на импорт которых ушло больше всего времени (по -X importtime).
+'''
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import functions  # noqa: E402
+
+PROBE = '''
+import json, sys, time
+sys.path.insert(0, {tools_dir!r})
+import functions
+started = time.perf_counter()
+module = functions.load_function({name!r})
+imported = time.perf_counter()
+module.handler({{'httpMethod': 'OPTIONS', 'headers': {{}}, 'queryStringParameters': {{}}}}, None)
+finished = time.perf_counter()
+print(json.dumps({{'import_ms': (imported - started) * 1000, 'options_ms': (finished - imported) * 1000}}))
+'''
+
+# Окружение, без которого функции не импортируются; сетевых обращений при импорте нет
+PROBE_ENV = {
+    'MAIN_DB_SCHEMA': functions.MIGRATIONS_SCHEMA,
+    'DATABASE_URL': 'postgresql://coldstart@127.0.0.1:9/coldstart',
+    'LOG_LEVEL': 'ERROR'
+}
+
+
+def parse_importtime(stderr: str) -> dict:
+    '''Собственное время импорта (мс), сложенное по пакетам верхнего уровня, из вывода -X importtime'''
+    packages = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        try:
+            self_us, _, name = line[len('import time:'):].split('|')
+            self_us = int(self_us)
+        except ValueError:
+            continue
+        package = name.strip().split('.')[0]
+        packages[package] = packages.get(package, 0) + self_us / 1000
+    return packages
+
+
+def probe(name: str) -> tuple:
+    env = dict(os.environ, **PROBE_ENV)
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', PROBE.format(tools_dir=os.path.dirname(os.path.abspath(__file__)), name=name)],
+        capture_output=True, text=True, env=env, timeout=120
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else f'exit {result.returncode}')
+    timings = json.loads(result.stdout.strip().splitlines()[-1])
+    return timings, parse_importtime(result.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('names', nargs='*', help='функции (по умолчанию все из backend/)')
+    parser.add_argument('--repeat', type=int, default=3, help='сколько свежих процессов на функцию')
+    parser.add_argument('--top', type=int, default=0, help='показать N самых тяжёлых пакетов')
+    parser.add_argument('--json', help='сохранить сводку в файл')
+    args = parser.parse_args()
+
+    summary = {}
+    print(f"{'function':20} {'import_ms':>10} {'options_ms':>11} {'total_ms':>9}")
+    for name in args.names or functions.function_names():
+        runs = []
+        packages = {}
+        try:
+            for _ in range(args.repeat):
+                timings, packages = probe(name)
+                runs.append(timings)
+        except Exception as e:
+            print(f'{name:20} ошибка: {e}')
+            summary[name] = {'error': str(e)}
+            continue
+        import_ms = statistics.median(run['import_ms'] for run in runs)
+        options_ms = statistics.median(run['options_ms'] for run in runs)
+        summary[name] = {
+            'import_ms': round(import_ms, 1),
+            'options_ms': round(options_ms, 2),
+            'total_ms': round(import_ms + options_ms, 1),
+            'packages_ms': {package: round(ms, 1) for package, ms in sorted(packages.items(), key=lambda item: -item[1])[:max(args.top, 10)]}
+        }
+        print(f"{name:20} {import_ms:>10.1f} {options_ms:>11.2f} {import_ms + options_ms:>9.1f}")
+        for package, ms in sorted(packages.items(), key=lambda item: -item[1])[:args.top]:
+            print(f'    {package:28} {ms:>8.1f}')
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(summary, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == '__main__':
+    main()
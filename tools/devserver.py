@@ -0,0 +1,393 @@
+'''Локальный сервер облачных функций: все handler'ы из backend/ в одном процессе.
+
+    python tools/devserver.py --database-url postgresql://postgres@localhost/dev --stubs --port 8000
+    python tools/devserver.py --database-url postgresql://postgres@localhost/dev --stubs --test
+
+Функции из backend/func2url.json доступны по двум адресам: по имени
+(http://127.0.0.1:8000/diagnostics?id=1) и по пути боевого URL
+(http://127.0.0.1:8000/e76024e1-...), так что фронтенду достаточно заменить
+https://functions.poehali.dev на адрес сервера. Функции без записи в func2url.json
+(например, max-dispatcher) монтируются только по имени.
+
+HTTP-запрос переводится в event платформы (httpMethod, headers,
+queryStringParameters, body, isBase64Encoded), ответ handler'а — обратно в HTTP.
+Запросы обслуживает пул из --workers потоков, как несколько тёплых инстансов.
+
+--database-url применяет схему из db_migrations/ (--reset-schema пересоздаёт),
+--stubs поднимает в процессе заглушки MAX API и S3 из stub_servers.py и
+направляет на них функции; остальное окружение берётся как есть.
+--test прогоняет наборы backend/<функция>/tests.json через HTTP, затем проверку
+сессий max-webhook, которую не выразить запросом из tests.json: два параллельных
+сохранения с одной версией дают ровно один SessionConflict — в памяти и, если задана
+база, в bot_sessions. Выходит с кодом 1, если хоть одна проверка не прошла.
+'''
+import argparse
+import base64
+import json
+import os
+import sys
+import threading
+import time
+import types
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.error import HTTPError
+from urllib.parse import parse_qs, urlparse
+from urllib.request import Request, urlopen
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import functions  # noqa: E402
+import stub_servers  # noqa: E402
+
+# Учётные данные администратора, которых ждут tests.json функции auth; задаются,
+# только если в окружении своих нет
+DEV_ENV = {
+    'ADMIN_USERNAME': 'admin',
+    'ADMIN_PASSWORD': 'admin123',
+    'ADMIN_TOKEN_SECRET': 'devserver-secret'
+}
+# Имена для проверки типа в expectedBody: {"id": "number"}
+BODY_TYPES = {
+    'string': str,
+    'number': (int, float),
+    'boolean': bool,
+    'object': dict,
+    'array': list
+}
+
+
+class PooledHTTPServer(HTTPServer):
+    '''HTTP-сервер с ограниченным пулом потоков вместо потока на соединение'''
+
+    def __init__(self, address, handler_class, routes: dict, workers: int, quiet: bool = False):
+        super().__init__(address, handler_class)
+        self.routes = routes
+        self.quiet = quiet
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='devserver')
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def process_request(self, request, client_address):
+        self.executor.submit(self._process, request, client_address)
+
+    def _process(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self.executor.shutdown(wait=False)
+
+    def start(self) -> 'PooledHTTPServer':
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+class FunctionHandler(BaseHTTPRequestHandler):
+    '''Переводит HTTP-запрос в event платформы и ответ handler'а обратно'''
+
+    # HTTP/1.0: соединение закрывается после ответа и не держит поток пула между запросами
+    protocol_version = 'HTTP/1.0'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _dispatch(self):
+        started = time.perf_counter()
+        url = urlparse(self.path)
+        prefix, _, rest = url.path.lstrip('/').partition('/')
+        route = self.server.routes.get(prefix)
+        if route is None:
+            self._send(404, {'Content-Type': 'application/json'}, json.dumps({'error': f'Нет функции {prefix!r}'}, ensure_ascii=False).encode())
+            return
+        name, module = route
+
+        length = int(self.headers.get('Content-Length') or 0)
+        raw = self.rfile.read(length) if length else b''
+        try:
+            body, is_base64 = raw.decode('utf-8'), False
+        except UnicodeDecodeError:
+            body, is_base64 = base64.b64encode(raw).decode(), True
+        query = parse_qs(url.query, keep_blank_values=True)
+        request_id = str(uuid.uuid4())
+        event = {
+            'httpMethod': self.command,
+            'path': '/' + rest,
+            'headers': dict(self.headers.items()),
+            'queryStringParameters': {key: values[-1] for key, values in query.items()},
+            'multiValueQueryStringParameters': query,
+            'body': body,
+            'isBase64Encoded': is_base64,
+            'requestContext': {
+                'requestId': request_id,
+                'identity': {'sourceIp': self.client_address[0]},
+                'httpMethod': self.command
+            }
+        }
+        context = types.SimpleNamespace(request_id=request_id, function_name=name)
+
+        try:
+            result = module.handler(event, context)
+            status = result.get('statusCode', 200)
+            headers = dict(result.get('headers') or {})
+            payload = result.get('body') or ''
+            if result.get('isBase64Encoded'):
+                payload = base64.b64decode(payload)
+            elif not isinstance(payload, (bytes, str)):
+                payload = json.dumps(payload, ensure_ascii=False, default=str)
+            if isinstance(payload, str):
+                payload = payload.encode('utf-8')
+        except Exception as e:
+            # Платформа отвечает 502, если функция упала, а не вернула ответ
+            status, headers = 502, {'Content-Type': 'application/json'}
+            payload = json.dumps({'error': f'{type(e).__name__}: {e}'}, ensure_ascii=False).encode()
+        self._send(status, headers, payload)
+        if not self.server.quiet:
+            print(f'{self.command} {self.path} {status} {(time.perf_counter() - started) * 1000:.1f}ms', file=sys.stderr)
+
+    def _send(self, status: int, headers: dict, payload: bytes):
+        self.send_response(status)
+        for key, value in headers.items():
+            if key.lower() not in ('content-length', 'connection'):
+                self.send_header(key, str(value))
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(payload)
+
+    do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = do_OPTIONS = do_HEAD = _dispatch
+
+
+def mount(names: list) -> tuple:
+    '''{префикс пути: (функция, модуль)} и {функция: ошибка импорта}'''
+    func2url = {}
+    path = os.path.join(functions.BACKEND_DIR, 'func2url.json')
+    if os.path.exists(path):
+        with open(path) as f:
+            func2url = json.load(f)
+    routes, failed = {}, {}
+    for name in names:
+        try:
+            module = functions.load_function(name)
+        except Exception as e:
+            failed[name] = f'{type(e).__name__}: {e}'
+            continue
+        routes[name] = (name, module)
+        if name in func2url:
+            routes[urlparse(func2url[name]).path.strip('/')] = (name, module)
+    return routes, failed
+
+
+def body_matches(expected, actual, matcher: str) -> bool:
+    '''Сравнение тела ответа с expectedBody из tests.json'''
+    if expected is None:
+        return True
+    if matcher == 'type':
+        return isinstance(actual, type(expected))
+    if matcher == 'exact':
+        return expected == actual
+    if isinstance(expected, dict):
+        return isinstance(actual, dict) and all(
+            key in actual and body_matches(value, actual[key], matcher) for key, value in expected.items()
+        )
+    if isinstance(expected, list):
+        return isinstance(actual, list) and len(actual) >= len(expected) and all(
+            body_matches(value, actual[index], matcher) for index, value in enumerate(expected)
+        )
+    if isinstance(expected, str) and expected in BODY_TYPES:
+        if isinstance(actual, bool) and expected != 'boolean':
+            return False
+        return isinstance(actual, BODY_TYPES[expected])
+    return expected == actual
+
+
+def run_test(base_url: str, name: str, test: dict) -> str:
+    '''Одна проверка из tests.json; пустая строка, если прошла, иначе причина'''
+    body = test.get('body')
+    data = None
+    headers = dict(test.get('headers') or {})
+    if body is not None:
+        data = (body if isinstance(body, str) else json.dumps(body, ensure_ascii=False)).encode('utf-8')
+        headers.setdefault('Content-Type', 'application/json')
+    request = Request(f'{base_url}/{name}{test.get("path", "/")}', data=data, headers=headers, method=test.get('method', 'GET'))
+    try:
+        with urlopen(request, timeout=60) as reply:
+            status, raw = reply.status, reply.read()
+    except HTTPError as e:
+        status, raw = e.code, e.read()
+    if status != test.get('expectedStatus', 200):
+        return f'статус {status}, ожидался {test.get("expectedStatus", 200)}: {raw[:200].decode("utf-8", "replace")}'
+    expected = test.get('expectedBody')
+    if expected is None:
+        return ''
+    try:
+        actual = json.loads(raw)
+    except ValueError:
+        return f'тело не JSON: {raw[:200].decode("utf-8", "replace")}'
+    if not body_matches(expected, actual, test.get('bodyMatcher', 'partial')):
+        return f'тело {json.dumps(actual, ensure_ascii=False)[:200]} не совпадает с {json.dumps(expected, ensure_ascii=False)}'
+    return ''
+
+
+def run_suites(base_url: str, names: list, failed_imports: dict) -> int:
+    '''Прогон tests.json всех функций; возвращает число непрошедших проверок'''
+    failures = 0
+    for name in names:
+        path = os.path.join(functions.BACKEND_DIR, name, 'tests.json')
+        if not os.path.exists(path):
+            continue
+        with open(path, encoding='utf-8') as f:
+            tests = json.load(f).get('tests', [])
+        print(f'{name} ({len(tests)})')
+        for test in tests:
+            if name in failed_imports:
+                error = f'функция не импортируется: {failed_imports[name]}'
+            else:
+                try:
+                    error = run_test(base_url, name, test)
+                except Exception as e:
+                    error = f'{type(e).__name__}: {e}'
+            failures += bool(error)
+            print(f'  {"FAIL" if error else "ok  "} {test.get("name")}' + (f' — {error}' if error else ''))
+    return failures
+
+
+def check_session_conflict(sessions, backend, transactional: bool = False) -> str:
+    '''Два инстанса с одной версией сессии сохраняют её одновременно; пустая строка,
+    если ровно одно сохранение прошло, а второе получило SessionConflict'''
+    # Отрицательный user_id не пересекается с пользователями MAX
+    user_id = -(uuid.uuid4().int % 10 ** 9) - 1
+    first, second = sessions.SessionStore(backend, ttl=60), sessions.SessionStore(backend, ttl=60)
+    first.save(user_id, {'step': 1})
+    second.get(user_id)
+    barrier = threading.Barrier(2)
+    outcomes = []
+
+    def save(store, step):
+        barrier.wait()
+        try:
+            if transactional:
+                # Как в webhook: запись в транзакции, строка сессии заблокирована до коммита
+                with sessions.db.connection() as conn:
+                    store.save(user_id, {'step': step}, conn=conn)
+                    time.sleep(0.05)
+                    conn.commit()
+            else:
+                store.save(user_id, {'step': step})
+            outcomes.append('saved')
+        except sessions.SessionConflict:
+            outcomes.append('conflict')
+        except Exception as e:
+            outcomes.append(f'{type(e).__name__}: {e}')
+
+    threads = [threading.Thread(target=save, args=(store, step)) for step, store in ((2, first), (3, second))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if sorted(outcomes) != ['conflict', 'saved']:
+        return f'ожидались одно сохранение и один SessionConflict, получено: {outcomes}'
+    data, version = backend.load(user_id)
+    if version != 2:
+        return f'версия после гонки {version}, ожидалась 2'
+    return ''
+
+
+def run_session_checks(routes: dict) -> int:
+    '''Проверка SessionConflict на хранилищах сессий max-webhook; число непрошедших'''
+    if 'max-webhook' not in routes:
+        return 0
+    sessions = routes['max-webhook'][1].sessions
+    checks = [('Concurrent save conflicts once, memory backend', sessions.MemorySessionBackend(), False)]
+    if os.environ.get('DATABASE_URL'):
+        checks += [
+            ('Concurrent save conflicts once, postgres backend', sessions.PostgresSessionBackend(), False),
+            ('Concurrent save conflicts once, postgres backend in transaction', sessions.PostgresSessionBackend(), True)
+        ]
+    print(f'max-webhook sessions ({len(checks)})')
+    failures = 0
+    for name, backend, transactional in checks:
+        try:
+            error = check_session_conflict(sessions, backend, transactional)
+        except Exception as e:
+            error = f'{type(e).__name__}: {e}'
+        failures += bool(error)
+        print(f'  {"FAIL" if error else "ok  "} {name}' + (f' — {error}' if error else ''))
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('names', nargs='*', help='функции (по умолчанию все из backend/)')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000, help='0 — любой свободный порт')
+    parser.add_argument('--workers', type=int, default=8, help='потоков в пуле обработки запросов')
+    parser.add_argument('--database-url', default=os.environ.get('DATABASE_URL'),
+                        help='PostgreSQL для функций (по умолчанию DATABASE_URL)')
+    parser.add_argument('--reset-schema', action='store_true', help='пересоздать схему при старте')
+    parser.add_argument('--stubs', action='store_true', help='поднять заглушки MAX API и S3 в процессе')
+    parser.add_argument('--max-latency', type=float, default=0, help='задержка заглушки MAX API, секунды')
+    parser.add_argument('--s3-latency', type=float, default=0, help='задержка заглушки S3, секунды')
+    parser.add_argument('--log-level', default=os.environ.get('LOG_LEVEL', 'WARNING'), help='LOG_LEVEL для функций')
+    parser.add_argument('--test', action='store_true', help='прогнать tests.json и выйти')
+    parser.add_argument('--quiet', action='store_true', help='не печатать строку на каждый запрос')
+    args = parser.parse_args()
+
+    if args.database_url:
+        functions.apply_migrations(args.database_url, reset=args.reset_schema)
+        os.environ['DATABASE_URL'] = args.database_url
+    os.environ.setdefault('MAIN_DB_SCHEMA', functions.MIGRATIONS_SCHEMA)
+    os.environ['LOG_LEVEL'] = args.log_level
+    os.environ.setdefault('DB_POOL_MAX_SIZE', str(args.workers))
+    for key, value in DEV_ENV.items():
+        os.environ.setdefault(key, value)
+    if args.stubs:
+        max_stub = stub_servers.start_max_stub(latency=args.max_latency)
+        s3_stub = stub_servers.start_s3_stub(latency=args.s3_latency)
+        os.environ.update({
+            'MAX_API_URL': max_stub.url,
+            'MAX_BOT_TOKEN': 'devserver-token',
+            'S3_ENDPOINT_URL': s3_stub.url,
+            'AWS_ACCESS_KEY_ID': 'devserver',
+            'AWS_SECRET_ACCESS_KEY': 'devserver'
+        })
+        print(f'MAX stub: {max_stub.url}, S3 stub: {s3_stub.url}', file=sys.stderr)
+
+    names = args.names or functions.function_names()
+    routes, failed = mount(names)
+    for name, error in failed.items():
+        print(f'{name}: не импортируется — {error}', file=sys.stderr)
+
+    server = PooledHTTPServer((args.host, 0 if args.test else args.port), FunctionHandler, routes,
+                              args.workers, quiet=args.quiet or args.test)
+    if args.test:
+        server.start()
+        try:
+            failures = run_suites(server.url, names, failed) + run_session_checks(routes)
+        finally:
+            server.shutdown()
+            server.server_close()
+        print(f'\nне прошло: {failures}' if failures else '\nвсе проверки прошли')
+        sys.exit(1 if failures else 0)
+
+    for prefix, (name, _) in sorted(routes.items(), key=lambda item: (item[1][0], len(item[0]))):
+        print(f'{server.url}/{prefix}' + ('' if prefix == name else f'  ({name})'), file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
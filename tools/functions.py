@@ -0,0 +1,78 @@
+'''Загрузка облачных функций из backend/ в один процесс для локального запуска и замеров.
+
+Каждая функция держит свои копии общих модулей (db.py, logger.py, ...), поэтому
+модули одной функции не должны попадать в sys.modules другой: load_function
+импортирует index.py с каталогом функции в sys.path и затем убирает её локальные
+модули из sys.modules — handler продолжает ссылаться на свои копии.
+'''
+import glob
+import importlib.util
+import json
+import os
+import sys
+import threading
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BACKEND_DIR = os.path.join(ROOT, 'backend')
+MIGRATIONS_DIR = os.path.join(ROOT, 'db_migrations')
+# Схема, в которой создают таблицы миграции из db_migrations/
+MIGRATIONS_SCHEMA = 't_p70271656_max_bot_diagnosis'
+
+_import_lock = threading.Lock()
+
+
+def function_names() -> list:
+    '''Имена функций из backend/func2url.json и каталогов с index.py'''
+    names = set()
+    func2url = os.path.join(BACKEND_DIR, 'func2url.json')
+    if os.path.exists(func2url):
+        with open(func2url) as f:
+            names.update(json.load(f))
+    for path in glob.glob(os.path.join(BACKEND_DIR, '*', 'index.py')):
+        names.add(os.path.basename(os.path.dirname(path)))
+    return sorted(names)
+
+
+def load_function(name: str):
+    '''Импортирует backend/<name>/index.py изолированно и возвращает модуль'''
+    function_dir = os.path.join(BACKEND_DIR, name)
+    index_path = os.path.join(function_dir, 'index.py')
+    if not os.path.exists(index_path):
+        raise FileNotFoundError(index_path)
+
+    with _import_lock:
+        before = set(sys.modules)
+        sys.path.insert(0, function_dir)
+        try:
+            spec = importlib.util.spec_from_file_location(f'backend_{name.replace("-", "_")}', index_path)
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+        finally:
+            sys.path.remove(function_dir)
+            for module_name in set(sys.modules) - before:
+                module_file = getattr(sys.modules[module_name], '__file__', None) or ''
+                if os.path.dirname(os.path.abspath(module_file)) == function_dir:
+                    del sys.modules[module_name]
+    return module
+
+
+def apply_migrations(dsn: str, reset: bool = False):
+    '''Создаёт схему и применяет db_migrations/*.sql; reset=True пересоздаёт схему'''
+    import psycopg2
+
+    conn = psycopg2.connect(dsn)
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            if reset:
+                cur.execute(f'DROP SCHEMA IF EXISTS {MIGRATIONS_SCHEMA} CASCADE')
+            cur.execute('SELECT 1 FROM information_schema.schemata WHERE schema_name = %s', (MIGRATIONS_SCHEMA,))
+            if cur.fetchone():
+                return False
+            cur.execute(f'CREATE SCHEMA {MIGRATIONS_SCHEMA}')
+            for path in sorted(glob.glob(os.path.join(MIGRATIONS_DIR, '*.sql'))):
+                with open(path, encoding='utf-8') as f:
+                    cur.execute(f.read())
+        return True
+    finally:
+        conn.close()
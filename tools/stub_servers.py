@@ -0,0 +1,343 @@
+'''Локальные заглушки внешних сервисов для разработки и нагрузочных прогонов.
+
+MAX API:  python tools/stub_servers.py max --port 8081 --latency 0.2 --fail-rate 0.1
+S3:       python tools/stub_servers.py s3 --port 8082
+
+Функции направляются на заглушки переменными окружения
+MAX_API_URL=http://127.0.0.1:8081 и S3_ENDPOINT_URL=http://127.0.0.1:8082.
+Принятые сообщения MAX доступны по GET /stub/messages, сброс — DELETE /stub/messages.
+S3-заглушка хранит объекты в памяти и поддерживает put/get/head/delete, листинг
+и multipart upload — этого достаточно для boto3 с path-style адресацией.
+'''
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+from xml.etree import ElementTree
+from xml.sax.saxutils import escape
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, handler_class, latency: float = 0, fail_rate: float = 0):
+        super().__init__(address, handler_class)
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.lock = threading.Lock()
+        self.messages = []
+        self.subscriptions = []
+        self.objects = {}
+        self.uploads = {}
+        self.requests_total = 0
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self) -> 'StubServer':
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+class MaxApiHandler(BaseHTTPRequestHandler):
+    '''Имитация platform-api.max.ru: /messages и /subscriptions'''
+
+    protocol_version = 'HTTP/1.1'
+    # Заголовки и тело уходят разными send: без TCP_NODELAY keep-alive клиент ждёт delayed ACK
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        raw = self.rfile.read(length) if length else b''
+        return json.loads(raw) if raw else {}
+
+    def _reply(self, status: int, body):
+        data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _simulate(self) -> bool:
+        server = self.server
+        with server.lock:
+            server.requests_total += 1
+        if server.latency:
+            time.sleep(server.latency)
+        if server.fail_rate and random.random() < server.fail_rate:
+            self._reply(503, {'code': 'service.unavailable', 'message': 'stub failure'})
+            return False
+        return True
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == '/stub/messages':
+            with self.server.lock:
+                self._reply(200, {'messages': list(self.server.messages)})
+            return
+        if not self._simulate():
+            return
+        if url.path == '/subscriptions':
+            with self.server.lock:
+                self._reply(200, {'subscriptions': list(self.server.subscriptions)})
+            return
+        self._reply(404, {'code': 'not.found'})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        body = self._read_json()
+        if not self._simulate():
+            return
+        if url.path == '/messages':
+            user_id = parse_qs(url.query).get('user_id', [None])[0]
+            with self.server.lock:
+                self.server.messages.append({'user_id': user_id, 'body': body, 'time': time.time()})
+                message_id = len(self.server.messages)
+            self._reply(200, {'message': {'body': {'mid': f'stub.{message_id}', 'text': body.get('text')}}})
+            return
+        if url.path == '/subscriptions':
+            with self.server.lock:
+                self.server.subscriptions.append({**body, 'time': int(time.time() * 1000)})
+            self._reply(200, {'success': True})
+            return
+        self._reply(404, {'code': 'not.found'})
+
+    def do_DELETE(self):
+        url = urlparse(self.path)
+        if url.path == '/stub/messages':
+            with self.server.lock:
+                self.server.messages.clear()
+            self._reply(200, {'success': True})
+            return
+        if not self._simulate():
+            return
+        if url.path == '/subscriptions':
+            target = parse_qs(url.query).get('url', [None])[0]
+            with self.server.lock:
+                self.server.subscriptions = [s for s in self.server.subscriptions if s.get('url') != target]
+            self._reply(200, {'success': True})
+            return
+        self._reply(404, {'code': 'not.found'})
+
+
+S3_NS = 'http://s3.amazonaws.com/doc/2006-03-01/'
+
+
+def _decode_aws_chunked(raw: bytes) -> bytes:
+    '''Снимает aws-chunked кодирование (размер;подпись CRLF данные CRLF ... 0 CRLF трейлеры)'''
+    out = bytearray()
+    pos = 0
+    while pos < len(raw):
+        line_end = raw.index(b'\r\n', pos)
+        size = int(raw[pos:line_end].split(b';', 1)[0], 16)
+        if size == 0:
+            break
+        start = line_end + 2
+        out += raw[start:start + size]
+        pos = start + size + 2
+    return bytes(out)
+
+
+class S3Handler(BaseHTTPRequestHandler):
+    '''Имитация S3 (bucket.poehali.dev) в памяти, path-style: /<bucket>/<key>'''
+
+    protocol_version = 'HTTP/1.1'
+    # Заголовки и тело уходят разными send: без TCP_NODELAY keep-alive клиент ждёт delayed ACK
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _parse(self):
+        url = urlparse(self.path)
+        bucket, _, key = url.path.lstrip('/').partition('/')
+        return bucket, unquote(key), parse_qs(url.query, keep_blank_values=True)
+
+    def _read_body(self) -> bytes:
+        if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            raw = bytearray()
+            while True:
+                size = int(self.rfile.readline().split(b';', 1)[0], 16)
+                if size == 0:
+                    while self.rfile.readline() not in (b'\r\n', b'\n', b''):
+                        pass
+                    break
+                raw += self.rfile.read(size)
+                self.rfile.readline()
+            raw = bytes(raw)
+        else:
+            length = int(self.headers.get('Content-Length') or 0)
+            raw = self.rfile.read(length) if length else b''
+        if 'aws-chunked' in self.headers.get('Content-Encoding', '') or \
+                self.headers.get('x-amz-content-sha256', '').startswith('STREAMING-'):
+            raw = _decode_aws_chunked(raw)
+        return raw
+
+    def _reply(self, status: int, body: bytes = b'', headers: dict = None, head: bool = False):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if body and not head:
+            self.wfile.write(body)
+
+    def _xml(self, status: int, root: str, inner: str):
+        body = f'<?xml version="1.0" encoding="UTF-8"?><{root} xmlns="{S3_NS}">{inner}</{root}>'.encode()
+        self._reply(status, body, {'Content-Type': 'application/xml'})
+
+    def _not_found(self, head: bool = False):
+        if head:
+            self._reply(404, head=True)
+        else:
+            self._xml(404, 'Error', '<Code>NoSuchKey</Code><Message>The specified key does not exist.</Message>')
+
+    def _simulate(self):
+        with self.server.lock:
+            self.server.requests_total += 1
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+    def do_PUT(self):
+        bucket, key, query = self._parse()
+        body = self._read_body()
+        self._simulate()
+        etag = f'"{hashlib.md5(body).hexdigest()}"'
+        with self.server.lock:
+            if 'uploadId' in query:
+                upload = self.server.uploads.get(query['uploadId'][0])
+                if upload is None:
+                    self._xml(404, 'Error', '<Code>NoSuchUpload</Code>')
+                    return
+                upload['parts'][int(query['partNumber'][0])] = body
+            else:
+                self.server.objects[(bucket, key)] = {
+                    'body': body,
+                    'etag': etag,
+                    'content_type': self.headers.get('Content-Type', 'binary/octet-stream'),
+                    'modified': time.time()
+                }
+        self._reply(200, headers={'ETag': etag})
+
+    def _do_get(self, head: bool):
+        bucket, key, query = self._parse()
+        self._simulate()
+        if not key:
+            prefix = query.get('prefix', [''])[0]
+            with self.server.lock:
+                keys = sorted(k for (b, k) in self.server.objects if b == bucket and k.startswith(prefix))
+                contents = ''.join(
+                    f'<Contents><Key>{escape(k)}</Key><Size>{len(self.server.objects[(bucket, k)]["body"])}</Size>'
+                    f'<ETag>{escape(self.server.objects[(bucket, k)]["etag"])}</ETag></Contents>'
+                    for k in keys
+                )
+            self._xml(200, 'ListBucketResult',
+                      f'<Name>{escape(bucket)}</Name><Prefix>{escape(prefix)}</Prefix>'
+                      f'<KeyCount>{len(keys)}</KeyCount><IsTruncated>false</IsTruncated>{contents}')
+            return
+        with self.server.lock:
+            obj = self.server.objects.get((bucket, key))
+        if obj is None:
+            self._not_found(head)
+            return
+        self._reply(200, obj['body'], {'ETag': obj['etag'], 'Content-Type': obj['content_type']}, head=head)
+
+    def do_GET(self):
+        self._do_get(head=False)
+
+    def do_HEAD(self):
+        self._do_get(head=True)
+
+    def do_DELETE(self):
+        bucket, key, query = self._parse()
+        self._simulate()
+        with self.server.lock:
+            if 'uploadId' in query:
+                self.server.uploads.pop(query['uploadId'][0], None)
+            else:
+                self.server.objects.pop((bucket, key), None)
+        self._reply(204)
+
+    def do_POST(self):
+        bucket, key, query = self._parse()
+        body = self._read_body()
+        self._simulate()
+        if 'uploads' in query:
+            upload_id = hashlib.md5(f'{bucket}/{key}/{time.time()}'.encode()).hexdigest()
+            with self.server.lock:
+                self.server.uploads[upload_id] = {
+                    'bucket': bucket,
+                    'key': key,
+                    'parts': {},
+                    'content_type': self.headers.get('Content-Type', 'binary/octet-stream')
+                }
+            self._xml(200, 'InitiateMultipartUploadResult',
+                      f'<Bucket>{escape(bucket)}</Bucket><Key>{escape(key)}</Key><UploadId>{upload_id}</UploadId>')
+            return
+        if 'uploadId' in query:
+            with self.server.lock:
+                upload = self.server.uploads.pop(query['uploadId'][0], None)
+                if upload is None:
+                    self._xml(404, 'Error', '<Code>NoSuchUpload</Code>')
+                    return
+                data = b''.join(upload['parts'][n] for n in sorted(upload['parts']))
+                etag = f'"{hashlib.md5(data).hexdigest()}-{len(upload["parts"])}"'
+                self.server.objects[(bucket, key)] = {
+                    'body': data,
+                    'etag': etag,
+                    'content_type': upload['content_type'],
+                    'modified': time.time()
+                }
+            self._xml(200, 'CompleteMultipartUploadResult',
+                      f'<Bucket>{escape(bucket)}</Bucket><Key>{escape(key)}</Key><ETag>{escape(etag)}</ETag>')
+            return
+        if 'delete' in query:
+            root = ElementTree.fromstring(body)
+            keys = [el.text for el in root.iter() if el.tag.endswith('Key')]
+            with self.server.lock:
+                for k in keys:
+                    self.server.objects.pop((bucket, k), None)
+            self._xml(200, 'DeleteResult', ''.join(f'<Deleted><Key>{escape(k)}</Key></Deleted>' for k in keys))
+            return
+        self._xml(400, 'Error', '<Code>NotImplemented</Code>')
+
+
+def start_max_stub(port: int = 0, latency: float = 0, fail_rate: float = 0) -> StubServer:
+    return StubServer(('127.0.0.1', port), MaxApiHandler, latency, fail_rate).start()
+
+
+def start_s3_stub(port: int = 0, latency: float = 0) -> StubServer:
+    return StubServer(('127.0.0.1', port), S3Handler, latency).start()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('service', choices=['max', 's3'])
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--latency', type=float, default=0, help='задержка ответа, секунды')
+    parser.add_argument('--fail-rate', type=float, default=0, help='доля ответов 503')
+    args = parser.parse_args()
+
+    if args.service == 's3':
+        server = start_s3_stub(args.port, args.latency)
+    else:
+        server = start_max_stub(args.port, args.latency, args.fail_rate)
+    print(f'{args.service} stub listening on {server.url}')
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()